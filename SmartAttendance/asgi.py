@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SmartAttendance.settings')
 
 application = get_asgi_application()
+
+# Replay journals left by a crashed worker and start the write-behind flusher.
+from attendance import writebehind  # noqa: E402
+
+writebehind.start_if_enabled()
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'attendance.perf.PerfMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,7 +62,8 @@ ROOT_URLCONF = 'SmartAttendance.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render time reported to attendance.perf
+        'BACKEND': 'attendance.perf.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -125,12 +127,25 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# `manage.py build_assets` writes the compiled CSS and vendored JS to static/build/.
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 # WhiteNoise for serving static files
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+MIDDLEWARE.insert(2, 'whitenoise.middleware.WhiteNoiseMiddleware')
+
+# Hashed, gzip/brotli-compressed static files (see attendance/storage.py).
+# Django 5.1 dropped the old STATICFILES_STORAGE setting, so it goes here.
+# static/build/ is compiled at deploy time by build.sh.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'attendance.storage.StaticStorage'},
+}
 
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Page-weight budget for the scan page, checked by `manage.py check_page_weight`
+# (attendance/page_weight.py): compressed bytes on the wire, and the estimated
+# time until the scanner script has run on a slow campus network.
+ATTENDANCE_SCAN_PAGE_BUDGET_KB = int(os.getenv('ATTENDANCE_SCAN_PAGE_BUDGET_KB', '200'))
+ATTENDANCE_SCAN_PAGE_BUDGET_MS = int(os.getenv('ATTENDANCE_SCAN_PAGE_BUDGET_MS', '3000'))
 
 
 # Default primary key field type
@@ -140,11 +155,164 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = "app-dashboard"
 
+# 'default' is private to each worker process. Features that must agree
+# across workers use the 'shared' alias, a Redis cache (needs the `redis`
+# package) defined when REDIS_URL is set, and are disabled with 'off' until
+# it is.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'off': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+if os.getenv('REDIS_URL'):
+    CACHES['shared'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}
+SHARED_CACHE_ALIAS = 'shared' if 'shared' in CACHES else 'off'
+
+# With a shared cache, sessions are read from it and only fall back to the
+# database on a miss, and request users come from a short-lived cache as well
+# (see attendance/auth.py). A per-process cache would keep a logged-out
+# session or a deactivated user valid on every other worker, so without one
+# sessions stay in the database and the user cache is 'off'. `manage.py
+# check` refuses a per-process alias for either when WEB_CONCURRENCY is
+# above 1. 'django.contrib.sessions.backends.signed_cookies' keeps sessions
+# in the cookie instead. ModelBackend stays listed so sessions created before
+# the switch remain valid.
+SESSION_CACHE_ALIAS = os.getenv('SESSION_CACHE_ALIAS', SHARED_CACHE_ALIAS)
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.' + (
+    'db' if SESSION_CACHE_ALIAS == 'off' else 'cached_db'))
+AUTHENTICATION_BACKENDS = [
+    'attendance.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+ATTENDANCE_USER_CACHE_ALIAS = os.getenv('ATTENDANCE_USER_CACHE_ALIAS', SHARED_CACHE_ALIAS)
+ATTENDANCE_USER_CACHE_SECONDS = int(os.getenv('ATTENDANCE_USER_CACHE_SECONDS', '60'))
+
+# Cache of active QR tokens. The local-memory backend is per worker; set
+# this to 'attendance.token_cache.DjangoCacheBackend' to share entries across
+# workers through the CACHES alias named by ATTENDANCE_TOKEN_CACHE_ALIAS.
+ATTENDANCE_TOKEN_CACHE_BACKEND = os.getenv(
+    'ATTENDANCE_TOKEN_CACHE_BACKEND', 'attendance.token_cache.LocalMemoryBackend'
+)
+ATTENDANCE_TOKEN_CACHE_ALIAS = os.getenv('ATTENDANCE_TOKEN_CACHE_ALIAS', 'default')
+
+# Route the scan, QR and dashboard endpoints to their async views. Enabled by
+# the ASGI server profile in gunicorn.conf.py.
+ATTENDANCE_ASYNC_VIEWS = os.getenv('ATTENDANCE_ASYNC_VIEWS', 'False') == 'True'
+
+# Write-behind mode for scans: marks are journaled locally and written to the
+# database in batches by a background thread (see attendance/writebehind.py).
+ATTENDANCE_WRITE_BEHIND = os.getenv('ATTENDANCE_WRITE_BEHIND', 'False') == 'True'
+ATTENDANCE_WRITE_BEHIND_DIR = os.getenv('ATTENDANCE_WRITE_BEHIND_DIR', os.path.join(BASE_DIR, 'journal'))
+ATTENDANCE_WRITE_BEHIND_BATCH = int(os.getenv('ATTENDANCE_WRITE_BEHIND_BATCH', '200'))
+ATTENDANCE_WRITE_BEHIND_INTERVAL_MS = int(os.getenv('ATTENDANCE_WRITE_BEHIND_INTERVAL_MS', '50'))
+
+# Batch endpoint for scans the scan page queued offline (marking.mark_batch).
+# A queued scan of a static code is checked against session expiry at the time
+# the phone says it was made, trusted up to this many seconds back. Rotating
+# codes are always checked at server time.
+ATTENDANCE_OFFLINE_SCAN_TOLERANCE_SECONDS = int(os.getenv('ATTENDANCE_OFFLINE_SCAN_TOLERANCE_SECONDS', '300'))
+ATTENDANCE_MARK_BATCH_MAX = int(os.getenv('ATTENDANCE_MARK_BATCH_MAX', '50'))
+
+# QR mode for create_qr: 'static' shows one code valid for 5 minutes;
+# 'rotating' keeps one session open for the lecture and shows an HMAC-derived
+# code that changes every ATTENDANCE_ROTATION_SECONDS (see attendance/rotating.py).
+ATTENDANCE_QR_MODE = os.getenv('ATTENDANCE_QR_MODE', 'static')
+ATTENDANCE_ROTATING_SESSION_MINUTES = int(os.getenv('ATTENDANCE_ROTATING_SESSION_MINUTES', '90'))
+ATTENDANCE_ROTATION_SECONDS = int(os.getenv('ATTENDANCE_ROTATION_SECONDS', '10'))
+ATTENDANCE_ROTATION_SKEW_WINDOWS = int(os.getenv('ATTENDANCE_ROTATION_SKEW_WINDOWS', '1'))
+
+# Attendance percentage under which students are flagged on teacher reports.
+ATTENDANCE_LOW_THRESHOLD = float(os.getenv('ATTENDANCE_LOW_THRESHOLD', '75'))
+
+# Sessions older than this many days have their attendance moved to the
+# archive table by `manage.py sweep_sessions` (0 keeps everything live).
+ATTENDANCE_ARCHIVE_AFTER_DAYS = int(os.getenv('ATTENDANCE_ARCHIVE_AFTER_DAYS', '180'))
+
+# Request instrumentation (attendance.perf): queries slower than
+# ATTENDANCE_SLOW_QUERY_MS logged to 'attendance.perf.slow_queries', and
+# /metrics/ for staff or for scrapers sending
+# "Authorization: Bearer <ATTENDANCE_METRICS_TOKEN>". Server-Timing headers
+# show every client how long the database took, so they are opt-in.
+ATTENDANCE_SERVER_TIMING = os.getenv('ATTENDANCE_SERVER_TIMING', 'False') == 'True'
+ATTENDANCE_SLOW_QUERY_MS = float(os.getenv('ATTENDANCE_SLOW_QUERY_MS', '200'))
+ATTENDANCE_METRICS_TOKEN = os.getenv('ATTENDANCE_METRICS_TOKEN', '')
+
+# Per-user cache of the dashboard and teacher report pages (attendance.page_cache).
+# Entries are expired by write hooks, so the timeout only bounds how long an
+# unused entry lingers. The hooks only reach the cache they are made in, so
+# the page cache is off ('off' never stores anything) without a cache shared
+# by every worker. `manage.py check` refuses a per-process one when
+# WEB_CONCURRENCY is above 1.
+ATTENDANCE_PAGE_CACHE_ALIAS = os.getenv('ATTENDANCE_PAGE_CACHE_ALIAS', SHARED_CACHE_ALIAS)
+ATTENDANCE_PAGE_CACHE_SECONDS = int(os.getenv('ATTENDANCE_PAGE_CACHE_SECONDS', '300'))
+
+# Fan-out for the live attendance feed on the QR page. The in-process broker
+# serves a single worker; 'attendance.live.PostgresBroker' relays events
+# between workers with LISTEN/NOTIFY.
+ATTENDANCE_LIVE_BROKER = os.getenv('ATTENDANCE_LIVE_BROKER', 'attendance.live.InProcessBroker')
+
 
 import dj_database_url
 from dotenv import load_dotenv
 load_dotenv()
 
-DATABASES['default'] = dj_database_url.config(default=os.getenv('DATABASE_URL'))
+# Database connections. Sync workers keep a connection open for
+# DB_CONN_MAX_AGE seconds instead of opening one per request, and check it is
+# still alive before reuse. Django advises against persistent connections
+# under ASGI, so the default there is 0; use a pool instead.
+#
+# DB_POOL chooses how PostgreSQL connections are pooled:
+#   'none'      - persistent connections only.
+#   'psycopg'   - Django's built-in pool (needs `psycopg[binary,pool]`), holding
+#                 DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections per worker
+#                 process. Budget WEB_CONCURRENCY * DB_POOL_MAX_SIZE against
+#                 the server's max_connections.
+#   'pgbouncer' - DATABASE_URL points at PgBouncer in transaction mode, which
+#                 cannot keep server-side cursors open across statements.
+# The live feed's PostgresBroker needs psycopg2 and a direct server
+# connection, so it combines with neither pool.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if ATTENDANCE_ASYNC_VIEWS else '60'))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_POOL = os.getenv('DB_POOL', 'none')
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+
+# SQLite (local development): WAL lets scans read while a mark is written,
+# synchronous=NORMAL is safe with WAL, and writers wait up to
+# SQLITE_BUSY_TIMEOUT_MS for the lock instead of failing with "database is
+# locked". IMMEDIATE transactions take the write lock up front, so two
+# writers can't deadlock upgrading from a read lock.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+DATABASES['default'] = dj_database_url.config(
+    default=os.getenv('DATABASE_URL'),
+    conn_max_age=DB_CONN_MAX_AGE,
+    conn_health_checks=DB_CONN_HEALTH_CHECKS,
+)
 
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
+
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    if DB_POOL == 'psycopg':
+        # The pool owns connection lifetimes; Django requires CONN_MAX_AGE=0 with it.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+        }
+    elif DB_POOL == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+if DATABASES['default'].get('ENGINE') == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};'
+        ),
+    })
+    # In-memory shared-cache test databases lock whole tables, which breaks
+    # the concurrent marking tests; use a throwaway file instead.
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', BASE_DIR / 'test_db.sqlite3')
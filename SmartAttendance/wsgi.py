@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SmartAttendance.settings')
 
 application = get_wsgi_application()
+
+# Replay journals left by a crashed worker and start the write-behind flusher.
+from attendance import writebehind  # noqa: E402
+
+writebehind.start_if_enabled()
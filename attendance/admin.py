@@ -1,5 +1,79 @@
-from django.contrib import admin
-from .models import CustomUser, ClassSession, Attendance
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from . import archive, counters, stats
+from .models import CustomUser, ClassSession, Attendance, ArchivedAttendance, RollCallAudit
+
+
+def _estimated_rows(model, using):
+    """The planner's row estimate for ``model``'s table, or None when there is none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == "sqlite":
+                # Filled in by ANALYZE; the first number is the table's row count.
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # -1: never analyzed
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's estimate instead of COUNT(*) for unfiltered changelists of big tables."""
+
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) behind "N results (M total)".
+    show_full_result_count = False
+
+
+class SessionFilter(admin.SimpleListFilter):
+    """Filters by ``?session=<pk>`` without listing every session in the sidebar.
+
+    Reached through the "Attendance" links on the ClassSession changelist.
+    """
+    title = "session"
+    parameter_name = "session"
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if value and value.isdigit():
+            return [(value, str(ClassSession.objects.filter(pk=value).first() or f"Session #{value}"))]
+        return []
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(session_id=value)
+        return queryset
+
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -9,19 +83,125 @@ class CustomUserAdmin(admin.ModelAdmin):
 
 
 @admin.register(ClassSession)
-class ClassSessionAdmin(admin.ModelAdmin):
-    list_display = ('token', 'created_at', 'expires_at', 'is_valid_display')
-    readonly_fields = ('created_at', 'expires_at', 'used_by')
+class ClassSessionAdmin(LargeTableAdmin):
+    list_display = ('token', 'teacher', 'department', 'created_at', 'expires_at', 'is_valid_display',
+                    'attendance_link', 'archived_at')
+    list_select_related = ('teacher',)
+    list_filter = ('department',)
+    date_hierarchy = 'created_at'
+    search_fields = ('token', 'teacher__username')
+    autocomplete_fields = ('teacher',)
+    # used_by is emptied by the sweeper and never shown.
+    exclude = ('used_by',)
+    readonly_fields = ('created_at', 'present_count', 'closed_at', 'archived_at')
+    actions = ('archive_attendance', 'recount_attendance')
 
     def is_valid_display(self, obj):
         return obj.is_valid()
     is_valid_display.short_description = "Active?"
+    is_valid_display.boolean = True
 
-    filter_horizontal = ('used_by',)
+    @admin.display(description="Attendance", ordering="present_count")
+    def attendance_link(self, obj):
+        name = "archivedattendance" if obj.archived_at else "attendance"
+        url = reverse(f"admin:attendance_{name}_changelist")
+        return format_html('<a href="{}?session={}">{}</a>', url, obj.pk, obj.present_count)
+
+    @admin.action(description="Archive attendance of selected expired sessions")
+    def archive_attendance(self, request, queryset):
+        sessions, rows = archive.archive_sessions(queryset.filter(expires_at__lt=timezone.now()))
+        self.message_user(request, f"Archived {rows} attendance rows from {sessions} sessions.")
+
+    @admin.action(description="Recount attendance of selected sessions")
+    def recount_attendance(self, request, queryset):
+        selected = list(queryset.values_list("pk", "present_count", "archived_at"))
+        actual = {}
+        # One grouped count per table, whatever the selection size.
+        for table, archived in ((Attendance, False), (ArchivedAttendance, True)):
+            ids = [pk for pk, _, archived_at in selected if (archived_at is not None) == archived]
+            if ids:
+                actual.update(table.objects.filter(session_id__in=ids, status__in=Attendance.ATTENDED)
+                              .values("session").annotate(n=Count("pk")).values_list("session", "n"))
+        drifted = sum(actual.get(pk, 0) != present_count for pk, present_count, _ in selected)
+        if not drifted:
+            self.message_user(request, "Corrected 0 sessions.", messages.SUCCESS)
+            return
+        # A session that drifted took its teacher's and students' counters and
+        # rollups with it; rebuild them all, as `manage.py rebuild_counters` does.
+        with transaction.atomic():
+            counters.rebuild_counters()
+            stats.rebuild_rollups()
+        self.message_user(request, f"Corrected {drifted} sessions and rebuilt the user counters and rollups.",
+                          messages.WARNING)
 
 
 @admin.register(Attendance)
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(LargeTableAdmin):
     list_display = ('student', 'session', 'status', 'marked_at')
-    list_filter = ('status', 'marked_at', 'session')
+    list_select_related = ('student', 'session')
+    list_filter = ('status', SessionFilter)
+    date_hierarchy = 'marked_at'
     search_fields = ('student__username', 'session__token')
+    autocomplete_fields = ('student', 'session')
+
+    def save_model(self, request, obj, form, change):
+        # Adds and edits go through the counters too: take the old row out if
+        # it was counted, then count the saved one if it attends.
+        with transaction.atomic():
+            old = None
+            if change:
+                old = (Attendance.objects.filter(pk=obj.pk, status__in=Attendance.ATTENDED)
+                       .values_list("student_id", "session_id", "session__teacher_id", "marked_at").first())
+            super().save_model(request, obj, form, change)
+            new = None
+            if obj.status in Attendance.ATTENDED:
+                new = (obj.student_id, obj.session_id, obj.session.teacher_id, obj.marked_at)
+            if old == new:
+                return
+            if old:
+                counters.record_unmarks([old])
+            if new:
+                counters.record_marks(obj.session, [obj.student_id], timezone.localdate(obj.marked_at))
+
+    def delete_queryset(self, request, queryset):
+        # Keep the denormalized counters in step instead of leaving drift for rebuild_counters.
+        with transaction.atomic():
+            rows = list(queryset.filter(status__in=Attendance.ATTENDED)
+                        .values_list("student_id", "session_id", "session__teacher_id", "marked_at"))
+            super().delete_queryset(request, queryset)
+            counters.record_unmarks(rows)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            if obj.status in Attendance.ATTENDED:
+                counters.record_unmarks([(obj.student_id, obj.session_id, obj.session.teacher_id, obj.marked_at)])
+
+
+@admin.register(ArchivedAttendance)
+class ArchivedAttendanceAdmin(LargeTableAdmin):
+    list_display = ('student', 'session', 'status', 'marked_at')
+    list_select_related = ('student', 'session')
+    list_filter = ('status', SessionFilter)
+    date_hierarchy = 'marked_at'
+    search_fields = ('student__username', 'session__token')
+    readonly_fields = ('student', 'session', 'status', 'marked_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RollCallAudit)
+class RollCallAuditAdmin(LargeTableAdmin):
+    list_display = ('session', 'student', 'old_status', 'new_status', 'changed_by', 'changed_at')
+    list_select_related = ('session', 'student', 'changed_by')
+    list_filter = ('new_status', SessionFilter)
+    date_hierarchy = 'changed_at'
+    search_fields = ('student__username', 'session__token')
+    readonly_fields = ('session', 'student', 'changed_by', 'old_status', 'new_status', 'changed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AttendanceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'attendance'
+
+    def ready(self):
+        # Registers the query timer on every database connection opened from
+        # now on, the profile-save hooks that expire cached pages and users, and
+        # the deployment checks.
+        from . import auth, checks, page_cache, perf  # noqa: F401
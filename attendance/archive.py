@@ -0,0 +1,98 @@
+"""
+Expired-session sweeping and the attendance archive tier.
+
+``sweep`` is run periodically by ``manage.py sweep_sessions``. It does two
+things.
+
+* It closes every session past its expiry by setting ``closed_at`` and
+  dropping the session's ``used_by`` rows.
+* It moves the attendance of sessions older than
+  ``ATTENDANCE_ARCHIVE_AFTER_DAYS`` from ``Attendance`` into
+  ``ArchivedAttendance``, one batch of sessions per transaction, and stamps
+  ``archived_at`` on them. The hot table then only holds the current term.
+
+Counters and daily rollups are left alone, since they already count the
+archived marks. Readers that need the rows themselves pick the right table:
+``marks_relation`` for one session, and ``marks_querysets`` for date ranges,
+which adds the archive only when the range reaches back into it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import page_cache
+from .models import ArchivedAttendance, Attendance, ClassSession
+
+ARCHIVE_BATCH_SIZE = 100  # sessions per transaction
+
+
+def marks_relation(session):
+    """Name of the reverse relation holding ``session``'s attendance rows."""
+    return "archived_attendance" if session.archived_at else "attendance"
+
+
+def archive_horizon():
+    """Latest ``marked_at`` in the archive, or None when it is empty."""
+    return ArchivedAttendance.objects.aggregate(latest=Max("marked_at"))["latest"]
+
+
+def marks_querysets(since=None):
+    """Querysets holding every mark at or after ``since`` (all marks when None), archive first."""
+    querysets = [Attendance.objects.all()]
+    horizon = archive_horizon()
+    if horizon is not None and (since is None or since <= horizon):
+        querysets.insert(0, ArchivedAttendance.objects.all())
+    return querysets
+
+
+def close_expired(now=None):
+    now = now or timezone.now()
+    expired = ClassSession.objects.filter(closed_at__isnull=True, expires_at__lt=now)
+    with transaction.atomic():
+        ClassSession.used_by.through.objects.filter(classsession__in=expired).delete()
+        return expired.update(closed_at=now)
+
+
+def archive_before(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move attendance of sessions created before ``cutoff``; returns (sessions, rows) moved."""
+    return archive_sessions(ClassSession.objects.filter(created_at__lt=cutoff), batch_size=batch_size)
+
+
+def archive_sessions(sessions, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move attendance of the not yet archived ``sessions`` (a queryset); returns (sessions, rows) moved."""
+    sessions_moved = rows_moved = 0
+    pending = sessions.filter(archived_at__isnull=True).order_by("pk")
+    while True:
+        ids = list(pending.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            live = Attendance.objects.filter(session_id__in=ids)
+            rows = [
+                ArchivedAttendance(student_id=student_id, session_id=session_id, status=status, marked_at=marked_at)
+                for student_id, session_id, status, marked_at
+                in live.values_list("student_id", "session_id", "status", "marked_at")
+            ]
+            ArchivedAttendance.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+            live.delete()
+            ClassSession.objects.filter(pk__in=ids).update(archived_at=timezone.now())
+        sessions_moved += len(ids)
+        rows_moved += len(rows)
+    if sessions_moved:
+        page_cache.bump_all()  # recent-marks lists now read from the archive
+    return sessions_moved, rows_moved
+
+
+def sweep(now=None, archive_after_days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Close expired sessions and archive old ones; returns (closed, archived sessions, archived rows)."""
+    now = now or timezone.now()
+    if archive_after_days is None:
+        archive_after_days = settings.ATTENDANCE_ARCHIVE_AFTER_DAYS
+    closed = close_expired(now)
+    archived = (0, 0)
+    if archive_after_days:
+        archived = archive_before(now - timedelta(days=archive_after_days), batch_size=batch_size)
+    return (closed, *archived)
@@ -0,0 +1,84 @@
+"""
+An authentication backend that keeps request users in the cache.
+
+``AuthenticationMiddleware`` loads the user row on every authenticated
+request, only to read the role and profile fields. ``CachedModelBackend``
+keeps those fields in the ``ATTENDANCE_USER_CACHE_ALIAS`` cache for
+``ATTENDANCE_USER_CACHE_SECONDS``. Together with the ``cached_db`` session
+engine, a request such as a scan then reaches the view without a query.
+The cache must be shared by every worker, or a deactivated user stays
+logged in on the workers that did not see the change; without one the alias
+is ``off`` and every request loads the user.
+
+The password hash is not cached. The user comes back with ``password``
+deferred, so code that needs it (a password change) loads it on demand, and
+the session check uses the cached ``get_session_auth_hash``. That is an
+HMAC, so a password change still logs out other sessions. Entries are
+dropped after commit whenever a user is saved or deleted. Code that changes
+users with ``update()`` or ``bulk_create()`` calls ``forget``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+
+KEY_PREFIX = "attendance:user:"
+
+
+def _cache():
+    return caches[settings.ATTENDANCE_USER_CACHE_ALIAS]
+
+
+def _fields():
+    return [f.attname for f in get_user_model()._meta.concrete_fields if f.attname != "password"]
+
+
+def _entry(user):
+    return [getattr(user, name) for name in _fields()], user.get_session_auth_hash()
+
+
+def _rebuild(entry):
+    values, session_auth_hash = entry
+    User = get_user_model()
+    user = User.from_db(router.db_for_read(User), _fields(), values)
+    user._session_auth_hash = session_auth_hash
+    return user
+
+
+def forget(*user_ids):
+    _cache().delete_many([f"{KEY_PREFIX}{user_id}" for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+
+    def get_user(self, user_id):
+        entry = _cache().get(f"{KEY_PREFIX}{user_id}")
+        if entry is not None:
+            user = _rebuild(entry)
+        else:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            _cache().set(f"{KEY_PREFIX}{user_id}", _entry(user), settings.ATTENDANCE_USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        entry = await _cache().aget(f"{KEY_PREFIX}{user_id}")
+        if entry is not None:
+            user = _rebuild(entry)
+            return user if self.user_can_authenticate(user) else None
+        user = await super().aget_user(user_id)
+        if user is not None:
+            await _cache().aset(f"{KEY_PREFIX}{user_id}", _entry(user), settings.ATTENDANCE_USER_CACHE_SECONDS)
+        return user
+
+
+def _user_changed(sender, instance, **kwargs):
+    forget(instance.pk)  # stop serving it now, and again once the new row is visible
+    transaction.on_commit(lambda: forget(instance.pk))
+
+
+post_save.connect(_user_changed, sender=settings.AUTH_USER_MODEL)
+post_delete.connect(_user_changed, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,459 @@
+"""
+Benchmarks run with ``manage.py benchmark <scenario>``.
+
+Scenarios create their own fixture users (usernames start with ``bench-``)
+and delete them afterwards. They still write to the configured database, so
+point ``DATABASE_URL`` at a scratch database rather than production.
+"""
+import asyncio
+import base64
+import json
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO
+
+import qrcode
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.forms import UserCreationForm
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.test import Client, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from . import qr, token_cache, views
+from .forms import StudentSignUpForm
+from .models import CustomUser, ClassSession, generate_unique_token
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latencies in seconds -> a dict of milliseconds and requests/second."""
+    ms = [t * 1000 for t in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+    }
+
+
+@contextmanager
+def fixture(students=0):
+    """Yield ``(teacher, students)`` bench users and delete them (and their rows) afterwards."""
+    prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+    teacher = CustomUser.objects.create(username=prefix + "teacher", role="teacher", department="Bench")
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(username=f"{prefix}s{i}", role="student", department="Bench") for i in range(students)],
+        batch_size=500,
+    )
+    try:
+        yield teacher, users
+    finally:
+        CustomUser.objects.filter(username__startswith=prefix).delete()
+
+
+def live_session(teacher, minutes=30):
+    session = ClassSession.objects.create(teacher=teacher, expires_at=timezone.now() + timedelta(minutes=minutes))
+    token_cache.remember(session)
+    return session
+
+
+def _scan_request(student, token):
+    request = RequestFactory().post(reverse("mark_attendance_ajax"), {"token": token})
+    request.user = student
+
+    async def auser():
+        return student
+
+    request.auser = auser
+    return request
+
+
+@scenario("scan")
+def scan_sync_vs_async(requests=300, concurrency=50, **options):
+    """mark_attendance_ajax vs mark_attendance_ajax_async under concurrent scans."""
+    results = {}
+    with fixture(students=requests) as (teacher, students):
+
+        session = live_session(teacher)
+
+        def sync_scan(student):
+            start = time.perf_counter()
+            try:
+                response = views.mark_attendance_ajax(_scan_request(student, session.token))
+                return time.perf_counter() - start, response.status_code != 200
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(sync_scan, students))
+        results["sync"] = summarize([t for t, _ in outcomes], time.perf_counter() - start,
+                                    errors=sum(e for _, e in outcomes))
+
+        session = live_session(teacher)
+
+        async def async_scan(student, limit):
+            async with limit, ThreadSensitiveContext():
+                start = time.perf_counter()
+                response = await views.mark_attendance_ajax_async(_scan_request(student, session.token))
+                return time.perf_counter() - start, response.status_code != 200
+
+        async def run_async():
+            limit = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(async_scan(s, limit) for s in students))
+
+        start = time.perf_counter()
+        outcomes = asyncio.run(run_async())
+        results["async"] = summarize([t for t, _ in outcomes], time.perf_counter() - start,
+                                     errors=sum(e for _, e in outcomes))
+        connections.close_all()
+
+    return results
+
+
+def _legacy_inline_png(token):
+    # What create_qr used to do on every request.
+    buffer = BytesIO()
+    qrcode.make(token).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue())
+
+
+@scenario("qr")
+def qr_render(requests=200, **options):
+    """Render time and payload size per QR format, cold and from the LRU cache."""
+    tokens = [generate_unique_token() for _ in range(requests)]
+    variants = {
+        "legacy-inline-base64": _legacy_inline_png,
+        **{fmt: (lambda token, fmt=fmt: qr.render_uncached(token, fmt)) for fmt in qr.FORMATS},
+        f"{qr.DEFAULT_FORMAT}-cached": qr.render,
+    }
+    for token in tokens:
+        qr.render(token)  # warm the cache for the cached variant
+
+    results = {}
+    for name, render in variants.items():
+        latencies, sizes = [], []
+        start = time.perf_counter()
+        for token in tokens:
+            t0 = time.perf_counter()
+            sizes.append(len(render(token)))
+            latencies.append(time.perf_counter() - t0)
+        results[name] = summarize(latencies, time.perf_counter() - start)
+        results[name]["payload_bytes"] = round(statistics.fmean(sizes))
+    return results
+
+
+def _legacy_signup_save(form):
+    # What StudentSignUpForm.save used to do: INSERT, then UPDATE with the profile.
+    user = UserCreationForm.save(form, commit=True)
+    user.role = "student"
+    user.roll_number = form.cleaned_data["roll_number"]
+    user.department = form.cleaned_data["department"]
+    user.save()
+    return user
+
+
+@scenario("signup")
+def signup(requests=100, concurrency=8, **options):
+    """Student signups: the old INSERT-then-UPDATE save vs the single-write form."""
+    variants = {
+        "legacy-two-writes": _legacy_signup_save,
+        "single-write": lambda form: form.save(),
+    }
+    results = {}
+    with fixture() as (teacher, _):
+        prefix = teacher.username[:-len("teacher")]
+        for name, save in variants.items():
+
+            def one(i, name=name, save=save):
+                form = StudentSignUpForm({
+                    "username": f"{prefix}{name}-{i}", "email": "", "roll_number": f"R{i}",
+                    "department": "Bench", "password1": "bench-Passw0rd!", "password2": "bench-Passw0rd!",
+                })
+                start = time.perf_counter()
+                try:
+                    with CaptureQueriesContext(connections["default"]) as ctx:
+                        ok = form.is_valid() and save(form) is not None
+                    writes = sum(q["sql"].startswith(("INSERT", "UPDATE")) for q in ctx.captured_queries)
+                    return time.perf_counter() - start, not ok, writes
+                finally:
+                    connections.close_all()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(one, range(requests)))
+            results[name] = summarize([t for t, _, _ in outcomes], time.perf_counter() - start,
+                                      errors=sum(e for _, e, _ in outcomes))
+            results[name]["writes_per_signup"] = round(statistics.fmean(w for _, _, w in outcomes), 2)
+    return results
+
+
+def _session_store(session_key=None):
+    return import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+
+
+def login_cookie(user):
+    """Create a logged-in session for ``user`` directly in the session store; returns its key."""
+    store = _session_store()
+    store[SESSION_KEY] = str(user.pk)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    # save() rather than create(): the signed-cookie engine only has a key once saved.
+    store.save(must_create=True)
+    return store.session_key
+
+
+def _client():
+    # The test client's default "testserver" host is only allowed under the test runner.
+    hosts = [h for h in settings.ALLOWED_HOSTS if h and "*" not in h and not h.startswith(".")]
+    return Client(HTTP_HOST=hosts[0] if hosts else "localhost")
+
+
+def _post_in_process(session_key, token):
+    client = _client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    response = client.post(reverse("mark_attendance_ajax"), {"token": token})
+    return response.status_code, response.content
+
+
+def _post_http(base_url, session_key, token):
+    csrf = get_random_string(32)
+    request = urllib.request.Request(
+        urllib.parse.urljoin(base_url, reverse("mark_attendance_ajax")),
+        data=urllib.parse.urlencode({"token": token}).encode(),
+        headers={
+            "Cookie": f"{settings.SESSION_COOKIE_NAME}={session_key}; {settings.CSRF_COOKIE_NAME}={csrf}",
+            "X-CSRFToken": csrf,
+        },
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _error_kind(status, body):
+    try:
+        msg = json.loads(body).get("msg", "")
+    except ValueError:
+        msg = "non-JSON response"
+    return f"{status} {msg}".strip()
+
+
+@scenario("storm")
+def scan_storm(requests=500, concurrency=100, url=None, **options):
+    """A lecture-hall scan storm: ``requests`` students POST one scan each to mark_attendance_ajax.
+
+    Runs through the test client in this process, or against a running
+    server at ``url`` that shares this database. Query counts are only
+    available in-process.
+    """
+    with fixture(students=requests) as (teacher, students):
+        teacher_client = _client()
+        teacher_client.force_login(teacher)
+        teacher_client.get(reverse("create_qr"))
+        token = ClassSession.objects.filter(teacher=teacher).latest("created_at").token
+
+        keys = [login_cookie(student) for student in students]
+
+        def scan(session_key):
+            start = time.perf_counter()
+            try:
+                if url:
+                    status, body = _post_http(url, session_key, token)
+                    queries = None
+                else:
+                    with CaptureQueriesContext(connections["default"]) as ctx:
+                        status, body = _post_in_process(session_key, token)
+                    queries = len(ctx.captured_queries)
+                kind = None if status == 200 and json.loads(body).get("ok") else _error_kind(status, body)
+            except Exception as e:
+                kind, status, queries = type(e).__name__, None, None
+            finally:
+                if not url:
+                    connections.close_all()
+            return time.perf_counter() - start, status, kind, queries
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(scan, keys))
+        elapsed = time.perf_counter() - start
+
+        for key in keys:
+            _session_store(key).delete()
+
+    errors = Counter(kind for _, _, kind, _ in outcomes if kind)
+    result = summarize([t for t, _, _, _ in outcomes], elapsed, errors=sum(errors.values()))
+    result["target"] = url or "in-process"
+    result["concurrency"] = concurrency
+    result["status_codes"] = dict(Counter(str(status) for _, status, _, _ in outcomes))
+    result["error_breakdown"] = dict(errors)
+    queries = [q for _, _, _, q in outcomes if q is not None]
+    if queries:
+        result["queries_per_request"] = {
+            "mean": round(statistics.fmean(queries), 2),
+            "p95": percentile(queries, 95),
+            "max": max(queries),
+        }
+    return {"storm": result}
+
+
+@contextmanager
+def _db_settings(alias, **overrides):
+    # Wrappers share the handler's settings dict, so this applies to every thread.
+    settings_dict = connections.settings[alias]
+    saved = {key: settings_dict[key] for key in overrides}
+    connections.close_all()
+    settings_dict.update(overrides)
+    try:
+        yield settings_dict
+    finally:
+        connections.close_all()
+        settings_dict.update(saved)
+
+
+@scenario("db-connect")
+def db_connect(requests=500, concurrency=4, **options):
+    """Per-request connection cost: a new connection every request vs the configured profile.
+
+    Each simulated request sends the request_started/request_finished signals
+    that Django's handlers send, which is where CONN_MAX_AGE and pooled
+    connections take effect, around one ``SELECT 1``. ``connects`` counts
+    connections Django set up (pool checkouts, when pooled).
+    """
+    alias = "default"
+    configured = connections.settings[alias]
+    variants = {
+        "new-connection": {
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {key: value for key, value in configured.get("OPTIONS", {}).items() if key != "pool"},
+        },
+        "configured": {},
+    }
+    results = {}
+    for name, overrides in variants.items():
+        connects = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == alias:
+                connects.append(1)
+
+        def worker(n):
+            latencies = []
+            try:
+                for _ in range(n):
+                    start = time.perf_counter()
+                    request_started.send(sender=None)
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    request_finished.send(sender=None)
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            return latencies
+
+        with _db_settings(alias, **overrides) as settings_dict:
+            connection_created.connect(count)
+            try:
+                shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    latencies = [t for part in pool.map(worker, shares) for t in part]
+                results[name] = summarize(latencies, time.perf_counter() - start)
+            finally:
+                connection_created.disconnect(count)
+            results[name]["connects"] = len(connects)
+            results[name]["conn_max_age"] = settings_dict["CONN_MAX_AGE"]
+            results[name]["pooled"] = bool(settings_dict.get("OPTIONS", {}).get("pool"))
+    return results
+
+
+def _auth_query(sql):
+    return any(table in sql for table in ('"django_session"', '"attendance_customuser"'))
+
+
+@scenario("auth")
+def auth_profiles(requests=200, concurrency=1, **options):
+    """Queries per mark_attendance_ajax request under each session/auth profile.
+
+    Every student loads the scan page first, as on a phone, then posts one
+    scan; only the scan is measured. ``auth_queries`` counts the session and
+    user reads that precede the mark itself.
+    """
+    profiles = {
+        "db-session+db-user": {"SESSION_ENGINE": "django.contrib.sessions.backends.db",
+                               "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"]},
+        "cached_db+cached-user": {"SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+                                  "SESSION_CACHE_ALIAS": "default",
+                                  "AUTHENTICATION_BACKENDS": ["attendance.auth.CachedModelBackend"],
+                                  "ATTENDANCE_USER_CACHE_ALIAS": "default"},
+        "signed-cookies+cached-user": {"SESSION_ENGINE": "django.contrib.sessions.backends.signed_cookies",
+                                       "AUTHENTICATION_BACKENDS": ["attendance.auth.CachedModelBackend"],
+                                       "ATTENDANCE_USER_CACHE_ALIAS": "default"},
+    }
+    results = {}
+    for name, overrides in profiles.items():
+        # Fresh students per profile, so each pays the same first-mark writes.
+        with override_settings(**overrides), fixture(students=requests) as (teacher, students):
+            session = live_session(teacher)
+
+            def scan(student):
+                client = _client()
+                client.cookies[settings.SESSION_COOKIE_NAME] = login_cookie(student)
+                try:
+                    client.get(reverse("scan_qr_page"))
+                    start = time.perf_counter()
+                    with CaptureQueriesContext(connections["default"]) as ctx:
+                        response = client.post(reverse("mark_attendance_ajax"), {"token": session.token})
+                    elapsed = time.perf_counter() - start
+                    sql = [q["sql"] for q in ctx.captured_queries]
+                    return elapsed, response.status_code != 200, len(sql), sum(map(_auth_query, sql))
+                finally:
+                    connections.close_all()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(scan, students))
+            results[name] = summarize([t for t, _, _, _ in outcomes], time.perf_counter() - start,
+                                      errors=sum(e for _, e, _, _ in outcomes))
+            results[name]["queries_per_request"] = round(statistics.fmean(q for _, _, q, _ in outcomes), 2)
+            results[name]["auth_queries"] = round(statistics.fmean(a for _, _, _, a in outcomes), 2)
+    return results
@@ -0,0 +1,73 @@
+"""
+System checks for deployments: settings that work on one process but not on
+several, and front-end assets that were never built.
+"""
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.checks import Error, Warning, register
+
+from . import live
+
+
+def _workers():
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+def _per_process(alias):
+    """Whether the cache ``alias`` lives inside each worker process."""
+    return settings.CACHES.get(alias, {}).get("BACKEND") == "django.core.cache.backends.locmem.LocMemCache"
+
+
+@register()
+def check_live_broker(app_configs, **kwargs):
+    if settings.ATTENDANCE_ASYNC_VIEWS and _workers() > 1 and \
+            getattr(settings, "ATTENDANCE_LIVE_BROKER", live.DEFAULT_BROKER) == live.DEFAULT_BROKER:
+        return [Warning(
+            "The in-process live broker only sees marks made by its own worker.",
+            hint="Set ATTENDANCE_LIVE_BROKER to 'attendance.live.PostgresBroker' when WEB_CONCURRENCY > 1.",
+            id="attendance.W001",
+        )]
+    return []
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    errors = []
+    if _workers() > 1 and _per_process(settings.ATTENDANCE_PAGE_CACHE_ALIAS):
+        errors.append(Error(
+            "ATTENDANCE_PAGE_CACHE_ALIAS names a per-process cache, so other workers keep serving stale pages.",
+            hint="Point it at a cache every worker shares, or set it to 'off'.",
+            id="attendance.E002",
+        ))
+    if _workers() > 1 and "cache" in settings.SESSION_ENGINE and _per_process(settings.SESSION_CACHE_ALIAS):
+        errors.append(Error(
+            "Sessions are cached in a per-process cache, so a logout does not reach the other workers.",
+            hint="Point SESSION_CACHE_ALIAS at a cache every worker shares, or use the 'db' session engine.",
+            id="attendance.E003",
+        ))
+    if _workers() > 1 and settings.ATTENDANCE_USER_CACHE_SECONDS and \
+            _per_process(settings.ATTENDANCE_USER_CACHE_ALIAS):
+        errors.append(Error(
+            "ATTENDANCE_USER_CACHE_ALIAS names a per-process cache, so other workers keep serving "
+            "deactivated or changed users.",
+            hint="Point it at a cache every worker shares, or set it to 'off'.",
+            id="attendance.E004",
+        ))
+    return errors
+
+
+@register(deploy=True)
+def check_built_assets(app_configs, **kwargs):
+    from .management.commands.build_assets import VENDOR
+
+    names = ["build/app.css", *(f"build/vendor/{name}" for name in VENDOR)]
+    missing = [name for name in names if not finders.find(name)]
+    if missing:
+        return [Error(
+            "Front-end assets are not built: " + ", ".join(missing),
+            hint="Run `npm install` and `manage.py build_assets --collect` (see build.sh).",
+            id="attendance.E005",
+        )]
+    return []
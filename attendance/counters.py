@@ -0,0 +1,175 @@
+"""
+Denormalized attendance counters.
+
+Report pages read ``ClassSession.present_count`` and ``UserCounter`` instead
+of counting ``Attendance`` rows on every request. Every write path that
+creates sessions or attendance must go through ``record_session`` /
+``record_marks`` so the numbers stay in step. Only rows with a status in
+``Attendance.ATTENDED`` are counted. The daily rollups behind
+attendance percentages (``attendance.stats``) are updated from the same two
+hooks, and so are the generations that expire cached dashboard and report
+pages (``attendance.page_cache``). ``rebuild_counters`` (and the
+``rebuild_counters`` management command) recomputes them after drift, e.g.
+when sessions are deleted through the admin. Attendance deleted through the
+admin is taken back out by ``record_unmarks``.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import page_cache, stats
+from .models import ArchivedAttendance, ClassSession, Attendance, UserCounter
+
+
+def _bump(user_id, **deltas):
+    if user_id is None:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if UserCounter.objects.filter(user_id=user_id).update(**updates):
+        return
+    # First write for this user: make sure the row exists, then retry the
+    # increment so concurrent first writers cannot lose an update.
+    UserCounter.objects.bulk_create([UserCounter(user_id=user_id)], ignore_conflicts=True)
+    UserCounter.objects.filter(user_id=user_id).update(**updates)
+
+
+def _bump_each(user_ids, field, delta=1):
+    """Add ``delta`` to ``field`` of every one of ``user_ids`` in at most two statements."""
+    rows = UserCounter.objects.filter(user_id__in=user_ids)
+    if len(user_ids) == 1 and rows.update(**{field: F(field) + delta}):
+        return
+    UserCounter.objects.bulk_create([UserCounter(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+    rows.update(**{field: F(field) + delta})
+
+
+def _by_amount(counts):
+    """Group ``{key: n}`` into ``{n: [keys]}``, so equal deltas share one UPDATE."""
+    groups = {}
+    for key, n in counts.items():
+        groups.setdefault(n, []).append(key)
+    return groups
+
+
+def record_session(session):
+    _bump(session.teacher_id, sessions_count=1)
+    stats.record_session(session)
+    page_cache.bump_on_commit(page_cache.user(session.teacher_id), page_cache.department(session.department))
+
+
+def record_marks(session, student_ids, day=None):
+    """Account for freshly inserted Attendance rows of ``student_ids`` in ``session``.
+
+    ``day`` is the local date the marks were made (default: today).
+    """
+    student_ids = list(student_ids)
+    if not student_ids:
+        return
+    with transaction.atomic():
+        ClassSession.objects.filter(pk=session.pk).update(present_count=F("present_count") + len(student_ids))
+        _bump(session.teacher_id, attendance_count=len(student_ids))
+        _bump_each(student_ids, "attendance_count")
+        stats.record_marks(session, student_ids, day)
+        page_cache.bump_on_commit(*map(page_cache.user, [session.teacher_id, *student_ids]))
+
+
+def record_mark(attendance):
+    record_marks(attendance.session, [attendance.student_id])
+
+
+def record_unmarks(rows):
+    """Take deleted (or no longer attended) Attendance rows back out of the counters.
+
+    ``rows`` are ``(student_id, session_id, teacher_id, marked_at)`` tuples,
+    read before the delete.
+    """
+    per_session, per_user, per_day = Counter(), Counter(), Counter()
+    for student_id, session_id, teacher_id, marked_at in rows:
+        per_session[session_id] += 1
+        per_user[student_id] += 1
+        if teacher_id is not None:
+            per_user[teacher_id] += 1
+            per_day[(timezone.localdate(marked_at), student_id, teacher_id)] += 1
+    with transaction.atomic():
+        for n, session_ids in _by_amount(per_session).items():
+            ClassSession.objects.filter(pk__in=session_ids).update(present_count=F("present_count") - n)
+        for n, user_ids in _by_amount(per_user).items():
+            UserCounter.objects.filter(user_id__in=user_ids).update(attendance_count=F("attendance_count") - n)
+        stats.record_unmarks(per_day)
+        page_cache.bump_on_commit(*map(page_cache.user, per_user))
+
+
+def compute_counters():
+    """Return the true counters computed from the source tables."""
+    session_counts = Counter()
+    users = Counter()
+    for teacher_id, n in (ClassSession.objects.exclude(teacher=None)
+                          .values("teacher").annotate(n=Count("pk")).values_list("teacher", "n")):
+        users[(teacher_id, "sessions_count")] = n
+
+    # Archived marks still count; they have only moved table.
+    for table in (Attendance, ArchivedAttendance):
+        table = table.objects.filter(status__in=Attendance.ATTENDED)
+        for session_id, n in table.values("session").annotate(n=Count("pk")).values_list("session", "n"):
+            session_counts[session_id] += n
+        for teacher_id, n in (table.exclude(session__teacher=None)
+                              .values("session__teacher").annotate(n=Count("pk"))
+                              .values_list("session__teacher", "n")):
+            users[(teacher_id, "attendance_count")] += n
+        for student_id, n in (table.values("student").annotate(n=Count("pk"))
+                              .values_list("student", "n")):
+            users[(student_id, "attendance_count")] += n
+
+    user_counts = {}
+    for (user_id, field), n in users.items():
+        user_counts.setdefault(user_id, {"sessions_count": 0, "attendance_count": 0})[field] = n
+    return session_counts, user_counts
+
+
+def find_drift():
+    """Return ``(sessions, users)`` lists of ``(pk, stored, actual)`` that disagree."""
+    session_counts, user_counts = compute_counters()
+
+    sessions = [
+        (pk, stored, session_counts.get(pk, 0))
+        for pk, stored in ClassSession.objects.values_list("pk", "present_count")
+        if stored != session_counts.get(pk, 0)
+    ]
+
+    zero = {"sessions_count": 0, "attendance_count": 0}
+    stored_users = {
+        row["user_id"]: {"sessions_count": row["sessions_count"], "attendance_count": row["attendance_count"]}
+        for row in UserCounter.objects.values("user_id", "sessions_count", "attendance_count")
+    }
+    users = [
+        (user_id, stored_users.get(user_id, zero), user_counts.get(user_id, zero))
+        for user_id in set(stored_users) | set(user_counts)
+        if stored_users.get(user_id, zero) != user_counts.get(user_id, zero)
+    ]
+    return sessions, users
+
+
+@transaction.atomic
+def rebuild_counters(batch_size=1000):
+    """Overwrite every stored counter with the value computed from the source tables."""
+    session_counts, user_counts = compute_counters()
+
+    to_update = []
+    for session in ClassSession.objects.only("pk", "present_count").iterator(chunk_size=batch_size):
+        actual = session_counts.get(session.pk, 0)
+        if session.present_count != actual:
+            session.present_count = actual
+            to_update.append(session)
+    ClassSession.objects.bulk_update(to_update, ["present_count"], batch_size=batch_size)
+
+    UserCounter.objects.exclude(user_id__in=user_counts).delete()
+    UserCounter.objects.bulk_create(
+        [UserCounter(user_id=user_id, **counts) for user_id, counts in user_counts.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["sessions_count", "attendance_count"],
+    )
+    page_cache.bump_all()
+    return len(to_update), len(user_counts)
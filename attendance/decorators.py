@@ -1,3 +1,6 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 
@@ -6,13 +9,30 @@ def role_required(allowed_roles=None, redirect_url='app-dashboard'):
         allowed_roles = []
 
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Load the user without blocking the event loop and pin it on
+                # the request so views and templates don't lazily query again.
+                user = await request.auser()
+                request.user = user
+                if not user.is_authenticated:
+                    return redirect('login')
+
+                if user.role not in allowed_roles:
+                    return HttpResponseForbidden("You are not allowed to access this page.")
+
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
         def wrapper(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 return redirect('login')
 
             if request.user.role not in allowed_roles:
                 return HttpResponseForbidden("You are not allowed to access this page.")
-            
+
             return view_func(request, *args, **kwargs)
         return wrapper
     return decorator
@@ -1,9 +1,27 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.db import transaction
 from .models import CustomUser
 
-class StudentSignUpForm(UserCreationForm):
+
+class RoleSignUpForm(UserCreationForm):
+    """Creates the user with its role and profile fields in a single INSERT.
+
+    The profile fields are listed in ``Meta.fields``, so the ModelForm has
+    already copied them onto ``self.instance`` during validation; only the
+    role is set here before the one save.
+    """
+    role = None
+
+    def save(self, commit=True):
+        self.instance.role = self.role
+        with transaction.atomic():
+            return super().save(commit=commit)
+
+
+class StudentSignUpForm(RoleSignUpForm):
+    role = "student"
     roll_number = forms.CharField(max_length=50)
     department = forms.CharField(max_length=50)
 
@@ -11,31 +29,12 @@ class StudentSignUpForm(UserCreationForm):
         model = CustomUser
         fields = ('username', 'email', 'roll_number', 'department', 'password1', 'password2')
 
-    
-    def save(self, commit=True):
-        user = super().save(commit=True)
-        user.role = "student"
-        user.roll_number = self.cleaned_data['roll_number']
-        user.department = self.cleaned_data['department']
-        if commit:
-            user.save()
-        return user
-    
-
-class TeacherSignUpForm(UserCreationForm):
+
+class TeacherSignUpForm(RoleSignUpForm):
+    role = "teacher"
     subject = forms.CharField(max_length=50)
     department = forms.CharField(max_length=50)
 
     class Meta(UserCreationForm.Meta):
         model = CustomUser
         fields = ('username', 'email', 'subject', 'department', 'password1', 'password2')
-
-    
-    def save(self, commit=True):
-        user = super().save(commit=True)
-        user.role = 'teacher'
-        user.subject = self.cleaned_data['subject']
-        user.department = self.cleaned_data['department']
-        if commit:
-            user.save()
-        return user
\ No newline at end of file
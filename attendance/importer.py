@@ -0,0 +1,162 @@
+"""
+Bulk roster import for ``manage.py import_roster``.
+
+The CSV needs a header row. It is read as a stream and written in batches,
+each one a single ``bulk_create(update_conflicts=True)`` keyed on username,
+so a re-run updates rows in place instead of duplicating them. Recognised
+columns are ``username``, ``role``, ``email``, ``first_name``,
+``last_name``, ``department``, ``roll_number``, ``subject`` and
+``password``; any may be missing.
+
+A student row without a username is matched to an existing student with the
+same roll number. If there is none, the roll number becomes the username.
+
+Existing accounts are only updated in the columns the CSV has: a roster of
+usernames and departments leaves names, emails and roles alone. The default
+role (``--role``) only applies to new accounts; a blank ``role`` cell keeps
+an existing account's role.
+
+Accounts without a password get an unusable one and use password reset to
+get in. Passwords that are supplied are hashed by a pool of worker processes,
+because hashing dominates the import time. An existing account's password is
+only replaced when the row supplies one.
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from . import auth, page_cache
+
+ROLES = ("student", "teacher")
+PROFILE_FIELDS = ("role", "email", "first_name", "last_name", "department", "roll_number", "subject")
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    skipped: list = field(default_factory=list)  # (line number, reason)
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+
+def _clean(row, default_role):
+    """Normalised values of ``row``; ``role`` is None when the row gives none."""
+    values = {key: (row.get(key) or "").strip() for key in ("username", "password", *PROFILE_FIELDS)}
+    values["role"] = values["role"].lower() or None
+    role = values["role"] or default_role
+    if role not in ROLES:
+        raise ValueError(f"unknown role {role!r}")
+    if not values["username"] and not (role == "student" and values["roll_number"]):
+        raise ValueError("needs a username (or a roll_number for students)")
+    for key in ("department", "roll_number", "subject"):
+        values[key] = values[key] or None
+    return values
+
+
+def _resolve_usernames(rows):
+    """Fill in usernames of roll-number-only student rows, preferring existing accounts."""
+    rolls = [row["roll_number"] for row in rows if not row["username"]]
+    if not rolls:
+        return
+    existing = dict(
+        get_user_model().objects.filter(role="student", roll_number__in=rolls).values_list("roll_number", "username")
+    )
+    for row in rows:
+        if not row["username"]:
+            row["username"] = existing.get(row["roll_number"], row["roll_number"])
+
+
+def _write_batch(rows, hashed, result, columns, default_role):
+    User = get_user_model()
+    # The same username twice in one statement is an error on PostgreSQL; last row wins.
+    by_username = {}
+    for row, password in zip(rows, hashed):
+        by_username[row["username"]] = (row, password)
+
+    existing = {username: (pk, role) for username, pk, role in
+                User.objects.filter(username__in=by_username).values_list("username", "pk", "role")}
+    with_password, without_password = [], []
+    for username, (row, password) in by_username.items():
+        user = User(username=username, **{key: row[key] for key in PROFILE_FIELDS})
+        user.role = row["role"] or (existing[username][1] if username in existing else default_role)
+        if password:
+            user.password = password
+            with_password.append(user)
+        else:
+            user.set_unusable_password()
+            without_password.append(user)
+
+    profile_fields = [key for key in PROFILE_FIELDS if key in columns]
+    with transaction.atomic():
+        for users, update_fields in ((with_password, [*profile_fields, "password"]),
+                                     (without_password, profile_fields)):
+            if users and update_fields:
+                User.objects.bulk_create(users, update_conflicts=True, unique_fields=["username"],
+                                         update_fields=update_fields)
+            elif users:
+                User.objects.bulk_create(users, ignore_conflicts=True)
+        # bulk_create skips post_save; drop cached copies of the updated accounts.
+        transaction.on_commit(lambda: auth.forget(*(pk for pk, _ in existing.values())))
+    result.updated += len(existing)
+    result.created += len(by_username) - len(existing)
+
+
+def _setup_worker():
+    django.setup()
+
+
+def import_rows(rows, default_role="student", batch_size=1000, workers=None, progress=None):
+    """Import an iterable of CSV dicts; returns an ImportResult.
+
+    ``rows`` is consumed lazily. ``progress(result)`` is called after every batch.
+    """
+    result = ImportResult()
+    columns = set()
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) if workers > 1 else None
+
+    def flush(batch):
+        _resolve_usernames(batch)
+        supplied = [row["password"] for row in batch if row["password"]]
+        hashes = iter(pool.map(make_password, supplied, chunksize=16) if pool else map(make_password, supplied))
+        hashed = [next(hashes) if row["password"] else "" for row in batch]
+        _write_batch(batch, hashed, result, columns, default_role)
+        if progress:
+            progress(result)
+
+    try:
+        batch = []
+        # Line 1 is the header.
+        for line, row in enumerate(rows, 2):
+            columns.update(key for key in row if key is not None)  # the header; extra cells come under None
+            try:
+                batch.append(_clean(row, default_role))
+            except ValueError as e:
+                result.skipped.append((line, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        # bulk_create skips post_save, so cached pages are expired here instead.
+        if result.imported:
+            page_cache.bump_all()
+        if pool:
+            pool.shutdown()
+    return result
+
+
+def import_csv(path, **options):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return import_rows(csv.DictReader(f), **options)
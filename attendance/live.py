@@ -0,0 +1,236 @@
+"""
+Live attendance feed for the QR display page.
+
+The marking paths call ``publish_marks`` when attendance rows are written. A
+broker delivers those events to the ``Hub`` in every web process, and the hub
+fans them out to the Server-Sent Events streams open for that session. Each
+open teacher screen costs one in-memory subscription and no database polling.
+Streams are only served by the async views. Under sync workers, a stream
+would hold a whole worker for the length of the session, so the QR page polls
+``session_live`` instead, which reads the database.
+
+Brokers, chosen with ``ATTENDANCE_LIVE_BROKER``:
+
+* ``InProcessBroker`` (default) delivers straight to this process's hub once
+  the write commits. It is enough for a single worker. With several,
+  streams still pick up the present count from the database on every
+  heartbeat, but marks made on other workers are not listed (the
+  ``attendance.W001`` check warns about this).
+* ``PostgresBroker`` sends events with ``pg_notify`` inside the write's
+  transaction. Each process runs one ``LISTEN`` connection that feeds its
+  hub, so the PostgreSQL we already run stands in for a separate pub/sub
+  service when there are several workers. PostgreSQL refuses payloads of
+  8000 bytes or more, so a large write (a roll call, a write-behind batch)
+  is split across several notifications, all sent in one statement.
+"""
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = "attendance.live.InProcessBroker"
+
+# Events buffered per subscriber; further events are dropped until it catches up.
+SUBSCRIBER_BUFFER = 1000
+
+# Bytes per pg_notify payload, under PostgreSQL's 8000-byte limit.
+MAX_PAYLOAD_BYTES = 7500
+
+
+class Subscription:
+    """A blocking queue of events for one sync stream."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self._queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("Dropping live event for slow subscriber on session %s", self.session_id)
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """Event queue for a stream running on an event loop; ``put`` is thread-safe."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+
+    def put(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("Dropping live event for slow subscriber on session %s", self.session_id)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Hub:
+    """Per-process fan-out of session events to open streams."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id, asynchronous=False):
+        sub = AsyncSubscription(session_id) if asynchronous else Subscription(session_id)
+        with self._lock:
+            self._subscribers[session_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.session_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.session_id]
+
+    def subscriber_count(self, session_id=None):
+        with self._lock:
+            if session_id is not None:
+                return len(self._subscribers.get(session_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def deliver(self, session_id, events):
+        with self._lock:
+            subs = list(self._subscribers.get(session_id, ()))
+        for sub in subs:
+            for event in events:
+                sub.put(event)
+
+
+hub = Hub()
+
+
+class InProcessBroker:
+
+    def publish(self, session_id, events):
+        transaction.on_commit(lambda: hub.deliver(session_id, events))
+
+
+def payloads(session_id, events, limit=MAX_PAYLOAD_BYTES):
+    """JSON messages carrying ``events`` in order, each at most ``limit`` bytes."""
+    messages, chunk, size = [], [], 0
+    overhead = len(json.dumps({"session": session_id, "events": []}))
+    for event in events:
+        encoded = len(json.dumps(event).encode()) + 2  # and the ", " before it
+        if chunk and overhead + size + encoded > limit:
+            messages.append(json.dumps({"session": session_id, "events": chunk}))
+            chunk, size = [], 0
+        chunk.append(event)
+        size += encoded
+    if chunk:
+        messages.append(json.dumps({"session": session_id, "events": chunk}))
+    return messages
+
+
+class PostgresBroker:
+    channel = "attendance_live"
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, session_id, events):
+        with connections[self.alias].cursor() as cursor:
+            # Delivered by PostgreSQL when (and only if) the transaction commits.
+            cursor.execute("SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                           [self.channel, payloads(session_id, events)])
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="attendance-live-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Live listener lost its connection; reconnecting")
+                time.sleep(1)
+
+    def _listen_once(self):
+        # Uses psycopg2's poll()/notifies API on a dedicated autocommit connection.
+        wrapper = connections.create_connection(self.alias)
+        wrapper.ensure_connection()
+        conn = wrapper.connection
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.channel}")
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    message = json.loads(notify.payload)
+                    hub.deliver(message["session"], message["events"])
+        finally:
+            wrapper.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        broker = import_string(getattr(settings, "ATTENDANCE_LIVE_BROKER", DEFAULT_BROKER))()
+        if hasattr(broker, "start"):
+            broker.start()
+        _broker = broker
+    return _broker
+
+
+def _reset_broker(setting, **kwargs):
+    global _broker
+    if setting == "ATTENDANCE_LIVE_BROKER":
+        _broker = None
+
+
+setting_changed.connect(_reset_broker)
+
+
+def subscribe(session_id, asynchronous=False):
+    get_broker()  # make sure this process receives events from other workers
+    return hub.subscribe(session_id, asynchronous=asynchronous)
+
+
+def publish_marks(session_id, marks):
+    """Announce new attendance rows: ``marks`` is a list of ``(username, marked_at)``."""
+    if not marks:
+        return
+    events = [{"student": username, "marked_at": marked_at.isoformat()} for username, marked_at in marks]
+    get_broker().publish(session_id, events)
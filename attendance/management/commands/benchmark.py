@@ -0,0 +1,40 @@
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand
+
+from attendance.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Run a performance benchmark scenario against the configured database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=sorted(SCENARIOS))
+        parser.add_argument("--requests", type=int, help="Operations per measured run.")
+        parser.add_argument("--concurrency", type=int, help="Parallel clients.")
+        parser.add_argument("--url", help="Base URL of a running server, for scenarios that can target one.")
+        parser.add_argument("--json", dest="json_path", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        kwargs = {key: options[key] for key in ("requests", "concurrency", "url") if options[key] is not None}
+        results = SCENARIOS[options["scenario"]](**kwargs)
+
+        for variant, numbers in results.items():
+            summary = ", ".join(f"{key}={value}" for key, value in numbers.items())
+            self.stdout.write(f"{variant}: {summary}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump({"scenario": options["scenario"], "commit": _git_head(), "options": kwargs,
+                           "results": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json_path']}"))
+
+
+def _git_head():
+    # Recorded so result files from different commits can be compared.
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
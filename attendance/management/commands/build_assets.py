@@ -0,0 +1,48 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+# Third-party scripts served from static/build/vendor/ instead of a CDN:
+# output name -> minified file in node_modules.
+VENDOR = {
+    "chart.umd.min.js": "chart.js/dist/chart.umd.min.js",
+    "html5-qrcode.min.js": "html5-qrcode/html5-qrcode.min.js",
+}
+
+
+class Command(BaseCommand):
+    help = ("Compile the purged Tailwind/daisyUI stylesheet and vendor the minified JS into static/build/. "
+            "Needs `npm install` first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collect", action="store_true",
+                            help="Run collectstatic afterwards (hashed names plus gzip/brotli copies).")
+
+    def handle(self, *args, **options):
+        base = Path(settings.BASE_DIR)
+        node_modules = base / "node_modules"
+        if not node_modules.is_dir():
+            raise CommandError(f"{node_modules} not found; run `npm install` first.")
+        out = base / "static" / "build"
+        (out / "vendor").mkdir(parents=True, exist_ok=True)
+
+        try:
+            subprocess.run(["npx", "--no-install", "@tailwindcss/cli", "-i", "assets/app.css",
+                            "-o", str(out / "app.css"), "--minify"], cwd=base, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(f"Tailwind build failed: {e}")
+        self.stdout.write(f"Wrote {out / 'app.css'} ({(out / 'app.css').stat().st_size} bytes)")
+
+        for name, source in VENDOR.items():
+            source = node_modules / source
+            if not source.is_file():
+                raise CommandError(f"{source} not found; is the package in package.json installed?")
+            shutil.copyfile(source, out / "vendor" / name)
+            self.stdout.write(f"Copied {source.relative_to(base)} -> {(out / 'vendor' / name).relative_to(base)}")
+
+        if options["collect"]:
+            call_command("collectstatic", interactive=False, verbosity=options["verbosity"])
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from attendance import page_weight
+from attendance.benchmarks import _client, fixture, login_cookie
+
+
+class Command(BaseCommand):
+    help = ("Render the scan page as a student and check its transfer size and estimated time to "
+            "interactive against ATTENDANCE_SCAN_PAGE_BUDGET_KB/_MS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rtt", type=int, default=page_weight.RTT_MS, help="Round-trip time in ms.")
+        parser.add_argument("--kbps", type=int, default=page_weight.KBPS, help="Link throughput in kbit/s.")
+
+    def handle(self, *args, **options):
+        with fixture(students=1) as (teacher, students):
+            client = _client()
+            client.cookies[settings.SESSION_COOKIE_NAME] = login_cookie(students[0])
+            response = client.get(reverse("scan_qr_page"))
+        if response.status_code != 200:
+            raise CommandError(f"The scan page answered {response.status_code}.")
+
+        result = page_weight.report(response.content.decode(), options["rtt"], options["kbps"])
+        self.stdout.write(f"html: {result['html_bytes']} bytes (gzip)")
+        for resource in result["resources"]:
+            if resource["bytes"] is not None:
+                size = f"{resource['bytes']} bytes"
+            else:
+                size = "not built" if resource["url"] in result["missing"] else "third-party"
+            blocking = ", render-blocking" if resource["blocking"] else ""
+            self.stdout.write(f"{resource['kind']}: {resource['url']} ({size}{blocking})")
+        self.stdout.write(f"total: {result['total_bytes'] / 1024:.1f} KB, "
+                          f"estimated time to interactive: {result['tti_ms']} ms")
+
+        problems = page_weight.over_budget(result, settings.ATTENDANCE_SCAN_PAGE_BUDGET_KB,
+                                           settings.ATTENDANCE_SCAN_PAGE_BUDGET_MS)
+        if problems:
+            raise CommandError("Scan page over budget: " + "; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Scan page within budget."))
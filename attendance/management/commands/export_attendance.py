@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from attendance import export
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+class Command(BaseCommand):
+    help = "Write attendance rows as CSV or XLSX, streamed the same way as the reports export."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="csv")
+        parser.add_argument("--output", "-o", help="File to write; defaults to stdout.")
+        parser.add_argument("--teacher", help="Only sessions created by this username.")
+        parser.add_argument("--department", help="Only sessions opened for this department.")
+        parser.add_argument("--start", type=_date, help="First day to include (YYYY-MM-DD).")
+        parser.add_argument("--end", type=_date, help="Last day to include (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        teacher = None
+        if options["teacher"]:
+            try:
+                teacher = get_user_model().objects.get(username=options["teacher"], role="teacher")
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No teacher named {options['teacher']!r}.")
+
+        rows = export.attendance_rows(teacher=teacher, department=options["department"],
+                                      start=options["start"], end=options["end"])
+
+        start = time.perf_counter()
+        written = 0
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in export.chunks(options["format"], rows):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options["output"]:
+                out.close()
+            else:
+                out.flush()
+
+        if options["output"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {written} bytes to {options['output']} in {time.perf_counter() - start:.1f}s"
+            ))
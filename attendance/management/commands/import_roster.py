@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.importer import ROLES, import_csv
+
+
+class Command(BaseCommand):
+    help = "Create or update students and teachers from a CSV file (re-runs update rows in place)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV with a header row: username, role, email, first_name, last_name, "
+                                         "department, roll_number, subject, password.")
+        parser.add_argument("--role", choices=ROLES, default="student", help="Role for rows without one.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, help="Password hashing processes (default: CPU count).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(result):
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{result.imported} rows ({result.imported / elapsed:.0f} rows/s)")
+
+        try:
+            result = import_csv(options["path"], default_role=options["role"], batch_size=options["batch_size"],
+                                workers=options["workers"], progress=progress)
+        except FileNotFoundError:
+            raise CommandError(f"No such file: {options['path']}")
+
+        for line, reason in result.skipped:
+            self.stderr.write(f"line {line}: skipped, {reason}")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} rows ({result.created} created, {result.updated} updated, "
+            f"{len(result.skipped)} skipped) in {elapsed:.1f}s, {result.imported / elapsed:.0f} rows/s."
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.counters import find_drift, rebuild_counters
+from attendance.stats import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Verify or rebuild the denormalized attendance counters and daily rollups from the Attendance table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Only report drift; exit with an error if any counter is wrong.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sessions, users = find_drift()
+
+        for pk, stored, actual in sessions:
+            self.stdout.write(f"session {pk}: present_count {stored} != {actual}")
+        for pk, stored, actual in users:
+            self.stdout.write(f"user {pk}: {stored} != {actual}")
+
+        if options["check"]:
+            if sessions or users:
+                raise CommandError(f"Counter drift in {len(sessions)} sessions and {len(users)} users.")
+            self.stdout.write(self.style.SUCCESS("All counters are consistent."))
+            return
+
+        fixed_sessions, users_total = rebuild_counters(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt counters: {fixed_sessions} sessions corrected, {users_total} user rollups written."
+        ))
+        session_days, student_days = rebuild_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt daily rollups: {session_days} session rows, {student_days} student rows."
+        ))
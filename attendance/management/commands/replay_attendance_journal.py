@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from attendance.writebehind import replay_orphans
+
+
+class Command(BaseCommand):
+    help = "Persist attendance marks left in write-behind journal segments by stopped workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.ATTENDANCE_WRITE_BEHIND_DIR,
+                            help="Journal directory (defaults to ATTENDANCE_WRITE_BEHIND_DIR).")
+
+    def handle(self, *args, **options):
+        written = replay_orphans(options["dir"])
+        self.stdout.write(self.style.SUCCESS(f"Replayed journals: {written} new attendance rows."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from attendance.archive import ARCHIVE_BATCH_SIZE, sweep
+
+
+class Command(BaseCommand):
+    help = "Close expired QR sessions and move old terms' attendance into the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--archive-after-days", type=int,
+                            help="Archive sessions older than this (default: ATTENDANCE_ARCHIVE_AFTER_DAYS; 0 disables).")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Sessions per transaction.")
+        parser.add_argument("--interval", type=int,
+                            help="Keep running, sweeping every this many seconds (otherwise sweep once).")
+
+    def handle(self, *args, **options):
+        while True:
+            closed, sessions, rows = sweep(archive_after_days=options["archive_after_days"],
+                                           batch_size=options["batch_size"])
+            self.stdout.write(f"Closed {closed} sessions; archived {rows} attendance rows from {sessions} sessions.")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,246 @@
+"""
+Attendance marking engine shared by ``mark_attendance`` and ``mark_attendance_ajax``.
+
+A scan costs a session lookup (normally served by ``token_cache``) and a
+single conflict-tolerant INSERT
+(``INSERT OR IGNORE`` on SQLite, ``ON CONFLICT DO NOTHING`` on PostgreSQL).
+Whether the student had already marked is read from the insert's row count,
+so two concurrent scans by the same student can never trip the
+``unique_together`` constraint.
+
+With ``ATTENDANCE_WRITE_BEHIND`` on, the insert is handed to
+``attendance.writebehind`` instead and persisted in batches.
+
+Rotating tokens and cached sessions can outlive a deleted session. The
+insert's foreign key then fails when the transaction commits, and the scan
+is answered INVALID.
+
+``mark_batch`` takes the scans a phone queued while offline. A static
+token is checked against session expiry at the time the scan was made, as
+reported by the phone, but that time is trusted only within
+``ATTENDANCE_OFFLINE_SCAN_TOLERANCE_SECONDS``. A rotating token is always
+checked at server time: its whole point is that a code stops working
+within the skew window, and a back-dated scan time would stretch that to
+the offline tolerance.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from . import counters, live, rotating, token_cache, writebehind
+from .models import Attendance
+
+MARKED = "marked"
+ALREADY_MARKED = "already_marked"
+INVALID = "invalid"
+EXPIRED = "expired"
+ROTATED = "rotated"
+
+MESSAGES = {
+    MARKED: "Attendance marked successfully!",
+    ALREADY_MARKED: "You already marked attendance for this session",
+    INVALID: "Invalid or expired QR token",
+    EXPIRED: "This session has expired",
+    ROTATED: "This QR code has changed, scan the one currently on screen",
+}
+
+# UUID tokens are 36 characters; anything much shorter is not one of ours.
+MIN_TOKEN_LENGTH = 20
+
+
+class MarkResult(namedtuple("MarkResult", ["status", "session"])):
+
+    @property
+    def ok(self):
+        return self.status == MARKED
+
+    @property
+    def message(self):
+        return MESSAGES[self.status]
+
+
+def normalize_token(raw):
+    """Return the bare token from scanned QR data (token or URL), or None if it can't be one."""
+    token = (raw or "").strip()
+    # Extract token from URL if present
+    if "/" in token:
+        token = token.rstrip("/").split("/")[-1]
+    if len(token) < MIN_TOKEN_LENGTH:
+        return None
+    return token
+
+
+# Rows per INSERT statement; keeps SQLite well under its bound-parameter limit.
+INSERT_BATCH_SIZE = 500
+
+
+def insert_marks(rows):
+    """INSERT ``(student_id, session_id, status, marked_at)`` rows, skipping pairs that already exist.
+
+    Returns the ``(student_id, session_id)`` pairs that were actually written.
+    """
+    opts = Attendance._meta
+    qn = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in ("student", "session", "status", "marked_at")]
+    returning = connection.features.can_return_rows_from_bulk_insert
+
+    def statement(n):
+        sql = "%s %s (%s) VALUES %s %s" % (
+            connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            qn(opts.db_table),
+            ", ".join(qn(f.column) for f in fields),
+            ", ".join(["(%s)" % ", ".join(["%s"] * len(fields))] * n),
+            connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+        )
+        if returning:
+            sql += " RETURNING %s, %s" % (qn(fields[0].column), qn(fields[1].column))
+        return sql
+
+    def prep(row):
+        return [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+
+    written = []
+    with connection.cursor() as cursor:
+        if returning:
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                batch = rows[i:i + INSERT_BATCH_SIZE]
+                cursor.execute(statement(len(batch)), [p for row in batch for p in prep(row)])
+                written.extend(tuple(r) for r in cursor.fetchall())
+        else:
+            for row in rows:
+                cursor.execute(statement(1), prep(row))
+                if cursor.rowcount == 1:
+                    written.append((row[0], row[1]))
+    return written
+
+
+def _record(student, session, status, now):
+    if writebehind.enabled():
+        if not writebehind.get_queue().enqueue(student.pk, session, status, now):
+            return MarkResult(ALREADY_MARKED, session)
+        return MarkResult(MARKED, session)
+
+    try:
+        with transaction.atomic():
+            if not insert_marks([(student.pk, session.pk, status, now)]):
+                return MarkResult(ALREADY_MARKED, session)
+            counters.record_marks(session, [student.pk], timezone.localdate(now))
+            live.publish_marks(session.pk, [(student.username, now)])
+    except IntegrityError:
+        # The session was deleted.
+        return MarkResult(INVALID, None)
+
+    return MarkResult(MARKED, session)
+
+
+ROTATING_STATUSES = {
+    rotating.BAD: INVALID,
+    rotating.STALE: ROTATED,
+    rotating.EXPIRED: EXPIRED,
+}
+
+
+def _check_rotating(token):
+    status, session = rotating.verify(token)
+    if status != rotating.VALID:
+        return MarkResult(ROTATING_STATUSES[status], session)
+    return session
+
+
+def _check(session, now):
+    if session is None:
+        return MarkResult(INVALID, None)
+    if now > session.expires_at:
+        return MarkResult(EXPIRED, session)
+    return session
+
+
+def mark(student, token, status="Present"):
+    """Mark ``student`` present in the session identified by ``token``."""
+    now = timezone.now()
+    if rotating.is_rotating(token):
+        checked = _check_rotating(token)
+    else:
+        checked = _check(token_cache.get_session(token), now)
+    if isinstance(checked, MarkResult):
+        return checked
+
+    return _record(student, checked, status, now)
+
+
+async def amark(student, token, status="Present"):
+    """Async ``mark``: validation runs on the event loop; only the write is sent to a thread."""
+    now = timezone.now()
+    if rotating.is_rotating(token):
+        checked = _check_rotating(token)
+    else:
+        checked = _check(await token_cache.aget_session(token), now)
+    if isinstance(checked, MarkResult):
+        return checked
+
+    return await sync_to_async(_record)(student, checked, status, now)
+
+
+def scan_time(scanned_at, now):
+    """When a queued scan counts as made: the phone's clock, but no later than
+    ``now`` and no earlier than the tolerance allows."""
+    if scanned_at is None:
+        return now
+    earliest = now - timedelta(seconds=settings.ATTENDANCE_OFFLINE_SCAN_TOLERANCE_SECONDS)
+    return min(max(scanned_at, earliest), now)
+
+
+def mark_batch(student, scans, status="Present"):
+    """Mark ``student`` for each ``(token, scanned_at)`` in ``scans``; returns a MarkResult per scan.
+
+    A None token stands for unreadable QR data. All new rows are written in
+    one transaction.
+    """
+    now = timezone.now()
+    results = [None] * len(scans)
+    accepted = {}  # session pk -> (index, session, when)
+    for i, (token, scanned_at) in enumerate(scans):
+        if token is None:
+            results[i] = MarkResult(INVALID, None)
+            continue
+        when = scan_time(scanned_at, now)
+        if rotating.is_rotating(token):
+            checked = _check_rotating(token)
+        else:
+            checked = _check(token_cache.get_session(token), when)
+        if isinstance(checked, MarkResult):
+            results[i] = checked
+        elif checked.pk in accepted:
+            results[i] = MarkResult(ALREADY_MARKED, checked)
+        else:
+            accepted[checked.pk] = (i, checked, when)
+
+    if writebehind.enabled():
+        queue = writebehind.get_queue()
+        for i, session, when in accepted.values():
+            results[i] = MarkResult(MARKED if queue.enqueue(student.pk, session, status, when) else ALREADY_MARKED,
+                                    session)
+        return results
+
+    try:
+        with transaction.atomic():
+            written = {session_id for _, session_id in
+                       insert_marks([(student.pk, session.pk, status, when) for _, session, when in accepted.values()])}
+            for i, session, when in accepted.values():
+                if session.pk not in written:
+                    results[i] = MarkResult(ALREADY_MARKED, session)
+                    continue
+                counters.record_marks(session, [student.pk], timezone.localdate(when))
+                live.publish_marks(session.pk, [(student.username, when)])
+                results[i] = MarkResult(MARKED, session)
+    except IntegrityError:
+        # One of the sessions was deleted; record the scans one at a time.
+        for i, session, when in accepted.values():
+            results[i] = _record(student, session, status, when)
+    return results
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    ClassSession = apps.get_model('attendance', 'ClassSession')
+    Attendance = apps.get_model('attendance', 'Attendance')
+    UserCounter = apps.get_model('attendance', 'UserCounter')
+
+    sessions = list(ClassSession.objects.annotate(n=Count('attendance')))
+    for s in sessions:
+        s.present_count = s.n
+    ClassSession.objects.bulk_update(sessions, ['present_count'], batch_size=1000)
+
+    counters = {}
+    for s in sessions:
+        if s.teacher_id is not None:
+            c = counters.setdefault(s.teacher_id, UserCounter(user_id=s.teacher_id))
+            c.sessions_count += 1
+            c.attendance_count += s.n
+    for row in Attendance.objects.values('student').annotate(n=Count('pk')):
+        c = counters.setdefault(row['student'], UserCounter(user_id=row['student']))
+        c.attendance_count += row['n']
+    UserCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_alter_attendance_marked_at_alter_attendance_session_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('sessions_count', models.PositiveIntegerField(default=0)),
+                ('attendance_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='classsession',
+            name='present_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
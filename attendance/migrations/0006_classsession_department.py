@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_department(apps, schema_editor):
+    ClassSession = apps.get_model('attendance', 'ClassSession')
+    CustomUser = apps.get_model('attendance', 'CustomUser')
+    ClassSession.objects.update(
+        department=Subquery(CustomUser.objects.filter(pk=OuterRef('teacher_id')).values('department')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_attendance_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classsession',
+            name='department',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(backfill_department, migrations.RunPython.noop),
+    ]
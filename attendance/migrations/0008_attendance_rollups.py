@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    ClassSession = apps.get_model('attendance', 'ClassSession')
+    Attendance = apps.get_model('attendance', 'Attendance')
+    DailySessionRollup = apps.get_model('attendance', 'DailySessionRollup')
+    DailyStudentRollup = apps.get_model('attendance', 'DailyStudentRollup')
+
+    sessions = Counter()
+    for created_at, teacher_id, department in (ClassSession.objects.exclude(teacher=None)
+                                               .values_list('created_at', 'teacher_id', 'department')
+                                               .iterator(chunk_size=1000)):
+        sessions[(timezone.localdate(created_at), teacher_id, department or '')] += 1
+    DailySessionRollup.objects.bulk_create(
+        [DailySessionRollup(day=d, teacher_id=t, department=dep, sessions=n) for (d, t, dep), n in sessions.items()],
+        batch_size=1000,
+    )
+
+    marks = Counter()
+    for marked_at, student_id, teacher_id in (Attendance.objects.exclude(session__teacher=None)
+                                              .values_list('marked_at', 'student_id', 'session__teacher_id')
+                                              .iterator(chunk_size=1000)):
+        marks[(timezone.localdate(marked_at), student_id, teacher_id)] += 1
+    DailyStudentRollup.objects.bulk_create(
+        [DailyStudentRollup(day=d, student_id=s, teacher_id=t, attended=n) for (d, s, t), n in marks.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0007_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySessionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('department', models.CharField(blank=True, default='', max_length=100)),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('department', 'day', 'teacher'), name='session_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStudentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('student', 'day', 'teacher'), name='student_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
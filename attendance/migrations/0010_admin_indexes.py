@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0009_session_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedattendance',
+            index=models.Index(fields=['marked_at'], name='archived_marked_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['marked_at'], name='attendance_marked_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classsession',
+            index=models.Index(fields=['created_at'], name='session_created_idx'),
+        ),
+    ]
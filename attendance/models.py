@@ -14,8 +14,22 @@ class CustomUser(AbstractUser):
     roll_number = models.CharField(max_length=50, blank=True, null=True)
     subject = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Session rosters: students of one department, listed by username.
+            models.Index(fields=["department", "username"], condition=models.Q(role="student"),
+                         name="student_roster_idx"),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
+
+    def get_session_auth_hash(self):
+        # Users loaded by attendance.auth carry the hash and leave the password
+        # deferred; once the password is loaded or set, it is used instead.
+        if "password" not in self.__dict__ and hasattr(self, "_session_auth_hash"):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
     
 def generate_unique_token():
     return str(uuid.uuid4())    
@@ -30,8 +44,25 @@ class ClassSession(models.Model):
         on_delete=models.CASCADE,
         related_name="sessions",
         null=True,    
-        blank=True
+        blank=True,
+        db_index=False,  # covered by session_teacher_recent_idx
     )
+    # Denormalized number of Attendance rows, maintained by attendance.counters
+    present_count = models.PositiveIntegerField(default=0)
+    # Roster scope (see attendance.roster), copied from the teacher at creation
+    department = models.CharField(max_length=100, blank=True, null=True)
+    # Set by the sweeper (attendance.archive) once the session has expired, and
+    # once its attendance rows have been moved to ArchivedAttendance.
+    closed_at = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["teacher", "-created_at"], name="session_teacher_recent_idx"),
+            models.Index(fields=["expires_at"], name="session_expires_idx"),
+            # Admin date hierarchy.
+            models.Index(fields=["created_at"], name="session_created_idx"),
+        ]
 
     def is_valid(self):
         return timezone.now() <= self.expires_at
@@ -41,14 +72,114 @@ class ClassSession(models.Model):
 
 
 class Attendance(models.Model):
+    PRESENT, ABSENT, LATE, EXCUSED = 'Present', 'Absent', 'Late', 'Excused'
+    STATUS_CHOICES = [(s, s) for s in (PRESENT, ABSENT, LATE, EXCUSED)]
+    # Statuses that count as attending: only these rows are in the counters,
+    # rollups and "present" rosters. Scans write Present; other statuses come
+    # from a teacher's roll call (attendance.rollcall).
+    ATTENDED = (PRESENT, LATE)
+
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, limit_choices_to={'role': 'student'})
     session = models.ForeignKey(ClassSession, on_delete=models.CASCADE)
-    status = models.CharField(max_length=20, default='Present')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PRESENT)
     marked_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('student', 'session')
+        indexes = [
+            models.Index(fields=["student", "-marked_at"], name="attendance_student_recent_idx"),
+            models.Index(fields=["status", "-marked_at"], name="attendance_status_recent_idx"),
+            # Date-range exports and the admin date hierarchy.
+            models.Index(fields=["marked_at"], name="attendance_marked_at_idx"),
+        ]
+
+
+    def __str__(self):
+        return f"{self.student.username} - {self.session.token[:6]} - {self.status}"
+
 
+class ArchivedAttendance(models.Model):
+    """Attendance of past terms, moved out of the hot table by attendance.archive."""
+    student = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="archived_attendance")
+    session = models.ForeignKey(ClassSession, on_delete=models.CASCADE, related_name="archived_attendance")
+    status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES, default=Attendance.PRESENT)
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('student', 'session')
+        indexes = [
+            # archive.archive_horizon and the admin date hierarchy.
+            models.Index(fields=["marked_at"], name="archived_marked_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} - {self.session_id} - {self.status} (archived)"
+
+
+class RollCallAudit(models.Model):
+    """One status change made by a teacher's roll call; ``old_status`` is None when there was no row."""
+    session = models.ForeignKey(ClassSession, on_delete=models.CASCADE, related_name="roll_call_audit")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name="+")
+    old_status = models.CharField(max_length=20, blank=True, null=True)
+    new_status = models.CharField(max_length=20, choices=Attendance.STATUS_CHOICES)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session", "-changed_at"], name="rollcall_session_recent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} {self.student_id}: {self.old_status or '-'} -> {self.new_status}"
+
+
+class UserCounter(models.Model):
+    """Per-user attendance rollups kept in step with writes by attendance.counters.
+
+    For a teacher, ``sessions_count`` is the number of sessions created and
+    ``attendance_count`` the marks received across them; for a student,
+    ``attendance_count`` is the number of sessions attended.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                primary_key=True, related_name="counter")
+    sessions_count = models.PositiveIntegerField(default=0)
+    attendance_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.sessions_count} sessions, {self.attendance_count} marks"
+
+
+class DailySessionRollup(models.Model):
+    """Sessions a teacher opened for a department on one day (see attendance.stats).
+
+    ``department`` is "" for sessions open to every student.
+    """
+    day = models.DateField()
+    teacher = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    department = models.CharField(max_length=100, blank=True, default="")
+    sessions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["department", "day", "teacher"], name="session_rollup_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.teacher_id} {self.department or '*'}: {self.sessions}"
+
+
+class DailyStudentRollup(models.Model):
+    """Sessions of one teacher a student attended on one day (see attendance.stats)."""
+    day = models.DateField()
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    teacher = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    attended = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["student", "day", "teacher"], name="student_rollup_key"),
+        ]
 
     def __str__(self):
-        return f"{self.student.username} - {self.session.token[:6]} - {self.status}"
\ No newline at end of file
+        return f"{self.day} {self.student_id}@{self.teacher_id}: {self.attended}"
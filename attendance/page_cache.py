@@ -0,0 +1,162 @@
+"""
+Per-user caching of the dashboard and teacher_reports pages.
+
+The data behind each page is cached under a key made of generation counters
+kept in the cache, one per scope the page depends on:
+
+* ``user:<id>`` is bumped when that user's own numbers change. That is a
+  session they opened, a mark they made, or a mark in one of their
+  sessions.
+* ``dept:<department>`` is bumped when a session is opened for that
+  department, which changes the rate of every student in it. Sessions opened
+  for no department bump ``dept:``, which every student page includes.
+* ``all`` is bumped when something not tied to one user changes: a profile
+  save (a department move changes rosters), a roster import, an archive
+  sweep or a counter rebuild.
+
+The hooks live in ``attendance.counters``, which every write path already
+goes through, and fire after commit. Bumping a counter strands the old
+entries, which then age out; nothing is deleted. The key also gives the
+page's ETag, so a repeat load with a matching ``If-None-Match`` gets a 304
+before any query runs. A missing counter (evicted, or never set) is seeded
+from the clock, so a reset can never bring back a version used before.
+
+The counters must be shared by every worker: a bump only reaches the cache
+it is made in, and a per-process cache would keep serving the old page on
+the other workers. ``ATTENDANCE_PAGE_CACHE_ALIAS`` is therefore ``off`` (a
+``DummyCache``, so every request builds its page) until it names a shared
+cache such as Redis, and the ``attendance.E002`` check refuses a per-process
+cache under several workers.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+GEN_PREFIX = "attendance:gen:"
+PAGE_PREFIX = "attendance:page:"
+ALL = "all"
+
+
+def _cache():
+    return caches[settings.ATTENDANCE_PAGE_CACHE_ALIAS]
+
+
+def user(user_id):
+    return f"user:{user_id}"
+
+
+def department(name):
+    return f"dept:{name or ''}"
+
+
+def scopes_for(viewer):
+    """Scopes whose changes show up on ``viewer``'s pages."""
+    scopes = [ALL, user(viewer.pk)]
+    if viewer.role == "student":
+        scopes += [department(viewer.department), department(None)]
+    return scopes
+
+
+def version(scopes):
+    cache = _cache()
+    keys = [GEN_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        seeds = {key: time.time_ns() for key in keys if key not in found}
+        for key, seed in seeds.items():
+            cache.add(key, seed, timeout=None)
+        found = {**seeds, **cache.get_many(keys), **found}
+    return ".".join(str(found[key]) for key in keys)
+
+
+async def aversion(scopes):
+    cache = _cache()
+    keys = [GEN_PREFIX + scope for scope in scopes]
+    found = await cache.aget_many(keys)
+    if len(found) < len(keys):
+        seeds = {key: time.time_ns() for key in keys if key not in found}
+        for key, seed in seeds.items():
+            await cache.aadd(key, seed, timeout=None)
+        found = {**seeds, **await cache.aget_many(keys), **found}
+    return ".".join(str(found[key]) for key in keys)
+
+
+def bump(*scopes):
+    cache = _cache()
+    for scope in set(scopes):
+        key = GEN_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_on_commit(*scopes):
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def bump_all():
+    bump_on_commit(ALL)
+
+
+def page_key(name, request, version):
+    """Cache key for ``name`` as ``request.user`` sees it with these query parameters."""
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f"{PAGE_PREFIX}{name}:{request.user.pk}:{version}:{query}"
+
+
+def etag(key):
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def not_modified(request, key):
+    """A 304 for ``request`` if the client already holds this version, else None."""
+    tag = etag(key)
+    if tag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+        _finish(response, tag)
+        return response
+    return None
+
+
+def get_or_build(key, build):
+    data = _cache().get(key)
+    if data is None:
+        data = build()
+        _cache().set(key, data, settings.ATTENDANCE_PAGE_CACHE_SECONDS)
+    return data
+
+
+async def aget_or_build(key, abuild):
+    data = await _cache().aget(key)
+    if data is None:
+        data = await abuild()
+        await _cache().aset(key, data, settings.ATTENDANCE_PAGE_CACHE_SECONDS)
+    return data
+
+
+def finish(response, key):
+    _finish(response, etag(key))
+    return response
+
+
+def _finish(response, tag):
+    response["ETag"] = tag
+    # Per-user content: browsers may keep it but must revalidate every time.
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def _profile_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return  # every login saves last_login; nothing shown depends on it
+    bump_all()
+
+
+post_save.connect(_profile_saved, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,127 @@
+"""
+Page-weight and time-to-interactive budget for the rendered pages.
+
+``report`` parses a page's HTML for the stylesheets, scripts and images it
+loads and sizes each local one the way WhiteNoise would send it: the ``.br``
+copy if collectstatic made one, else the ``.gz``, else the file itself. The
+page's own HTML is counted gzipped. Third-party resources cannot be sized
+here. A third-party script or render-blocking stylesheet fails the budget
+outright, since it costs a DNS lookup and a TLS handshake on a connection
+the page cannot reuse; one loaded off the critical path (the web fonts) is
+only listed.
+
+The time to interactive is a first-visit estimate on a throttled link (the
+defaults are Lighthouse's mobile preset): one round trip per request wave
+plus the transfer time of every byte. It is not a measurement, but it moves
+with what the budget is meant to catch: a CDN script, a render-blocking
+stylesheet or a heavier bundle. ``manage.py check_page_weight`` checks the
+scan page against ``ATTENDANCE_SCAN_PAGE_BUDGET_KB`` and
+``ATTENDANCE_SCAN_PAGE_BUDGET_MS``.
+"""
+import gzip
+import os
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+RTT_MS = 150
+KBPS = 1600
+# TCP plus TLS before the first byte of the page, and again for each new origin.
+HANDSHAKE_RTTS = 2
+
+
+class _Resources(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.found = []  # (kind, url, blocking)
+        self._in_head = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "head":
+            self._in_head = True
+        elif tag == "body":
+            self._in_head = False
+        elif tag == "link" and "stylesheet" in (attrs.get("rel") or "").split() and attrs.get("href"):
+            blocking = attrs.get("media", "all") in ("all", "screen", "")
+            self.found.append(("css", attrs["href"], blocking))
+        elif tag == "script" and attrs.get("src"):
+            blocking = not ({"async", "defer"} & attrs.keys()) and attrs.get("type") != "module"
+            self.found.append(("js", attrs["src"], blocking and self._in_head))
+        elif tag == "img" and attrs.get("src") and attrs.get("loading") != "lazy":
+            self.found.append(("img", attrs["src"], False))
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self._in_head = False
+
+
+def _static_path(url):
+    """Path of the file a local static URL is served from, or None."""
+    path = urlsplit(url).path
+    if not path.startswith(settings.STATIC_URL):
+        return None
+    name = path[len(settings.STATIC_URL):]
+    if settings.STATIC_ROOT:
+        root_path = os.path.join(settings.STATIC_ROOT, name)
+        if os.path.isfile(root_path):
+            return root_path
+    # Not collected yet: the manifest is not written, so the URL still has the source name.
+    return finders.find(name)
+
+
+def _transfer_size(path):
+    for suffix in (".br", ".gz"):
+        if os.path.isfile(path + suffix):
+            return os.path.getsize(path + suffix)
+    return os.path.getsize(path)
+
+
+def report(html, rtt_ms=RTT_MS, kbps=KBPS):
+    parser = _Resources()
+    parser.feed(html)
+    html_bytes = len(gzip.compress(html.encode()))
+    resources, missing, third_party = [], [], set()
+    for kind, url, blocking in parser.found:
+        host = urlsplit(url).netloc
+        if host:
+            if kind == "js" or blocking:
+                third_party.add(host)
+            resources.append({"kind": kind, "url": url, "bytes": None, "blocking": blocking})
+            continue
+        path = _static_path(url)
+        if path is None:
+            missing.append(url)
+        size = None if path is None else _transfer_size(path)
+        resources.append({"kind": kind, "url": url, "bytes": size, "blocking": blocking})
+
+    total = html_bytes + sum(r["bytes"] or 0 for r in resources)
+    # Connect, the page, then one wave for everything it references.
+    round_trips = HANDSHAKE_RTTS + 1 + (1 if resources else 0) + HANDSHAKE_RTTS * len(third_party)
+    return {
+        "html_bytes": html_bytes,
+        "total_bytes": total,
+        "resources": resources,
+        "missing": missing,
+        "third_party_hosts": sorted(third_party),
+        "blocking": [r["url"] for r in resources if r["blocking"]],
+        "tti_ms": round(round_trips * rtt_ms + total * 8 / kbps),
+    }
+
+
+def over_budget(result, budget_kb, budget_ms):
+    """Why ``result`` fails the budget; an empty list when it passes."""
+    problems = []
+    if result["missing"]:
+        problems.append("not built: " + ", ".join(result["missing"]) + " (run `manage.py build_assets`)")
+    if result["third_party_hosts"]:
+        problems.append("third-party resources from " + ", ".join(result["third_party_hosts"]))
+    if result["total_bytes"] > budget_kb * 1024:
+        problems.append(f"{result['total_bytes'] / 1024:.1f} KB transferred, budget {budget_kb} KB")
+    if result["tti_ms"] > budget_ms:
+        problems.append(f"estimated time to interactive {result['tti_ms']} ms, budget {budget_ms} ms")
+    return problems
+
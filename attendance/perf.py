@@ -0,0 +1,239 @@
+"""
+Per-request performance instrumentation.
+
+``PerfMiddleware`` measures every request. It records wall time, the number
+and total time of SQL queries, template rendering time, named spans (QR
+encoding, password hashing) and response size. The figures are folded into
+in-memory histograms keyed by URL name, and with ``ATTENDANCE_SERVER_TIMING``
+on they are also sent in a ``Server-Timing`` header. ``views.metrics`` serves those as Prometheus
+text to staff users, or to scrapers presenting ``ATTENDANCE_METRICS_TOKEN``.
+
+Queries are timed by an ``execute_wrapper`` installed once on each
+connection. It records into the request that is current in a context
+variable. asgiref copies context variables into ``sync_to_async`` threads,
+so async views are measured as well, even though their queries run on
+another thread. A query slower than ``ATTENDANCE_SLOW_QUERY_MS`` is logged to
+``attendance.perf.slow_queries``.
+
+Templates are timed by the ``TimedDjangoTemplates`` backend. Other code
+marks its expensive parts with ``span("name")``.
+
+The histograms are per process. With several workers, each reports its own
+and the Prometheus server sums them.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+slow_query_logger = logging.getLogger("attendance.perf.slow_queries")
+
+# Upper bounds (seconds) of the latency histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar("attendance_perf_request", default=None)
+
+
+class RequestStats:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+
+    def add_query(self, duration):
+        self.queries += 1
+        self.db_time += duration
+
+
+@contextmanager
+def span(name):
+    """Time a block into the current request's ``name`` span (no-op outside a request)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] += time.perf_counter() - start
+
+
+def _record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats = _current.get()
+        if stats is not None:
+            stats.add_query(duration)
+        if duration * 1000 >= settings.ATTENDANCE_SLOW_QUERY_MS:
+            slow_query_logger.warning("%.1f ms on %s: %s", duration * 1000,
+                                      context["connection"].alias, sql)
+
+
+def install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-view aggregates; one instance per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.duration = defaultdict(Histogram)
+        self.db_time = defaultdict(Histogram)
+        self.template_time = defaultdict(Histogram)
+        self.queries = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+        self.responses = defaultdict(int)  # (view, status class)
+
+    def observe(self, view, status, total, stats, size):
+        with self._lock:
+            self.duration[view].observe(total)
+            self.db_time[view].observe(stats.db_time)
+            self.template_time[view].observe(stats.spans.get("tpl", 0.0))
+            self.queries[view] += stats.queries
+            self.response_bytes[view] += size
+            self.responses[(view, f"{status // 100}xx")] += 1
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name, help_text, series in (
+                ("attendance_request_duration_seconds", "Wall time per request.", self.duration),
+                ("attendance_request_db_seconds", "SQL time per request.", self.db_time),
+                ("attendance_request_template_seconds", "Template render time per request.", self.template_time),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for view, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip((*BUCKETS, "+Inf"), hist.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {hist.sum:.6f}')
+                    lines.append(f'{name}_count{{view="{view}"}} {hist.count}')
+
+            for name, help_text, series in (
+                ("attendance_db_queries_total", "SQL queries executed.", self.queries),
+                ("attendance_response_bytes_total", "Response body bytes (non-streaming).", self.response_bytes),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                lines += [f'{name}{{view="{view}"}} {value}' for view, value in sorted(series.items())]
+
+            lines += ["# HELP attendance_responses_total Responses by status class.",
+                      "# TYPE attendance_responses_total counter"]
+            lines += [f'attendance_responses_total{{view="{view}",status="{status}"}} {n}'
+                      for (view, status), n in sorted(self.responses.items())]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _server_timing(total, stats):
+    parts = [f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"']
+    parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sorted(stats.spans.items())]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class PerfMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Covers connections opened before the app registry was ready.
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    def _finish(self, request, response, stats):
+        total = time.perf_counter() - stats.started
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "unresolved"
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view, response.status_code, total, stats, size)
+        if settings.ATTENDANCE_SERVER_TIMING:
+            response["Server-Timing"] = _server_timing(total, stats)
+        return response
+
+
+class _TimedTemplate:
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        with span("tpl"):
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time reported to PerfMiddleware."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
@@ -0,0 +1,102 @@
+"""
+Teacher roll call: set the status of many students in a session at once.
+
+``apply`` validates the request against the whole roster, read with each
+student's current row in one query (``roster.statuses``). It then writes in
+one transaction. It locks the existing rows of the students it changes and
+reads their status again, so a scan that landed since the roster read is
+seen. It inserts rows for students who never scanned with a single
+conflict-tolerant INSERT, the one the marking engine uses; a row a scan
+inserted meanwhile is locked and updated instead. It updates the rest with
+one UPDATE per new status. A ``RollCallAudit`` row for each change goes in
+with the same transaction.
+
+Only rows whose status is in ``Attendance.ATTENDED`` are counted, so the
+counters move just for students who change between attending and not
+attending. Since the old statuses are the locked ones, a concurrent scan is
+never counted twice. A newly attended row counts on the day of its
+``marked_at``, the same day ``stats.rebuild_rollups`` would put it on. The
+cached pages of every changed student, and the teacher's, are expired either
+way, since they show the status itself.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters, live, page_cache, roster
+from .marking import INSERT_BATCH_SIZE, insert_marks
+from .models import Attendance, RollCallAudit
+
+STATUSES = [status for status, _ in Attendance.STATUS_CHOICES]
+
+
+def _locked(session, student_ids):
+    """``{student_id: (status, marked_at)}`` of the existing rows, locked until commit."""
+    rows = (Attendance.objects.select_for_update()
+            .filter(session_id=session.pk, student_id__in=student_ids)
+            .order_by("student_id").values_list("student_id", "status", "marked_at"))
+    return {student_id: (status, marked_at) for student_id, status, marked_at in rows}
+
+
+def apply(session, teacher, changes):
+    """Set ``{student_id: status}`` in ``session``; returns the number of rows changed.
+
+    Raises ValueError, before writing anything, for an unknown status, a
+    student outside the roster or an archived session.
+    """
+    if session.archived_at is not None:
+        raise ValueError("This session's attendance has been archived.")
+    bad = sorted({str(status) for status in changes.values() if status not in STATUSES})
+    if bad:
+        raise ValueError(f"Unknown status: {', '.join(bad)}")
+
+    current = roster.statuses(session)
+    outside = sorted(set(changes) - set(current))
+    if outside:
+        raise ValueError(f"Not on this session's roster: {', '.join(map(str, outside))}")
+    changes = {student_id: status for student_id, status in changes.items() if current[student_id][1] != status}
+    if not changes:
+        return 0
+
+    now = timezone.now()
+    gained, lost = defaultdict(list), []
+    with transaction.atomic():
+        before = _locked(session, changes)
+        missing = [student_id for student_id in changes if student_id not in before]
+        inserted = {student_id for student_id, _ in
+                    insert_marks([(student_id, session.pk, changes[student_id], now) for student_id in missing])}
+        raced = [student_id for student_id in missing if student_id not in inserted]
+        if raced:
+            # Rows a scan inserted after the roster read.
+            before.update(_locked(session, raced))
+        changes = {student_id: status for student_id, status in changes.items()
+                   if student_id in inserted or before[student_id][0] != status}
+
+        by_status = defaultdict(list)
+        for student_id, status in changes.items():
+            if student_id not in inserted:
+                by_status[status].append(student_id)
+        for status, student_ids in by_status.items():
+            Attendance.objects.filter(session_id=session.pk, student_id__in=student_ids).update(status=status)
+        RollCallAudit.objects.bulk_create(
+            [RollCallAudit(session_id=session.pk, student_id=student_id, changed_by=teacher,
+                           old_status=before.get(student_id, (None,))[0], new_status=status, changed_at=now)
+             for student_id, status in changes.items()],
+            batch_size=INSERT_BATCH_SIZE,
+        )
+
+        for student_id, status in changes.items():
+            old_status, marked_at = before.get(student_id, (None, now))
+            was, now_attended = old_status in Attendance.ATTENDED, status in Attendance.ATTENDED
+            if now_attended and not was:
+                gained[timezone.localdate(marked_at)].append((student_id, marked_at))
+            elif was and not now_attended:
+                lost.append((student_id, session.pk, session.teacher_id, marked_at))
+        for day, marks in gained.items():
+            counters.record_marks(session, [student_id for student_id, _ in marks], day)
+            live.publish_marks(session.pk, [(current[student_id][0], marked_at) for student_id, marked_at in marks])
+        if lost:
+            counters.record_unmarks(lost)
+        page_cache.bump_on_commit(*map(page_cache.user, [session.teacher_id, *changes]))
+    return len(changes)
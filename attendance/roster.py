@@ -0,0 +1,80 @@
+"""
+Session rosters: the students expected at a session.
+
+A session's roster is every student in the department the session was
+opened for. ``ClassSession.department`` is copied from the teacher when the
+session is created, so later profile edits do not rewrite old reports. When
+it is blank the roster falls back to all students. A student from outside
+the roster who attended anyway is still listed as present; one whom roll
+call gave another status is left out of the report (but not of
+``statuses``), so the absent total always matches the absent list.
+
+``entries`` LEFT JOINs each student to their attendance row for the session
+(a ``FilteredRelation`` on the live or archive table, whichever holds it), so one query yields present and absent students
+together. A student counts as present when their row has one of
+``Attendance.ATTENDED``; a roster student with no row, or with a roll-call
+status such as Absent or Excused, is listed as absent. ``summary`` counts
+all three totals in a single aggregate over the same join. ``statuses`` is
+the roll-call view of the same join, walk-ins included.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, FilteredRelation, Q
+
+from . import archive
+from .models import Attendance
+
+ALL = "all"
+PRESENT = "present"
+ABSENT = "absent"
+FILTERS = (ALL, PRESENT, ABSENT)
+
+
+def _joined(session, which=ALL, walk_ins=False):
+    # Build one Q so the ORM reuses a single join to the session's marks.
+    marked = Q(mark__isnull=False)
+    attended = Q(mark__status__in=Attendance.ATTENDED)
+    in_roster = Q(department=session.department) if session.department else None
+    if which == PRESENT:
+        q = attended
+    elif which == ABSENT:
+        not_attended = Q(mark__isnull=True) | (marked & ~attended)
+        q = not_attended if in_roster is None else in_roster & not_attended
+    else:
+        q = Q() if in_roster is None else in_roster | (marked if walk_ins else attended)
+
+    relation = archive.marks_relation(session)
+    User = get_user_model()
+    return (
+        User.objects
+        .annotate(mark=FilteredRelation(relation, condition=Q(**{f"{relation}__session_id": session.pk})))
+        .filter(Q(role="student") & q)  # role matches student_roster_idx's condition
+    )
+
+
+def entries(session, which=ALL, walk_ins=False):
+    """Roster students with ``marked_at`` (None when absent), ordered by username.
+
+    ``walk_ins`` also lists outsiders whose row is not an attended status, as roll call needs.
+    """
+    return (
+        _joined(session, which, walk_ins)
+        .annotate(marked_at=F("mark__marked_at"), mark_status=F("mark__status"))
+        .order_by("username")
+        .values("id", "username", "roll_number", "department", "marked_at", "mark_status")
+    )
+
+
+def summary(session):
+    """``{"total", "present", "absent"}`` for the session's roster."""
+    counts = _joined(session).aggregate(
+        total=Count("id"), present=Count("mark__id", filter=Q(mark__status__in=Attendance.ATTENDED)))
+    counts["absent"] = counts["total"] - counts["present"]
+    return counts
+
+
+def statuses(session):
+    """``{student_id: (username, status or None, marked_at or None)}`` for everyone on the roster, in one query."""
+    rows = (_joined(session, walk_ins=True)
+            .annotate(marked_at=F("mark__marked_at"), mark_status=F("mark__status"))
+            .values_list("id", "username", "mark_status", "marked_at"))
+    return {pk: (username, status, marked_at) for pk, username, status, marked_at in rows}
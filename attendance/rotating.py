@@ -0,0 +1,91 @@
+"""
+Rotating QR tokens derived by HMAC.
+
+In rotating mode one ClassSession serves a whole lecture. The code on
+``qr_display.html`` changes every ``ATTENDANCE_ROTATION_SECONDS``, and each token is
+``r.<session>.<teacher>.<expires>.<window>.<mac>``, where ``mac`` is an HMAC
+of the other fields. The HMAC key is the session's secret, itself derived
+from ``SECRET_KEY`` and the session id.
+
+A scan is verified from the token alone, with no database or cache lookup.
+The MAC is compared in constant time, and windows up to
+``ATTENDANCE_ROTATION_SKEW_WINDOWS`` away from the current one are accepted
+to absorb clock skew and scan latency. A screenshot forwarded to someone
+outside the room stops working within a window or two. Since nothing is
+looked up, a token can outlive its session; the marking engine answers
+INVALID when the insert finds the session gone.
+"""
+import base64
+import hashlib
+import hmac
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+from .token_cache import CachedSession
+
+PREFIX = "r."
+
+VALID = "valid"
+BAD = "bad"
+STALE = "stale"
+EXPIRED = "expired"
+
+
+@lru_cache(maxsize=1024)
+def session_secret(session_id):
+    return salted_hmac("attendance.rotating.session", str(session_id), algorithm="sha256").digest()
+
+
+def _mac(session_id, teacher_id, expires, window):
+    message = f"{session_id}.{teacher_id}.{expires}.{window}".encode()
+    digest = hmac.new(session_secret(session_id), message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def current_window(now=None):
+    return int((time.time() if now is None else now) // settings.ATTENDANCE_ROTATION_SECONDS)
+
+
+def seconds_left_in_window(now=None):
+    now = time.time() if now is None else now
+    return settings.ATTENDANCE_ROTATION_SECONDS - (now % settings.ATTENDANCE_ROTATION_SECONDS)
+
+
+def make_token(session, now=None):
+    """Return the token to display for ``session`` right now."""
+    expires = int(session.expires_at.timestamp())
+    window = current_window(now)
+    teacher_id = session.teacher_id or 0
+    return f"{PREFIX}{session.pk}.{teacher_id}.{expires}.{window}.{_mac(session.pk, teacher_id, expires, window)}"
+
+
+def is_rotating(token):
+    return token.startswith(PREFIX)
+
+
+def verify(token, now=None):
+    """Return ``(status, CachedSession or None)`` for a rotating token."""
+    try:
+        session_id, teacher_id, expires, window, mac = token[len(PREFIX):].split(".")
+        session_id, teacher_id, expires, window = int(session_id), int(teacher_id), int(expires), int(window)
+    except ValueError:
+        return BAD, None
+
+    try:
+        # Bytes, since compare_digest refuses non-ASCII str; scanned data can be anything.
+        if not hmac.compare_digest(mac.encode(), _mac(session_id, teacher_id, expires, window).encode()):
+            return BAD, None
+    except UnicodeEncodeError:
+        return BAD, None
+
+    now = time.time() if now is None else now
+    session = CachedSession(session_id, teacher_id or None, datetime.fromtimestamp(expires, tz=timezone.utc))
+    if now > expires:
+        return EXPIRED, session
+    if abs(window - current_window(now)) > settings.ATTENDANCE_ROTATION_SKEW_WINDOWS:
+        return STALE, session
+    return VALID, session
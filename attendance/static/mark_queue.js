@@ -0,0 +1,142 @@
+/*
+ * Offline queue for attendance scans, shared by scan_qr.html and its service
+ * worker (scan_sw.js). A scan is stored in IndexedDB with the time it was
+ * made, then sent to mark_attendance_batch together with anything else still
+ * queued. An item leaves the queue once the server has given its verdict.
+ * A network error or a 5xx keeps everything queued for a later retry. Retries
+ * back off exponentially (with jitter), or are left to Background Sync, so a
+ * congested network gets a few batched requests instead of every phone
+ * retrying every scan. A 401/403 or a redirect to the login page means the
+ * login or CSRF token has expired: the scans stay queued, but retrying stops
+ * (the error has ``loggedOut`` set) until the student logs in again.
+ */
+(function (global) {
+  "use strict";
+
+  const DB_NAME = "smartattend";
+  const MARKS = "marks";
+  const META = "meta";
+  const BATCH_SIZE = 20;
+  const MAX_DELAY_MS = 60000;
+
+  function openDb() {
+    return new Promise((resolve, reject) => {
+      const request = indexedDB.open(DB_NAME, 1);
+      request.onupgradeneeded = () => {
+        request.result.createObjectStore(MARKS, { keyPath: "id" });
+        request.result.createObjectStore(META);
+      };
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  // Runs fn(store) in one transaction; resolves with the result of the request fn returns.
+  function withStore(name, mode, fn) {
+    return openDb().then((db) => new Promise((resolve, reject) => {
+      const tx = db.transaction(name, mode);
+      const request = fn(tx.objectStore(name));
+      tx.oncomplete = () => { db.close(); resolve(request ? request.result : undefined); };
+      tx.onerror = tx.onabort = () => { db.close(); reject(tx.error); };
+    }));
+  }
+
+  function add(token, csrfToken) {
+    const item = {
+      id: Date.now().toString(36) + "-" + Math.random().toString(36).slice(2),
+      token: token,
+      scanned_at: new Date().toISOString(),
+    };
+    // The worker cannot read cookies, so the CSRF token is kept for it.
+    return withStore(META, "readwrite", (store) => store.put(csrfToken || "", "csrftoken"))
+      .then(() => withStore(MARKS, "readwrite", (store) => store.put(item)))
+      .then(() => item);
+  }
+
+  function pending() {
+    return withStore(MARKS, "readonly", (store) => store.getAll());
+  }
+
+  function forget(ids) {
+    return withStore(MARKS, "readwrite", (store) => { ids.forEach((id) => store.delete(id)); });
+  }
+
+  function send(url, batch, csrfToken) {
+    return fetch(url, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken },
+      body: JSON.stringify({ marks: batch }),
+    }).then((response) => {
+      if (response.status === 400) {
+        // The batch itself was refused; resending it would only fail again.
+        return batch.map((item) => ({ id: item.id, ok: false, status: "invalid", msg: "Rejected by the server" }));
+      }
+      const json = (response.headers.get("Content-Type") || "").includes("json");
+      if (response.status === 401 || response.status === 403 || response.redirected || (response.ok && !json)) {
+        const error = new Error("Not logged in (server answered " + response.status + ")");
+        error.loggedOut = true;
+        throw error;
+      }
+      if (!response.ok || !json) {
+        throw new Error("Server answered " + response.status);
+      }
+      return response.json().then((data) => data.results);
+    });
+  }
+
+  let flushing = Promise.resolve();
+
+  // Sends everything queued. Resolves with {id: result} once the queue is empty;
+  // rejects (keeping what is left) on the first batch that could not be delivered.
+  // Flushes run one after another so an item is never sent twice at once.
+  function flush(url) {
+    const next = flushing.catch(() => {}).then(() => sendQueued(url));
+    flushing = next;
+    return next;
+  }
+
+  function sendQueued(url) {
+    return Promise.all([pending(), withStore(META, "readonly", (store) => store.get("csrftoken"))])
+      .then(([items, csrfToken]) => {
+        const decided = {};
+        let chain = Promise.resolve();
+        for (let i = 0; i < items.length; i += BATCH_SIZE) {
+          const batch = items.slice(i, i + BATCH_SIZE);
+          chain = chain
+            .then(() => send(url, batch, csrfToken || ""))
+            .then((results) => {
+              results.forEach((result) => { decided[result.id] = result; });
+              return forget(results.map((result) => result.id));
+            });
+        }
+        return chain.then(() => decided);
+      });
+  }
+
+  let delay = 0;
+  let timer = null;
+
+  // Page-side retry with exponential backoff; one retry is scheduled at a time.
+  // Stops, calling onLoggedOut, once the server says the student is logged out.
+  function retry(url, onResults, onLoggedOut) {
+    if (timer !== null) return;
+    delay = Math.min(delay ? delay * 2 : 2000, MAX_DELAY_MS);
+    timer = setTimeout(() => {
+      timer = null;
+      flush(url).then((decided) => { delay = 0; onResults(decided); }, (err) => {
+        if (!err || !err.loggedOut) return retry(url, onResults, onLoggedOut);
+        delay = 0;
+        if (onLoggedOut) onLoggedOut();
+      });
+    }, delay * (0.5 + Math.random()));
+  }
+
+  global.MarkQueue = {
+    SYNC_TAG: "attendance-marks",
+    add: add,
+    pending: pending,
+    flush: flush,
+    retry: retry,
+  };
+})(self);
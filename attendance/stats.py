@@ -0,0 +1,189 @@
+"""
+Attendance percentages from daily rollups.
+
+A student's rate over a window is the number of sessions they attended
+divided by the sessions held for their roster. A session counts as held for
+a student when it was opened for the student's department, or for no
+department at all. Both figures are read from small per-day tables that
+``attendance.counters`` keeps current as sessions and marks are written. No
+query ever counts raw ``Attendance`` rows.
+
+* ``DailySessionRollup`` (day, teacher, department) holds sessions opened.
+* ``DailyStudentRollup`` (day, student, teacher) holds sessions attended.
+  Marks count toward the day they were made, which keeps the write path
+  free of a session lookup.
+
+Every rate can be narrowed to one teacher or one subject (the teacher's
+subject). ``below_threshold`` answers "who is under 75%?" for the whole
+student body in one query. ``rebuild_rollups`` recomputes both tables from
+the source rows.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import page_cache
+from .models import ArchivedAttendance, Attendance, ClassSession, DailySessionRollup, DailyStudentRollup
+
+
+def record_session(session):
+    if session.teacher_id is None:
+        return
+    key = {
+        "day": timezone.localdate(session.created_at),
+        "teacher_id": session.teacher_id,
+        "department": session.department or "",
+    }
+    if DailySessionRollup.objects.filter(**key).update(sessions=F("sessions") + 1):
+        return
+    DailySessionRollup.objects.bulk_create([DailySessionRollup(**key)], ignore_conflicts=True)
+    DailySessionRollup.objects.filter(**key).update(sessions=F("sessions") + 1)
+
+
+def record_marks(session, student_ids, day=None):
+    """Add one attended session for each of ``student_ids`` (new marks in ``session``)."""
+    if session.teacher_id is None or not student_ids:
+        return
+    day = day or timezone.localdate()
+    rows = DailyStudentRollup.objects.filter(day=day, teacher_id=session.teacher_id, student_id__in=student_ids)
+    if len(student_ids) == 1 and rows.update(attended=F("attended") + 1):
+        return
+    # Make sure every row exists, then increment them all in one statement;
+    # concurrent first writers cannot lose an update this way.
+    DailyStudentRollup.objects.bulk_create(
+        [DailyStudentRollup(day=day, teacher_id=session.teacher_id, student_id=s) for s in student_ids],
+        ignore_conflicts=True,
+    )
+    rows.update(attended=F("attended") + 1)
+
+
+def record_unmarks(per_day):
+    """Remove deleted marks, given as ``{(day, student_id, teacher_id): n}``."""
+    groups = {}
+    for (day, student_id, teacher_id), n in per_day.items():
+        groups.setdefault((day, teacher_id, n), []).append(student_id)
+    # One UPDATE per day, teacher and amount; a roll call is usually just one.
+    for (day, teacher_id, n), student_ids in groups.items():
+        DailyStudentRollup.objects.filter(day=day, teacher_id=teacher_id, student_id__in=student_ids).update(
+            attended=F("attended") - n)
+
+
+def _window(start, end):
+    q = Q()
+    if start:
+        q &= Q(day__gte=start)
+    if end:
+        q &= Q(day__lte=end)
+    return q
+
+
+def _scope(teacher=None, subject=None):
+    q = Q()
+    if teacher is not None:
+        q &= Q(teacher=teacher)
+    if subject:
+        q &= Q(teacher__subject=subject)
+    return q
+
+
+def _held_for(department, window, scope):
+    return Q(department__in=[department or "", ""]) & window & scope
+
+
+def rate(attended, held):
+    return round(100 * attended / held, 1) if held else None
+
+
+def student_rate(student, start=None, end=None, teacher=None, subject=None):
+    """``{"attended", "held", "rate"}`` for one student; ``rate`` is a percentage or None."""
+    window, scope = _window(start, end), _scope(teacher, subject)
+    held = DailySessionRollup.objects.filter(_held_for(student.department, window, scope)).aggregate(
+        n=Coalesce(Sum("sessions"), 0))["n"]
+    attended = DailyStudentRollup.objects.filter(window & scope, student=student).aggregate(
+        n=Coalesce(Sum("attended"), 0))["n"]
+    attended = min(attended, held)  # walk-ins to other departments' sessions don't push past 100%
+    return {"attended": attended, "held": held, "rate": rate(attended, held)}
+
+
+def student_rates_by_subject(student, start=None, end=None):
+    """Per-subject ``{"subject", "attended", "held", "rate"}`` rows for one student."""
+    window = _window(start, end)
+    held = dict(
+        DailySessionRollup.objects.filter(_held_for(student.department, window, Q()))
+        .values_list("teacher__subject").annotate(n=Sum("sessions"))
+    )
+    attended = dict(
+        DailyStudentRollup.objects.filter(window, student=student)
+        .values_list("teacher__subject").annotate(n=Sum("attended"))
+    )
+    return [
+        {"subject": subject or "—", "attended": min(attended.get(subject, 0), n), "held": n,
+         "rate": rate(min(attended.get(subject, 0), n), n)}
+        for subject, n in sorted(held.items(), key=lambda item: item[0] or "")
+    ]
+
+
+def below_threshold(threshold, start=None, end=None, teacher=None, subject=None, department=None):
+    """Students whose rate is under ``threshold`` percent, lowest first.
+
+    Each student is annotated with ``attended``, ``held`` and ``rate``.
+    Students with no sessions held in the window are left out.
+    """
+    window, scope = _window(start, end), _scope(teacher, subject)
+    # Func("SUM") rather than Sum() keeps GROUP BY out of the correlated subqueries.
+    held = Subquery(
+        DailySessionRollup.objects.filter(window & scope, department__in=[OuterRef("department"), ""])
+        .order_by().annotate(total=Func("sessions", function="SUM")).values("total"),
+        output_field=IntegerField(),
+    )
+    attended = Subquery(
+        DailyStudentRollup.objects.filter(window & scope, student=OuterRef("pk"))
+        .order_by().annotate(total=Func("attended", function="SUM")).values("total"),
+        output_field=IntegerField(),
+    )
+
+    students = get_user_model().objects.filter(role="student")
+    if department:
+        students = students.filter(department=department)
+    return (
+        students
+        .annotate(held=Coalesce(held, 0), attended=Coalesce(attended, 0))
+        .filter(held__gt=0, attended__lt=ExpressionWrapper(F("held") * threshold / 100.0, output_field=FloatField()))
+        .annotate(rate=ExpressionWrapper(100.0 * F("attended") / F("held"), output_field=FloatField()))
+        .order_by("rate", "username")
+    )
+
+
+@transaction.atomic
+def rebuild_rollups(batch_size=1000):
+    """Recompute both rollup tables from ClassSession and (live or archived) attendance rows."""
+    sessions = Counter()
+    for created_at, teacher_id, department in (ClassSession.objects.exclude(teacher=None)
+                                               .values_list("created_at", "teacher_id", "department")
+                                               .iterator(chunk_size=batch_size)):
+        sessions[(timezone.localdate(created_at), teacher_id, department or "")] += 1
+
+    marks = Counter()
+    for table in (Attendance, ArchivedAttendance):
+        for marked_at, student_id, teacher_id in (table.objects.exclude(session__teacher=None)
+                                                  .filter(status__in=Attendance.ATTENDED)
+                                                  .values_list("marked_at", "student_id", "session__teacher_id")
+                                                  .iterator(chunk_size=batch_size)):
+            marks[(timezone.localdate(marked_at), student_id, teacher_id)] += 1
+
+    DailySessionRollup.objects.all().delete()
+    DailyStudentRollup.objects.all().delete()
+    DailySessionRollup.objects.bulk_create(
+        [DailySessionRollup(day=d, teacher_id=t, department=dep, sessions=n) for (d, t, dep), n in sessions.items()],
+        batch_size=batch_size,
+    )
+    DailyStudentRollup.objects.bulk_create(
+        [DailyStudentRollup(day=d, student_id=s, teacher_id=t, attended=n) for (d, s, t), n in marks.items()],
+        batch_size=batch_size,
+    )
+    page_cache.bump_all()
+    return len(sessions), len(marks)
@@ -0,0 +1,22 @@
+{% load static %}// Service worker for the scan page: sends queued scans once the phone is back online.
+importScripts("{% static 'mark_queue.js' %}");
+
+self.addEventListener("install", () => self.skipWaiting());
+self.addEventListener("activate", (event) => event.waitUntil(self.clients.claim()));
+
+self.addEventListener("sync", (event) => {
+  if (event.tag !== MarkQueue.SYNC_TAG) return;
+  // A rejection makes the browser retry the sync later, with its own backoff;
+  // a logged-out student is told instead, since retrying cannot help.
+  const notify = (message) => self.clients.matchAll().then((clients) => {
+    clients.forEach((client) => client.postMessage(message));
+  });
+  event.waitUntil(
+    MarkQueue.flush("{% url 'mark_attendance_batch' %}").then(
+      (decided) => notify({ type: "marks-sent", results: decided }),
+      (err) => {
+        if (!err || !err.loggedOut) throw err;
+        return notify({ type: "logged-out" });
+      })
+  );
+});
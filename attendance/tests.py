@@ -1,3 +1,1459 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, auth, checks, counters, export, live, marking, page_weight, perf, qr, rollcall, roster, rotating, stats, token_cache, writebehind
+from .urls import urlpatterns as attendance_urlpatterns, with_async_views
+from .counters import find_drift, rebuild_counters
+from .admin import EstimatedCountPaginator, _estimated_rows
+from .benchmarks import SCENARIOS
+from .forms import StudentSignUpForm
+from .storage import StaticStorage
+from .models import ArchivedAttendance, CustomUser, ClassSession, Attendance, DailyStudentRollup, RollCallAudit, UserCounter
+
+
+# Used via ROOT_URLCONF by the async view tests.
+urlpatterns = with_async_views(attendance_urlpatterns)
+
+
+# Tests of what the pages contain run with the page cache off; within a
+# TestCase the after-commit hooks that expire it never fire.
+no_page_cache = override_settings(ATTENDANCE_PAGE_CACHE_ALIAS="off")
+
+def setUpModule():
+    # The concurrency tests wait on SQLite's write lock on purpose; keep their
+    # slow-query warnings out of the output. assertLogs still sees them.
+    slow = logging.getLogger("attendance.perf.slow_queries")
+    slow.addHandler(logging.NullHandler())
+    slow.propagate = False
+
+
+# Query-count tests load the user from the database on every request.
+no_user_cache = override_settings(ATTENDANCE_USER_CACHE_SECONDS=0)
+
+
+def make_teacher(username="teacher"):
+    return CustomUser.objects.create_user(username=username, password="pass12345", role="teacher",
+                                          department="CS", subject="Algorithms")
+
+
+def make_student(username="student", **extra):
+    extra.setdefault("department", "CS")
+    return CustomUser.objects.create_user(username=username, password="pass12345", role="student", **extra)
+
+
+def make_session(teacher, minutes=5):
+    return ClassSession.objects.create(teacher=teacher, expires_at=timezone.now() + timedelta(minutes=minutes))
+
+
+@no_page_cache
+@no_user_cache
+class TeacherDashboardTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.students = [make_student(f"student{i}") for i in range(3)]
+        self.client.force_login(self.teacher)
+
+    def add_sessions(self, n):
+        for _ in range(n):
+            session = make_session(self.teacher)
+            Attendance.objects.bulk_create(
+                [Attendance(student=s, session=session) for s in self.students]
+            )
+        rebuild_counters()
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("app-dashboard"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        self.add_sessions(2)
+        few, _ = self.dashboard_queries()
+        self.add_sessions(25)
+        many, _ = self.dashboard_queries()
+        self.assertEqual(few, many)
+
+    def test_counts_and_pagination(self):
+        self.add_sessions(25)
+        _, response = self.dashboard_queries()
+        sessions = list(response.context["sessions"])
+        self.assertEqual(len(sessions), 20)
+        self.assertTrue(all(s.present_count == 3 for s in sessions))
+        self.assertEqual(response.context["page_obj"].paginator.num_pages, 2)
+
+    def test_chart_range_window(self):
+        self.add_sessions(2)
+        ClassSession.objects.filter(pk=ClassSession.objects.earliest("created_at").pk).update(
+            created_at=timezone.now() - timedelta(days=60)
+        )
+        response = self.client.get(reverse("app-dashboard"), {"range": "30"})
+        self.assertEqual(response.context["session_counts"], "[3]")
+        response = self.client.get(reverse("app-dashboard"), {"range": "all"})
+        self.assertEqual(response.context["session_counts"], "[3, 3]")
+
+
+@no_page_cache
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.client.force_login(self.teacher)
+        self.client.get(reverse("create_qr"))
+        self.session = ClassSession.objects.get()
+
+    def mark(self, student):
+        self.client.force_login(student)
+        return self.client.post(reverse("mark_attendance_ajax"), {"token": self.session.token})
+
+    def test_counters_follow_marks(self):
+        self.mark(self.student)
+        self.mark(make_student("other"))
+        self.mark(self.student)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 2)
+        self.assertEqual(UserCounter.objects.get(user=self.teacher).sessions_count, 1)
+        self.assertEqual(UserCounter.objects.get(user=self.teacher).attendance_count, 2)
+        self.assertEqual(UserCounter.objects.get(user=self.student).attendance_count, 1)
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse("teacher-reports"))
+        self.assertEqual(response.context["total_attendance"], 2)
+        self.assertEqual(response.context["session_data"][0]["count"], 2)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.mark(self.student)
+        Attendance.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_counters", "--check", stdout=StringIO())
+
+        call_command("rebuild_counters", stdout=StringIO())
+        call_command("rebuild_counters", "--check", stdout=StringIO())
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 0)
+        self.assertEqual(UserCounter.objects.get(user=self.teacher).sessions_count, 1)
+        self.assertFalse(UserCounter.objects.filter(user=self.student).exists())
+
+
+class MarkingEngineTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.session = make_session(self.teacher)
+
+    def test_statuses(self):
+        self.assertEqual(marking.mark(self.student, "x" * 36).status, marking.INVALID)
+        self.assertEqual(marking.mark(self.student, self.session.token).status, marking.MARKED)
+        self.assertEqual(marking.mark(self.student, self.session.token).status, marking.ALREADY_MARKED)
+
+        expired = make_session(self.teacher, minutes=-1)
+        self.assertEqual(marking.mark(self.student, expired.token).status, marking.EXPIRED)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_normalize_token(self):
+        token = self.session.token
+        self.assertEqual(marking.normalize_token(f" https://example.com/mark/{token}/ "), token)
+        self.assertIsNone(marking.normalize_token("short"))
+
+    def test_ajax_view(self):
+        self.client.force_login(self.student)
+        url = reverse("mark_attendance_ajax")
+        response = self.client.post(url, {"token": self.session.token})
+        self.assertEqual(response.json(), {"ok": True, "msg": marking.MESSAGES[marking.MARKED]})
+        response = self.client.post(url, {"token": self.session.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["ok"])
+        response = self.client.post(url, {"token": "y" * 36})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch(self):
+        now = timezone.now()
+        closed = make_session(self.teacher, minutes=-2)  # closed while the phone was offline
+        stale = make_session(self.teacher, minutes=-10)
+        rotated = rotating.make_token(make_session(self.teacher, minutes=90), now.timestamp() - 60)
+        scans = [
+            (self.session.token, None),
+            (self.session.token, now),
+            (closed.token, now - timedelta(minutes=3)),
+            (stale.token, now - timedelta(minutes=11)),  # older than the tolerance allows
+            (rotated, now - timedelta(seconds=60)),  # rotating codes get no offline tolerance
+            ("x" * 36, now),
+            (None, None),
+        ]
+        with self.captureOnCommitCallbacks(), CaptureQueriesContext(connection) as ctx:
+            results = marking.mark_batch(self.student, scans)
+        self.assertEqual([r.status for r in results], [
+            marking.MARKED, marking.ALREADY_MARKED, marking.MARKED, marking.EXPIRED, marking.ROTATED,
+            marking.INVALID, marking.INVALID,
+        ])
+        inserts = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("INSERT")
+                   and "attendance_attendance" in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+        late = Attendance.objects.get(session=closed)
+        self.assertEqual(late.marked_at, now - timedelta(minutes=3))
+        closed.refresh_from_db()
+        self.assertEqual(closed.present_count, 1)
+
+    def test_batch_view(self):
+        self.client.force_login(self.student)
+        url = reverse("mark_attendance_batch")
+        marks = [{"id": "a", "token": f"https://example.com/mark/{self.session.token}/",
+                  "scanned_at": timezone.now().isoformat()},
+                 {"id": "b", "token": 42, "scanned_at": "yesterday"}]
+        response = self.client.post(url, {"marks": marks}, content_type="application/json")
+        self.assertEqual(response.json()["results"], [
+            {"id": "a", "ok": True, "status": marking.MARKED, "msg": marking.MESSAGES[marking.MARKED]},
+            {"id": "b", "ok": False, "status": marking.INVALID, "msg": marking.MESSAGES[marking.INVALID]},
+        ])
+        self.assertEqual(self.client.post(url, {"marks": "nope"}, content_type="application/json").status_code, 400)
+        with override_settings(ATTENDANCE_MARK_BATCH_MAX=1):
+            self.assertEqual(self.client.post(url, {"marks": marks}, content_type="application/json").status_code,
+                             400)
+
+        response = self.client.get(reverse("scan_service_worker"))
+        self.assertEqual(response["Content-Type"], "text/javascript")
+        self.assertContains(response, "importScripts(")
+        self.assertContains(response, url)
+
+        # The queue stops retrying on this redirect (see mark_queue.js) rather than resending forever.
+        self.client.logout()
+        response = self.client.post(url, {"marks": marks}, content_type="application/json")
+        self.assertEqual(response.status_code, 302)
+
+
+class ConcurrentMarkingTests(TransactionTestCase):
+
+    def test_parallel_marks_against_one_session(self):
+        teacher = make_teacher()
+        session = make_session(teacher)
+        students = CustomUser.objects.bulk_create(
+            [CustomUser(username=f"s{i}", role="student") for i in range(150)]
+        )
+        # Every student scans twice, all at once.
+        scans = students * 2
+
+        def scan(student):
+            try:
+                return marking.mark(student, session.token).status
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(scan, scans))
+
+        self.assertEqual(statuses.count(marking.MARKED), len(students))
+        self.assertEqual(statuses.count(marking.ALREADY_MARKED), len(students))
+        self.assertEqual(Attendance.objects.filter(session=session).count(), len(students))
+        session.refresh_from_db()
+        self.assertEqual(session.present_count, len(students))
+
+    def test_deleted_session_is_invalid(self):
+        session = make_session(make_teacher(), minutes=90)
+        token = rotating.make_token(session)
+        ClassSession.objects.filter(pk=session.pk).delete()
+        student = make_student()
+        self.assertEqual(marking.mark(student, token).status, marking.INVALID)
+        results = marking.mark_batch(student, [(token, None), (make_session(make_teacher("other")).token, None)])
+        self.assertEqual([r.status for r in results], [marking.INVALID, marking.MARKED])
+
+
+class TokenCacheTests(TestCase):
+
+    def setUp(self):
+        token_cache.get_backend().clear()
+        token_cache.reset_stats()
+        self.teacher = make_teacher()
+        self.student = make_student()
+
+    def session_queries(self, token):
+        with CaptureQueriesContext(connection) as ctx:
+            status = marking.mark(self.student, token).status
+        selects = [q for q in ctx.captured_queries
+                   if q["sql"].startswith("SELECT") and "attendance_classsession" in q["sql"]]
+        return status, len(selects)
+
+    def test_create_qr_populates_cache(self):
+        self.client.force_login(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("create_qr"))
+        token = ClassSession.objects.get().token
+
+        self.assertEqual(self.session_queries(token), (marking.MARKED, 0))
+        self.assertEqual(token_cache.stats(), {"hits": 1, "misses": 0})
+
+    def test_unknown_and_expired_tokens_are_cached(self):
+        self.assertEqual(self.session_queries("z" * 36), (marking.INVALID, 1))
+        self.assertEqual(self.session_queries("z" * 36), (marking.INVALID, 0))
+
+        expired = make_session(self.teacher, minutes=-1)
+        self.assertEqual(self.session_queries(expired.token), (marking.EXPIRED, 1))
+        self.assertEqual(self.session_queries(expired.token), (marking.EXPIRED, 0))
+        self.assertEqual(token_cache.stats(), {"hits": 2, "misses": 2})
+
+    def test_local_backend_evicts_at_deadline(self):
+        backend = token_cache.LocalMemoryBackend(max_entries=2)
+        backend.set("a", 1, 0)
+        self.assertIsNone(backend.get("a"))
+        for key in "bcd":
+            backend.set(key, key, 60)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("d"), "d")
+
+    @override_settings(ATTENDANCE_TOKEN_CACHE_BACKEND="attendance.token_cache.DjangoCacheBackend")
+    def test_django_cache_backend(self):
+        session = make_session(self.teacher)
+        token_cache.remember(session)
+        self.assertIsInstance(token_cache.get_backend(), token_cache.DjangoCacheBackend)
+        self.assertEqual(self.session_queries(session.token), (marking.MARKED, 0))
+
+
+class WriteBehindTests(TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.queue = writebehind.WriteBehindQueue(self.tmp.name, fsync=False)
+        self.teacher = make_teacher()
+        self.students = [make_student(f"student{i}") for i in range(3)]
+        self.session = make_session(self.teacher)
+
+    @override_settings(ATTENDANCE_WRITE_BEHIND=True)
+    def test_marks_are_queued_then_flushed_in_a_batch(self):
+        with mock.patch.object(writebehind, "_queue", self.queue):
+            statuses = [marking.mark(s, self.session.token).status for s in self.students + self.students[:1]]
+
+        self.assertEqual(statuses, [marking.MARKED] * 3 + [marking.ALREADY_MARKED])
+        self.assertFalse(Attendance.objects.exists())
+        self.assertEqual(len(list(Path(self.tmp.name).glob("*.jsonl"))), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.queue.flush(), 3)
+        inserts = [q for q in ctx.captured_queries
+                   if q["sql"].startswith("INSERT") and "attendance_attendance" in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Attendance.objects.filter(session=self.session).count(), 3)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 3)
+        self.assertEqual(list(Path(self.tmp.name).glob("*.jsonl")), [])
+
+    def test_orphaned_journal_is_replayed_once(self):
+        now = timezone.now() - timedelta(days=1)  # a mark from before the crash
+        for s in self.students:
+            self.queue.enqueue(s.pk, self.session, "Present", now)
+        # Simulate a crash: the segment is left on disk, unlocked and unflushed.
+        self.queue._segment.close(delete=False)
+        self.queue = writebehind.WriteBehindQueue(self.tmp.name, fsync=False)
+
+        call_command("replay_attendance_journal", "--dir", self.tmp.name, stdout=StringIO())
+        self.assertEqual(Attendance.objects.count(), 3)
+        self.assertEqual(Attendance.objects.first().marked_at, now)
+        self.assertEqual(writebehind.replay_orphans(self.tmp.name), 0)
+        self.assertEqual(set(DailyStudentRollup.objects.values_list("day", flat=True)), {timezone.localdate(now)})
+
+    def test_failing_flush_is_retried_then_left_for_replay(self):
+        self.queue.enqueue(self.students[0].pk, self.session, "Present", timezone.now())
+        with mock.patch.object(writebehind, "persist", side_effect=OperationalError("database is down")):
+            for attempt in range(writebehind.MAX_ATTEMPTS - 1):
+                with self.assertRaises(OperationalError):
+                    self.queue.flush()
+                # The same segment is kept and retried, not copied into a new one.
+                self.assertEqual(len(list(Path(self.tmp.name).glob("marks-*.jsonl"))), 1)
+                self.assertEqual(self.queue.pending(), 1)
+            with self.assertRaises(OperationalError):
+                self.queue.flush()
+        self.assertEqual(self.queue.pending(), 0)
+        self.assertEqual(writebehind.replay_orphans(self.tmp.name), 1)
+
+
+class WriteBehindPoisonTests(TransactionTestCase):
+
+    def test_refused_mark_is_quarantined(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        queue = writebehind.WriteBehindQueue(tmp.name, fsync=False)
+        teacher = make_teacher()
+        session, gone = make_session(teacher), make_session(teacher)
+        students = [make_student(f"student{i}") for i in range(4)]
+        for student in students[:3]:
+            queue.enqueue(student.pk, session, "Present", timezone.now())
+        queue.enqueue(students[3].pk, gone, "Present", timezone.now())
+        gone_id = gone.pk
+        ClassSession.objects.filter(pk=gone_id).delete()
+
+        self.assertEqual(queue.flush(), 3)
+        self.assertEqual(list(Path(tmp.name).glob("marks-*.jsonl")), [])
+        dead = writebehind.read_segment(Path(tmp.name) / writebehind.DEAD_LETTER)
+        self.assertEqual([(m.student, m.session) for m in dead], [(students[3].pk, gone_id)])
+
+        # Journals left by a crash are replayed the same way, without stopping the startup.
+        queue.enqueue(students[3].pk, session, "Present", timezone.now())
+        queue.enqueue(students[2].pk, gone, "Present", timezone.now())
+        queue._segment.close(delete=False)
+        self.assertEqual(writebehind.replay_orphans(tmp.name), 1)
+        self.assertEqual(len(writebehind.read_segment(Path(tmp.name) / writebehind.DEAD_LETTER)), 2)
+
+
+@no_page_cache
+@override_settings(ROOT_URLCONF="attendance.tests")
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+
+    async def test_async_scan_flow(self):
+        await self.async_client.aforce_login(self.teacher)
+        response = await self.async_client.get(reverse("create_qr"))
+        self.assertEqual(response.status_code, 200)
+        session = await ClassSession.objects.aget(teacher=self.teacher)
+
+        await self.async_client.aforce_login(self.student)
+        url = reverse("mark_attendance_ajax")
+        response = await self.async_client.post(url, {"token": session.token})
+        self.assertEqual(response.json()["ok"], True)
+        response = await self.async_client.post(url, {"token": session.token})
+        self.assertEqual(response.json()["msg"], marking.MESSAGES[marking.ALREADY_MARKED])
+        self.assertEqual(await Attendance.objects.acount(), 1)
+
+        response = await self.async_client.get(reverse("create_qr"))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_async_dashboard(self):
+        session = await ClassSession.objects.acreate(teacher=self.teacher,
+                                                     expires_at=timezone.now() + timedelta(minutes=5))
+        await marking.amark(self.student, session.token)
+
+        await self.async_client.aforce_login(self.teacher)
+        response = await self.async_client.get(reverse("app-dashboard"))
+        self.assertEqual([s.present_count for s in response.context["sessions"]], [1])
+        self.assertEqual(response.context["session_counts"], "[1]")
+
+        await self.async_client.aforce_login(self.student)
+        response = await self.async_client.get(reverse("app-dashboard"))
+        self.assertEqual(response.context["total_attendance"], 1)
+
+
+class LiveFeedTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.session = make_session(self.teacher)
+
+    def test_hub_fans_out_per_session(self):
+        a, b = live.hub.subscribe(1), live.hub.subscribe(1)
+        other = live.hub.subscribe(2)
+        live.hub.deliver(1, [{"student": "x"}])
+        self.assertEqual(a.get(timeout=0), {"student": "x"})
+        self.assertEqual(b.get(timeout=0), {"student": "x"})
+        self.assertIsNone(other.get(timeout=0))
+        for sub in (a, b, other):
+            live.hub.unsubscribe(sub)
+        self.assertEqual(live.hub.subscriber_count(), 0)
+
+    def test_poll_lists_marks_since(self):
+        self.client.force_login(self.teacher)
+        url = reverse("session-live", args=[self.session.pk])
+        data = self.client.get(url).json()
+        self.assertEqual((data["count"], data["marks"], data["closed"]), (0, [], False))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            marking.mark(self.student, self.session.token)
+        data = self.client.get(url).json()
+        self.assertEqual(data["count"], 1)
+        self.assertEqual([mark["student"] for mark in data["marks"]], ["student"])
+        data = self.client.get(url, {"since": data["marks"][0]["marked_at"]}).json()
+        self.assertEqual(data["marks"], [])
+        self.assertEqual(self.client.get(url, {"since": "2024-13-45T10:00:00"}).status_code, 400)
+
+    def test_notify_payloads_stay_under_the_limit(self):
+        events = [{"student": f"student{i:04d}", "marked_at": timezone.now().isoformat()} for i in range(300)]
+        messages = live.payloads(self.session.pk, events)
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(m.encode()) <= live.MAX_PAYLOAD_BYTES for m in messages))
+        self.assertEqual([e for m in messages for e in json.loads(m)["events"]], events)
+
+    @override_settings(ROOT_URLCONF="attendance.tests")
+    async def test_stream_pushes_marks(self):
+        await self.async_client.aforce_login(self.teacher)
+        response = await self.async_client.get(reverse("session-live", args=[self.session.pk]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        frames = aiter(response.streaming_content)
+        self.assertEqual(await anext(frames), b'event: count\ndata: {"count": 0}\n\n')
+
+        def mark():
+            with self.captureOnCommitCallbacks(execute=True):
+                marking.mark(self.student, self.session.token)
+        await sync_to_async(mark)()
+        frame = (await anext(frames)).decode()
+        self.assertTrue(frame.startswith("event: mark\n"))
+        self.assertIn('"student": "student"', frame)
+        self.assertIn('"count": 1', frame)
+
+        self.assertEqual(live.hub.subscriber_count(self.session.pk), 1)
+        # The ASGI handler cancels the stream when the client goes away.
+        waiting = asyncio.ensure_future(anext(frames))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(live.hub.subscriber_count(self.session.pk), 0)
+
+    def test_live_broker_check(self):
+        with override_settings(ATTENDANCE_ASYNC_VIEWS=True), mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+            self.assertEqual([w.id for w in checks.check_live_broker(None)], ["attendance.W001"])
+            with override_settings(ATTENDANCE_LIVE_BROKER="attendance.live.PostgresBroker"):
+                self.assertEqual(checks.check_live_broker(None), [])
+
+    def test_stream_is_scoped_to_owner(self):
+        self.client.force_login(make_teacher("other"))
+        response = self.client.get(reverse("session-live", args=[self.session.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class QrImageTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.client.force_login(self.teacher)
+        self.client.get(reverse("create_qr"))
+        self.session = ClassSession.objects.get()
+
+    def test_served_with_cache_headers(self):
+        url = reverse("qr_image", args=[self.session.token, "png"])
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response.content, qr.render(self.session.token, "png"))
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse("qr_image", args=[self.session.token, "svg"]))
+        self.assertTrue(response.content.lstrip().startswith(b"<?xml"))
+
+    def test_only_owner_and_known_formats(self):
+        self.assertEqual(self.client.get(reverse("qr_image", args=[self.session.token, "gif"])).status_code, 404)
+        self.client.force_login(make_teacher("other"))
+        self.assertEqual(self.client.get(reverse("qr_image", args=[self.session.token, "png"])).status_code, 404)
+
+
+class RotatingTokenTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.session = make_session(self.teacher, minutes=90)
+
+    def test_verify(self):
+        now = timezone.now().timestamp()
+        token = rotating.make_token(self.session, now)
+        status, cached = rotating.verify(token, now)
+        self.assertEqual(status, rotating.VALID)
+        self.assertEqual((cached.pk, cached.teacher_id), (self.session.pk, self.teacher.pk))
+
+        later = now + settings.ATTENDANCE_ROTATION_SECONDS * (settings.ATTENDANCE_ROTATION_SKEW_WINDOWS + 1)
+        self.assertEqual(rotating.verify(token, later)[0], rotating.STALE)
+        self.assertEqual(rotating.verify(token, now + 91 * 60)[0], rotating.EXPIRED)
+        self.assertEqual(rotating.verify(token[:-2] + "xx", now)[0], rotating.BAD)
+        forged = token.replace(f".{self.teacher.pk}.", ".999.", 1)
+        self.assertEqual(rotating.verify(forged, now)[0], rotating.BAD)
+
+        with override_settings(ATTENDANCE_ROTATION_SKEW_WINDOWS=2):
+            self.assertEqual(rotating.verify(token, later)[0], rotating.VALID)
+        with override_settings(ATTENDANCE_ROTATION_SECONDS=3600):
+            self.assertEqual(rotating.current_window(7200), 2)
+
+    def test_non_ascii_mac_is_bad(self):
+        token = f"r.{self.session.pk}.{self.teacher.pk}.99999999999.1." + "é" * 22
+        self.assertEqual(rotating.verify(token)[0], rotating.BAD)
+        self.assertEqual(rotating.verify(token[:-1] + "\ud800")[0], rotating.BAD)
+        self.client.force_login(self.student)
+        response = self.client.post(reverse("mark_attendance_ajax"), {"token": token})
+        self.assertEqual(response.json(), {"ok": False, "msg": marking.MESSAGES[marking.INVALID]})
+
+    def test_marking(self):
+        token = rotating.make_token(self.session)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(marking.mark(self.student, token).status, marking.MARKED)
+        # Verified from the token alone: no session lookup.
+        self.assertFalse([q for q in ctx.captured_queries if q["sql"].startswith("SELECT")])
+        self.assertEqual(marking.mark(self.student, token).status, marking.ALREADY_MARKED)
+
+        stale = rotating.make_token(self.session, timezone.now().timestamp() - 60)
+        self.assertEqual(marking.mark(make_student("late"), stale).status, marking.ROTATED)
+
+    def test_display_and_refresh_endpoint(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse("create_qr") + "?mode=rotating")
+        self.assertTrue(response.context["rotating"])
+        session = ClassSession.objects.latest("id")
+        self.assertGreater(session.expires_at, timezone.now() + timedelta(minutes=60))
+        self.assertNotContains(response, session.token)
+
+        data = self.client.get(reverse("rotating-token", args=[session.pk])).json()
+        self.assertEqual(rotating.verify(data["token"])[0], rotating.VALID)
+        self.assertEqual(self.client.get(data["image"]).status_code, 200)
+
+        self.client.force_login(make_teacher("other"))
+        self.assertEqual(self.client.get(reverse("rotating-token", args=[session.pk])).status_code, 404)
+        self.assertEqual(self.client.get(data["image"]).status_code, 404)
+
+
+@no_user_cache
+class SessionReportTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.session = make_session(self.teacher)
+        self.session.department = "CS"
+        self.session.save()
+        self.present = [make_student(f"p{i}") for i in range(3)]
+        self.absent = [make_student(f"a{i}") for i in range(2)]
+        make_student("elsewhere", department="EE")
+        walk_in = make_student("walkin", department="EE")
+        for student in self.present + [walk_in]:
+            marking.mark(student, self.session.token)
+        self.client.force_login(self.teacher)
+
+    def test_roster_split(self):
+        self.assertEqual(roster.summary(self.session), {"total": 6, "present": 4, "absent": 2})
+        absent = [row["username"] for row in roster.entries(self.session, roster.ABSENT)]
+        self.assertEqual(absent, ["a0", "a1"])
+        present = [row["username"] for row in roster.entries(self.session, roster.PRESENT)]
+        self.assertEqual(present, ["p0", "p1", "p2", "walkin"])
+
+    def test_view_queries_do_not_grow_with_roster(self):
+        url = reverse("session-report", args=[self.session.pk])
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(20):
+            make_student(f"more{i}")
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url + "?show=absent")
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(response.context["absent_count"], 22)
+        self.assertEqual(len(response.context["students"]), 22)
+
+    def test_paginated_and_owner_only(self):
+        with mock.patch("attendance.views.REPORT_PAGE_SIZE", 4):
+            response = self.client.get(reverse("session-report", args=[self.session.pk]) + "?page=2")
+        self.assertEqual([s["username"] for s in response.context["students"]], ["p2", "walkin"])
+
+        self.client.force_login(make_teacher("other"))
+        response = self.client.get(reverse("session-report", args=[self.session.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class RollCallTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.session = make_session(self.teacher)
+        self.session.department = "CS"
+        self.session.save()
+        self.students = {name: make_student(name) for name in ("p0", "p1", "a0", "a1")}
+        self.students["walkin"] = make_student("walkin", department="EE")
+        self.outsider = make_student("elsewhere", department="EE")
+        for name in ("p0", "p1", "walkin"):
+            marking.mark(self.students[name], self.session.token)
+
+    def ids(self, **statuses):
+        return {self.students[name].pk: status for name, status in statuses.items()}
+
+    def rollups(self):
+        # Unmarks leave zero rows behind; a rebuild doesn't write them.
+        return sorted(DailyStudentRollup.objects.exclude(attended=0)
+                      .values_list("day", "student_id", "teacher_id", "attended"))
+
+    def test_apply(self):
+        changed = rollcall.apply(self.session, self.teacher,
+                                 self.ids(p0="Absent", p1="Present", a0="Late", a1="Excused", walkin="Present"))
+        self.assertEqual(changed, 3)
+        self.assertEqual(roster.summary(self.session), {"total": 5, "present": 3, "absent": 2})
+        absent = {row["username"]: row["mark_status"] for row in roster.entries(self.session, roster.ABSENT)}
+        self.assertEqual(absent, {"p0": "Absent", "a1": "Excused"})
+        self.assertEqual(sorted(RollCallAudit.objects.values_list("student__username", "old_status", "new_status")),
+                         [("a0", None, "Late"), ("a1", None, "Excused"), ("p0", "Present", "Absent")])
+
+        # Counters and rollups moved only for students who changed between attending and not.
+        sessions, users = find_drift()
+        self.assertEqual(sessions, [])
+        # make_session skips record_session, so only attendance_count is comparable.
+        self.assertEqual([u for u in users if u[1]["attendance_count"] != u[2]["attendance_count"]], [])
+        rollups = self.rollups()
+        stats.rebuild_rollups()
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_absent_walk_in_is_listed_and_counted(self):
+        rollcall.apply(self.session, self.teacher, self.ids(walkin="Absent"))
+        counts = roster.summary(self.session)
+        absent = roster.entries(self.session, roster.ABSENT)
+        self.assertEqual(counts, {"total": 4, "present": 2, "absent": 2})
+        self.assertEqual(absent.count(), counts["absent"])
+        self.assertEqual(roster.entries(self.session).count(), counts["total"])
+        self.assertEqual(roster.statuses(self.session)[self.students["walkin"].pk][1], "Absent")
+        # Roll call still shows them so the teacher can undo it.
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse("roll-call", args=[self.session.pk]))
+        self.assertIn("walkin", [row["username"] for row in response.context["students"]])
+
+    def test_scan_after_roster_read_is_counted_once(self):
+        read = roster.statuses
+
+        def read_then_scan(session):
+            statuses = read(session)
+            marking.mark(self.students["a0"], self.session.token)
+            return statuses
+
+        with mock.patch.object(roster, "statuses", read_then_scan):
+            self.assertEqual(rollcall.apply(self.session, self.teacher, self.ids(a0="Late", a1="Present")), 2)
+        self.assertEqual(RollCallAudit.objects.get(student=self.students["a0"]).old_status, "Present")
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 5)
+        self.assertEqual([u for u in find_drift()[1] if u[1]["attendance_count"] != u[2]["attendance_count"]], [])
+
+    def test_one_query_for_the_roster_and_one_write(self):
+        extra = CustomUser.objects.bulk_create(
+            [CustomUser(username=f"s{i}", role="student", department="CS") for i in range(150)])
+        statuses = ["Absent", "Present", "Late"]
+        changes = {student.pk: statuses[i % 3] for i, student in enumerate(extra)}
+        changes.update(self.ids(p0="Excused", a0="Present"))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(rollcall.apply(self.session, self.teacher, changes), 152)
+        queries = [q["sql"] for q in ctx.captured_queries]
+        self.assertEqual(len([q for q in queries if q.startswith("SELECT") and "attendance_customuser" in q]), 1)
+        self.assertEqual(len([q for q in queries if q.startswith("INSERT") and "attendance_attendance" in q]), 1)
+        self.assertEqual(len([q for q in queries if q.startswith("INSERT") and "attendance_rollcallaudit" in q]), 1)
+        # Counters and rollups move in a handful of set-based statements, not one per student.
+        self.assertLessEqual(len([q for q in queries if not q.startswith(("SAVEPOINT", "RELEASE"))]), 15)
+        self.assertEqual(Attendance.objects.filter(session=self.session, status="Absent").count(), 50)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 3 - 1 + 1 + 100)
+        self.assertEqual([u for u in find_drift()[1] if u[1]["attendance_count"] != u[2]["attendance_count"]], [])
+        rollups = self.rollups()
+        stats.rebuild_rollups()
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_rejected_without_writing(self):
+        with self.assertRaisesMessage(ValueError, "Unknown status: Asleep"):
+            rollcall.apply(self.session, self.teacher, self.ids(a0="Present", a1="Asleep"))
+        with self.assertRaisesMessage(ValueError, "Unknown status: {'late': True}"):
+            rollcall.apply(self.session, self.teacher, self.ids(a0={"late": True}))
+        with self.assertRaisesMessage(ValueError, "Not on this session's roster"):
+            rollcall.apply(self.session, self.teacher, {**self.ids(a0="Present"), self.outsider.pk: "Present"})
+        self.assertEqual(Attendance.objects.count(), 3)
+        self.assertFalse(RollCallAudit.objects.exists())
+
+    def test_views(self):
+        url = reverse("roll-call", args=[self.session.pk])
+        self.client.force_login(self.teacher)
+        response = self.client.get(url)
+        self.assertContains(response, f'name="status-{self.students["a0"].pk}"')
+
+        response = self.client.post(url, {"statuses": {str(self.students["a0"].pk): "Late"}},
+                                    content_type="application/json")
+        self.assertEqual(response.json(), {"ok": True, "changed": 1})
+        response = self.client.post(url, {"statuses": {str(self.outsider.pk): "Late"}}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(url, "[]", content_type="application/json").status_code, 400)
+
+        response = self.client.post(url, {f"status-{self.students['a1'].pk}": "Excused",
+                                          f"status-{self.students['p0'].pk}": ""})
+        self.assertRedirects(response, reverse("session-report", args=[self.session.pk]), fetch_redirect_response=False)
+        self.assertContains(self.client.get(response.url), "alert-success")
+        self.assertEqual(Attendance.objects.get(student=self.students["a1"]).status, "Excused")
+        self.assertEqual(Attendance.objects.get(student=self.students["p0"]).status, "Present")
+
+        # What the page's script posts: only the changed selects, in one field.
+        many = {str(self.students[name].pk): "Absent" for name in ("p1", "a0")}
+        with override_settings(DATA_UPLOAD_MAX_NUMBER_FIELDS=2):
+            response = self.client.post(url, {"statuses": json.dumps(many)})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Attendance.objects.get(student=self.students["a0"]).status, "Absent")
+        response = self.client.post(url, {"statuses": "[1]"})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+
+        self.client.force_login(make_teacher("other"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class QueryPlanTests(TestCase):
+    """Each hot query should be served by one of the indexes from 0007."""
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.session = make_session(self.teacher)
+        self.session.department = "CS"
+        self.session.save()
+
+    def assertUsesIndex(self, queryset, index_name):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tiny test tables would otherwise always be scanned sequentially.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_teacher_sessions(self):
+        self.assertUsesIndex(ClassSession.objects.filter(teacher=self.teacher).order_by("-created_at")[:20],
+                             "session_teacher_recent_idx")
+
+    def test_student_records(self):
+        self.assertUsesIndex(Attendance.objects.filter(student=self.student).order_by("-marked_at")[:10],
+                             "attendance_student_recent_idx")
+
+    def test_active_sessions(self):
+        self.assertUsesIndex(ClassSession.objects.filter(expires_at__gt=timezone.now()), "session_expires_idx")
+
+    def test_status_filter(self):
+        self.assertUsesIndex(Attendance.objects.filter(status="Present").order_by("-marked_at"),
+                             "attendance_status_recent_idx")
+
+    def test_roster(self):
+        self.assertUsesIndex(roster.entries(self.session, roster.ABSENT), "student_roster_idx")
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.session = make_session(self.teacher)
+        for i in range(3):
+            marking.mark(make_student(f"s{i}", roll_number=f"R{i}"), self.session.token)
+        other = make_session(make_teacher("other"))
+        marking.mark(make_student("elsewhere"), other.token)
+        self.client.force_login(self.teacher)
+
+    def test_csv_streams_own_sessions(self):
+        response = self.client.get(reverse("export-attendance"))
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ",".join(export.HEADER))
+        self.assertEqual([line.split(",")[4] for line in lines[1:]], ["s0", "s1", "s2"])
+
+        today = timezone.localdate()
+        response = self.client.get(reverse("export-attendance"), {"end": str(today - timedelta(days=1))})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 1)
+
+    def test_xlsx_is_a_workbook(self):
+        response = self.client.get(reverse("export-attendance"), {"format": "xlsx"})
+        book = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        sheet = book.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(sheet.count("<row>"), 4)
+        self.assertIn("<t>R2</t>", sheet)
+
+    def test_command(self):
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / "all.csv"
+            call_command("export_attendance", "--output", str(path), stdout=StringIO())
+            self.assertEqual(len(path.read_text().splitlines()), 5)
+            call_command("export_attendance", "--teacher", "other", "--output", str(path), stdout=StringIO())
+            self.assertEqual(len(path.read_text().splitlines()), 2)
+
+
+@no_page_cache
+class StatsTests(TestCase):
+
+    def setUp(self):
+        algorithms = make_teacher()
+        networks = CustomUser.objects.create_user(username="networks", password="pass12345", role="teacher",
+                                                  department="CS", subject="Networks")
+        self.good = make_student("good")
+        self.poor = make_student("poor")
+        self.ee = make_student("ee", department="EE")
+
+        sessions = [self._session(algorithms, "CS") for _ in range(4)]
+        sessions.append(self._session(networks, "CS"))
+        self._session(algorithms, "EE")
+
+        for session in sessions:
+            marking.mark(self.good, session.token)
+        marking.mark(self.poor, sessions[0].token)
+        self.networks = networks
+
+    def _session(self, teacher, department):
+        session = make_session(teacher)
+        session.department = department
+        session.save()
+        counters.record_session(session)
+        return session
+
+    def assertRates(self):
+        self.assertEqual(stats.student_rate(self.good), {"attended": 5, "held": 5, "rate": 100.0})
+        self.assertEqual(stats.student_rate(self.poor)["rate"], 20.0)
+        self.assertEqual(
+            [(r["subject"], r["rate"]) for r in stats.student_rates_by_subject(self.poor)],
+            [("Algorithms", 25.0), ("Networks", 0.0)],
+        )
+        with self.assertNumQueries(1):
+            low = [(s.username, s.rate) for s in stats.below_threshold(75)]
+        self.assertEqual(low, [("ee", 0.0), ("poor", 20.0)])
+        self.assertEqual([s.username for s in stats.below_threshold(75, teacher=self.networks)], ["poor"])
+
+    def test_incremental_rollups(self):
+        self.assertRates()
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.assertEqual(stats.student_rate(self.good, start=tomorrow)["rate"], None)
+
+    def test_rebuild_matches(self):
+        stats.rebuild_rollups()
+        self.assertRates()
+
+    def test_pages(self):
+        self.client.force_login(self.poor)
+        response = self.client.get(reverse("app-dashboard"))
+        self.assertContains(response, "20.0%")
+        self.client.force_login(self.networks)
+        response = self.client.get(reverse("teacher-reports"))
+        self.assertEqual([s.username for s in response.context["low_attendance"]], ["poor"])
+
+
+class ImportRosterTests(TestCase):
+
+    def _import(self, text, *args):
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / "roster.csv"
+            path.write_text(text)
+            out, err = StringIO(), StringIO()
+            call_command("import_roster", str(path), "--workers", "1", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_is_idempotent(self):
+        roster_csv = (
+            "username,role,email,department,roll_number,subject,password\n"
+            "alice,student,a@example.com,CS,R1,,\n"
+            ",student,,CS,R2,,\n"
+            "prof,teacher,,CS,,Algorithms,s3cret-pass\n"
+            "bad,janitor,,,,,\n"
+        )
+        out, err = self._import(roster_csv)
+        self.assertIn("3 created, 0 updated, 1 skipped", out)
+        self.assertIn("line 5", err)
+
+        alice = CustomUser.objects.get(username="alice")
+        self.assertFalse(alice.has_usable_password())
+        self.assertEqual(CustomUser.objects.get(roll_number="R2").username, "R2")
+        self.assertTrue(CustomUser.objects.get(username="prof").check_password("s3cret-pass"))
+
+        # Roll-number-only rows find the existing account; passwords are kept when not supplied.
+        CustomUser.objects.filter(roll_number="R2").update(username="bob")
+        out, _ = self._import(roster_csv.replace("alice,student,a@example.com,CS", "alice,student,a@example.com,EE")
+                              .replace("Algorithms,s3cret-pass", "Algorithms,"))
+        self.assertIn("0 created, 3 updated", out)
+        self.assertEqual(CustomUser.objects.count(), 3)
+        self.assertEqual(CustomUser.objects.get(username="alice").department, "EE")
+        self.assertTrue(CustomUser.objects.get(username="prof").check_password("s3cret-pass"))
+
+    def test_partial_reimport_keeps_other_columns(self):
+        self._import("username,role,email,first_name,department,subject\n"
+                     "prof,teacher,p@example.com,Ada,CS,Algorithms\n"
+                     "alice,student,a@example.com,Alice,CS,\n")
+        out, _ = self._import("username,department\nprof,EE\nalice,EE\nnewbie,EE\n")
+        self.assertIn("1 created, 2 updated", out)
+        prof = CustomUser.objects.get(username="prof")
+        self.assertEqual((prof.role, prof.email, prof.first_name, prof.department, prof.subject),
+                         ("teacher", "p@example.com", "Ada", "EE", "Algorithms"))
+        self.assertEqual(CustomUser.objects.get(username="newbie").role, "student")
+
+        # A blank role cell keeps the existing role even with a role column.
+        self._import("username,role,email\nprof,,new@example.com\n", "--role", "student")
+        prof.refresh_from_db()
+        self.assertEqual((prof.role, prof.email), ("teacher", "new@example.com"))
+
+    def test_parallel_hashing(self):
+        rows = "".join(f"s{i},CS,R{i},pw-{i}\n" for i in range(6))
+        out, _ = self._import("username,department,roll_number,password\n" + rows, "--batch-size", "4", "--workers", "2")
+        self.assertIn("6 created", out)
+        self.assertTrue(CustomUser.objects.get(username="s5").check_password("pw-5"))
+
+
+class SignupTests(TestCase):
+
+    def test_single_write(self):
+        form = StudentSignUpForm({
+            "username": "new", "email": "n@example.com", "roll_number": "R9", "department": "CS",
+            "password1": "Sturdy-passw0rd", "password2": "Sturdy-passw0rd",
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as ctx:
+            user = form.save()
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len(writes), 1)
+        user.refresh_from_db()
+        self.assertEqual((user.role, user.roll_number, user.department), ("student", "R9", "CS"))
+
+    def test_teacher_signup_view(self):
+        response = self.client.post(reverse("signup_teacher"), {
+            "username": "prof", "email": "", "subject": "Networks", "department": "CS",
+            "password1": "Sturdy-passw0rd", "password2": "Sturdy-passw0rd",
+        })
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+        self.assertEqual(CustomUser.objects.get(username="prof").role, "teacher")
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.students = [make_student(f"s{i}") for i in range(3)]
+        self.old = make_session(self.teacher)
+        self.old.department = "CS"
+        self.old.save()
+        counters.record_session(self.old)
+        for student in self.students[:2]:
+            marking.mark(student, self.old.token)
+        ClassSession.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=400),
+                                                            expires_at=timezone.now() - timedelta(days=400))
+        Attendance.objects.update(marked_at=timezone.now() - timedelta(days=400))
+        self.current = make_session(self.teacher)
+        counters.record_session(self.current)
+        marking.mark(self.students[2], self.current.token)
+
+    def test_sweep_moves_old_terms(self):
+        out = StringIO()
+        call_command("sweep_sessions", stdout=out)
+        self.assertIn("Closed 1 sessions; archived 2 attendance rows from 1 sessions.", out.getvalue())
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(ArchivedAttendance.objects.count(), 2)
+        self.old.refresh_from_db()
+        self.assertIsNotNone(self.old.closed_at)
+        self.assertIsNotNone(self.old.archived_at)
+
+        # Counters still agree with the rows, wherever they live.
+        self.assertEqual(find_drift(), ([], []))
+
+        call_command("sweep_sessions", stdout=out)
+        self.assertIn("Closed 0 sessions; archived 0", out.getvalue())
+
+    def test_reports_read_the_archive(self):
+        archive.sweep()
+        self.old.refresh_from_db()
+        self.assertEqual(roster.summary(self.old), {"total": 3, "present": 2, "absent": 1})
+
+        rows = list(export.attendance_rows(teacher=self.teacher))
+        self.assertEqual([r[4] for r in rows], ["s0", "s1", "s2"])
+        recent = list(export.attendance_rows(teacher=self.teacher, start=timezone.localdate()))
+        self.assertEqual([r[4] for r in recent], ["s2"])
+
+
+class ScanStormTests(TransactionTestCase):
+
+    def test_storm_scenario(self):
+        results = SCENARIOS["storm"](requests=20, concurrency=4)["storm"]
+        self.assertEqual(results["requests"], 20)
+        self.assertEqual(results["errors"], 0)
+        self.assertEqual(results["status_codes"], {"200": 20})
+        self.assertGreater(results["queries_per_request"]["mean"], 0)
+        # The fixture cleans up after itself.
+        self.assertFalse(CustomUser.objects.exists())
+
+
+class DatabaseProfileTests(TransactionTestCase):
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            pragmas = [cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                       for name in ("journal_mode", "synchronous", "busy_timeout")]
+        # synchronous=1 is NORMAL.
+        self.assertEqual(pragmas, ["wal", 1, 5000])
+
+    def test_connect_scenario(self):
+        configured = dict(connections.settings["default"])
+        with mock.patch.dict(connections.settings["default"], CONN_MAX_AGE=60):
+            results = SCENARIOS["db-connect"](requests=12, concurrency=2)
+        self.assertEqual(results["new-connection"]["connects"], 12)
+        self.assertEqual(results["configured"]["connects"], 2)
+        self.assertEqual(connections.settings["default"], configured)
+
+
+@no_page_cache
+@override_settings(ATTENDANCE_SERVER_TIMING=True)
+class PerfMiddlewareTests(TestCase):
+
+    def setUp(self):
+        perf.registry.reset()
+        self.teacher = make_teacher()
+        self.client.force_login(self.teacher)
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get(reverse("app-dashboard"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertEqual(perf.registry.duration["app-dashboard"].count, 1)
+        self.assertGreater(perf.registry.queries["app-dashboard"], 0)
+        self.assertEqual(perf.registry.response_bytes["app-dashboard"], len(response.content))
+
+        with override_settings(ATTENDANCE_SERVER_TIMING=False):
+            self.assertNotIn("Server-Timing", self.client.get(reverse("app-dashboard")))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("app-dashboard"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        with override_settings(ATTENDANCE_METRICS_TOKEN="scrape-me"):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-me")
+        text = response.content.decode()
+        self.assertIn('attendance_request_duration_seconds_count{view="app-dashboard"} 1', text)
+        self.assertIn('attendance_responses_total{view="app-dashboard",status="2xx"} 1', text)
+
+        self.teacher.is_staff = True
+        self.teacher.save(update_fields=["is_staff"])
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    @override_settings(ATTENDANCE_SLOW_QUERY_MS=0)
+    def test_slow_query_log(self):
+        with self.assertLogs("attendance.perf.slow_queries", "WARNING") as logs:
+            self.client.get(reverse("app-dashboard"))
+        self.assertIn("attendance_classsession", "\n".join(logs.output))
+
+    @override_settings(ROOT_URLCONF="attendance.tests")
+    async def test_async_views_are_measured(self):
+        await self.async_client.aforce_login(self.teacher)
+        response = await self.async_client.get(reverse("app-dashboard"))
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "pages": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pages"},
+            "off": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    ATTENDANCE_PAGE_CACHE_ALIAS="pages",
+)
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.student = make_student()
+        self.session = make_session(self.teacher)
+
+    def get(self, user, name="app-dashboard", etag=None):
+        self.client.force_login(user)
+        headers = {"If-None-Match": etag} if etag else {}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(name), headers=headers)
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def test_repeat_load_is_not_modified(self):
+        for name in ("app-dashboard", "teacher-reports"):
+            first, _ = self.get(self.teacher, name)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn("private", first["Cache-Control"])
+
+            response, queries = self.get(self.teacher, name, etag=first["ETag"])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], first["ETag"])
+            self.assertFalse([sql for sql in queries if "attendance_classsession" in sql])
+
+    def test_cached_context_skips_queries(self):
+        _, cold = self.get(self.teacher)
+        response, warm = self.get(self.teacher)
+        self.assertLess(len(warm), len(cold))
+        self.assertEqual([s.pk for s in response.context["sessions"]], [self.session.pk])
+
+    def test_marks_and_sessions_expire_pages(self):
+        teacher_first, _ = self.get(self.teacher)
+        student_first, _ = self.get(self.student)
+        elsewhere = make_student("elsewhere", department="EE")
+        elsewhere_first, _ = self.get(elsewhere)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            marking.mark(self.student, self.session.token)
+        response, _ = self.get(self.teacher, etag=teacher_first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s.present_count for s in response.context["sessions"]], [1])
+        response, _ = self.get(self.student, etag=student_first["ETag"])
+        self.assertEqual(response.context["total_attendance"], 1)
+
+        student_etag = response["ETag"]
+        other = make_teacher("other")
+        with self.captureOnCommitCallbacks(execute=True):
+            session = make_session(other)
+            session.department = "CS"
+            session.save()
+            counters.record_session(session)
+        self.assertEqual(self.get(self.student, etag=student_etag)[0].status_code, 200)
+        self.assertEqual(self.get(elsewhere, etag=elsewhere_first["ETag"])[0].status_code, 304)
+
+    def test_roll_call_expires_pages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            marking.mark(self.student, self.session.token)
+        first, _ = self.get(self.student)
+        # Present to Late changes no counter, but the page shows the status.
+        with self.captureOnCommitCallbacks(execute=True):
+            rollcall.apply(self.session, self.teacher, {self.student.pk: Attendance.LATE})
+        self.assertEqual(self.get(self.student, etag=first["ETag"])[0].status_code, 200)
+
+    def test_shared_cache_check(self):
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+            self.assertEqual([e.id for e in checks.check_shared_caches(None)], ["attendance.E002"])
+            with override_settings(ATTENDANCE_PAGE_CACHE_ALIAS="off"):
+                self.assertEqual(checks.check_shared_caches(None), [])
+
+    def test_profile_change_expires_pages(self):
+        first, _ = self.get(self.teacher, "teacher-reports")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.department = "EE"
+            self.student.save()
+        self.assertEqual(self.get(self.teacher, "teacher-reports", etag=first["ETag"])[0].status_code, 200)
+
+    def test_login_does_not_expire_pages(self):
+        first, _ = self.get(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username="teacher", password="pass12345")
+        response = self.client.get(reverse("app-dashboard"), headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.teacher = make_teacher()
+        self.students = [make_student(f"student{i}") for i in range(3)]
+        self.session = make_session(self.teacher)
+        counters.record_session(self.session)
+        for student in self.students:
+            marking.mark(student, self.session.token)
+        self.admin = CustomUser.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f"admin:attendance_{model}_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for model in ("attendance", "classsession"):
+            _, few = self.changelist(model)
+            session = make_session(make_teacher(f"more-{model}"))
+            marking.mark(self.students[0], session.token)
+            _, many = self.changelist(model)
+            self.assertEqual(few, many, model)
+
+    def test_session_filter_lists_only_the_chosen_session(self):
+        other = make_session(self.teacher)
+        marking.mark(self.students[0], other.token)
+        response, _ = self.changelist("attendance", session=self.session.pk)
+        self.assertEqual(response.context["cl"].result_count, 3)
+        self.assertContains(response, str(self.session))
+        self.assertNotContains(response, f"?session={other.pk}")
+
+    def test_estimated_count_for_big_tables(self):
+        rows = Attendance.objects.order_by("pk")
+        with mock.patch("attendance.admin._estimated_rows", return_value=2_000_000) as estimate:
+            self.assertEqual(EstimatedCountPaginator(rows, 100).count, 2_000_000)
+            self.assertEqual(EstimatedCountPaginator(rows.filter(status="Present"), 100).count, 3)
+        estimate.assert_called_once()
+        with mock.patch("attendance.admin._estimated_rows", return_value=50):
+            self.assertEqual(EstimatedCountPaginator(rows, 100).count, 3)
+
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            self.assertEqual(_estimated_rows(Attendance, "default"), 3)
+
+    def test_delete_keeps_counters_in_step(self):
+        ids = list(Attendance.objects.filter(student__in=self.students[:2]).values_list("pk", flat=True))
+        response = self.client.post(reverse("admin:attendance_attendance_changelist"), {
+            "action": "delete_selected", "_selected_action": ids, "post": "yes",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(find_drift(), ([], []))
+        self.assertEqual(stats.student_rate(self.students[0])["attended"], 0)
+
+    def test_add_and_edit_keep_counters_in_step(self):
+        walkin = make_student("walkin")
+        response = self.client.post(reverse("admin:attendance_attendance_add"), {
+            "student": walkin.pk, "session": self.session.pk, "status": "Late",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(find_drift(), ([], []))
+
+        row = Attendance.objects.get(student=walkin)
+        response = self.client.post(reverse("admin:attendance_attendance_change", args=[row.pk]), {
+            "student": walkin.pk, "session": self.session.pk, "status": "Absent",
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(find_drift(), ([], []))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 3)
+
+    def test_session_actions(self):
+        ClassSession.objects.filter(pk=self.session.pk).update(present_count=7,
+                                                                expires_at=timezone.now() - timedelta(minutes=1))
+        UserCounter.objects.filter(user=self.students[0]).update(attendance_count=5)
+        DailyStudentRollup.objects.filter(student=self.students[0]).delete()
+        url = reverse("admin:attendance_classsession_changelist")
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(url, {"action": "recount_attendance", "_selected_action": [self.session.pk]})
+        # The selected sessions are counted in one grouped query (the rebuild then counts everything).
+        self.assertEqual(len([q for q in ctx.captured_queries
+                              if "COUNT(" in q["sql"] and '"session_id" IN' in q["sql"]]), 1)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.present_count, 3)
+        self.assertEqual(find_drift(), ([], []))
+        self.assertEqual(stats.student_rate(self.students[0])["attended"], 1)
+
+        self.client.post(url, {"action": "archive_attendance", "_selected_action": [self.session.pk]})
+        self.assertEqual(ArchivedAttendance.objects.filter(session=self.session).count(), 3)
+        self.assertFalse(Attendance.objects.exists())
+
+
+# The per-process cache stands in for a shared one.
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db", SESSION_CACHE_ALIAS="default",
+                   ATTENDANCE_USER_CACHE_ALIAS="default")
+class AuthCacheTests(TransactionTestCase):
+
+    def setUp(self):
+        self.student = make_student()
+        self.client.force_login(self.student)
+        self.client.get(reverse("scan_qr_page"))  # warms the user cache
+
+    def scan_page_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("scan_qr_page"))
+        return response, [q["sql"] for q in ctx.captured_queries]
+
+    def test_cached_session_and_user(self):
+        response, queries = self.scan_page_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.wsgi_request.user, self.student)
+        self.assertIn("password", response.wsgi_request.user.get_deferred_fields())
+
+    def test_profile_change_is_picked_up(self):
+        student = CustomUser.objects.get(pk=self.student.pk)
+        student.role = "teacher"
+        student.save()
+        response, queries = self.scan_page_queries()
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(any("attendance_customuser" in sql for sql in queries))
+
+    def test_password_change_ends_other_sessions(self):
+        student = CustomUser.objects.get(pk=self.student.pk)
+        student.set_password("new-pass12345")
+        student.save()
+        response, _ = self.scan_page_queries()
+        self.assertEqual(response.status_code, 302)
+
+    def test_async_miss_fills_cache(self):
+        auth.forget(self.student.pk)
+        backend = auth.CachedModelBackend()
+        self.assertEqual(async_to_sync(backend.aget_user)(self.student.pk), self.student)
+        with self.assertNumQueries(0):
+            self.assertEqual(backend.get_user(self.student.pk), self.student)
+
+    def test_shared_cache_checks(self):
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+            self.assertEqual([e.id for e in checks.check_shared_caches(None)],
+                             ["attendance.E003", "attendance.E004"])
+            with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db",
+                                   ATTENDANCE_USER_CACHE_ALIAS="off"):
+                self.assertEqual(checks.check_shared_caches(None), [])
+
+    def test_auth_scenario(self):
+        results = SCENARIOS["auth"](requests=5)
+        self.assertEqual(results["db-session+db-user"]["auth_queries"], 2)
+        for profile in ("cached_db+cached-user", "signed-cookies+cached-user"):
+            self.assertEqual(results[profile]["errors"], 0)
+            self.assertEqual(results[profile]["auth_queries"], 0)
+
+
+class PageWeightTests(TestCase):
+
+    def setUp(self):
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source, self.root = Path(tmp.name) / "static", Path(tmp.name) / "root"
+        self.root.mkdir()
+        # Stand-ins for what build_assets writes; only their sizes matter.
+        self.write("build/app.css", 40_000, compressed=6_000)
+        self.write("build/vendor/html5-qrcode.min.js", 370_000, compressed=90_000)
+        settings = override_settings(STATICFILES_DIRS=[str(self.source)], STATIC_ROOT=str(self.root))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(make_student())
+
+    def write(self, name, size, compressed=None):
+        path = self.source / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        Path(f"{path}.br").unlink(missing_ok=True)
+        if compressed:
+            Path(f"{path}.br").write_bytes(b"x" * compressed)
+
+    def scan_page(self):
+        return page_weight.report(self.client.get(reverse("scan_qr_page")).content.decode())
+
+    def test_scan_page_loads_nothing_third_party(self):
+        result = self.scan_page()
+        self.assertEqual(result["third_party_hosts"], [])
+        self.assertEqual(result["missing"], [])
+        self.assertEqual(result["blocking"], ["/static/build/app.css"])
+        sizes = {r["url"]: r["bytes"] for r in result["resources"] if r["url"].startswith("/static/build/")}
+        self.assertEqual(sizes, {"/static/build/app.css": 6_000, "/static/build/vendor/html5-qrcode.min.js": 90_000})
+        self.assertEqual(page_weight.over_budget(result, 200, 3000), [])
+
+    def test_over_budget(self):
+        self.write("build/vendor/html5-qrcode.min.js", 500_000)  # shipped without a compressed copy
+        problems = page_weight.over_budget(self.scan_page(), 200, 3000)
+        self.assertEqual(len(problems), 2)
+        self.assertIn("KB transferred", problems[0])
+        self.assertIn("time to interactive", problems[1])
+
+        result = page_weight.report('<html><head><script src="https://unpkg.com/lib.js"></script>'
+                                    '<link rel="stylesheet" href="/static/build/missing.css"></head></html>')
+        self.assertEqual(result["third_party_hosts"], ["unpkg.com"])
+        self.assertEqual(result["blocking"], ["https://unpkg.com/lib.js", "/static/build/missing.css"])
+        problems = page_weight.over_budget(result, 200, 3000)
+        self.assertIn("not built: /static/build/missing.css", problems[0])
+        self.assertIn("unpkg.com", problems[1])
+
+    def test_unbuilt_assets_fail_checks(self):
+        errors = checks.check_built_assets(None)
+        self.assertEqual([e.id for e in errors], ["attendance.E005"])
+        self.assertIn("build/vendor/chart.umd.min.js", errors[0].msg)
+        self.write("build/vendor/chart.umd.min.js", 200_000)
+        self.assertEqual(checks.check_built_assets(None), [])
+
+        collected = StaticStorage()
+        collected.hashed_files = {"build/app.css": "build/app.0123456789ab.css"}
+        self.assertEqual(collected.url("build/app.css"), "/static/build/app.0123456789ab.css")
+        with self.assertRaises(ValueError):
+            collected.url("build/never-built.js")
+        self.assertEqual(StaticStorage().url("build/never-built.js"), "/static/build/never-built.js")
+
+    def test_build_assets_needs_node_modules(self):
+        with override_settings(BASE_DIR=str(self.source)), self.assertRaisesMessage(CommandError, "npm install"):
+            call_command("build_assets", stdout=StringIO())
@@ -0,0 +1,204 @@
+"""
+Cache of ClassSession tokens so scans can be validated without a DB query.
+
+Only a handful of sessions are live at any moment, so every token is cached
+with the session id, teacher id and ``expires_at`` it needs for marking.
+Entries live until the session expires plus ``NEGATIVE_TTL`` so that late
+scans are still answered as "expired" from the cache. Unknown tokens are
+remembered for ``NEGATIVE_TTL`` too, which keeps repeated bad scans off the DB.
+
+The backend is chosen with ``ATTENDANCE_TOKEN_CACHE_BACKEND``. The default,
+``LocalMemoryBackend``, is private to each gunicorn worker.
+``DjangoCacheBackend`` stores entries in a Django cache (``CACHES``) that
+all workers share.
+"""
+import threading
+import time
+from collections import namedtuple, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ClassSession
+
+DEFAULT_BACKEND = "attendance.token_cache.LocalMemoryBackend"
+
+# Seconds to keep unknown tokens, and sessions past their expiry, in the cache.
+NEGATIVE_TTL = 60
+
+CachedSession = namedtuple("CachedSession", ["pk", "teacher_id", "expires_at"])
+
+# Stored for tokens that have no ClassSession.
+UNKNOWN = ()
+
+
+class LocalMemoryBackend:
+    """Per-process dict with deadline-based eviction and a size bound."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            item = self._data.get(token)
+            if item is None:
+                return None
+            value, deadline = item
+            if deadline <= time.monotonic():
+                del self._data[token]
+                return None
+            return value
+
+    def set(self, token, value, timeout):
+        with self._lock:
+            self._data[token] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(token)
+            if len(self._data) > self.max_entries:
+                self._evict()
+
+    async def aget(self, token):
+        return self.get(token)
+
+    async def aset(self, token, value, timeout):
+        self.set(token, value, timeout)
+
+    def delete(self, token):
+        with self._lock:
+            self._data.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        for token in [t for t, (_, deadline) in self._data.items() if deadline <= now]:
+            del self._data[token]
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class DjangoCacheBackend:
+    """Stores entries in a Django cache so every worker shares them."""
+
+    key_prefix = "attendance:token:"
+
+    def __init__(self, alias=None):
+        self.alias = alias or getattr(settings, "ATTENDANCE_TOKEN_CACHE_ALIAS", "default")
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, token):
+        return self.cache.get(self.key_prefix + token)
+
+    def set(self, token, value, timeout):
+        self.cache.set(self.key_prefix + token, value, timeout)
+
+    async def aget(self, token):
+        return await self.cache.aget(self.key_prefix + token)
+
+    async def aset(self, token, value, timeout):
+        await self.cache.aset(self.key_prefix + token, value, timeout)
+
+    def delete(self, token):
+        self.cache.delete(self.key_prefix + token)
+
+
+_backend = None
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings, "ATTENDANCE_TOKEN_CACHE_BACKEND", DEFAULT_BACKEND))()
+    return _backend
+
+
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting in ("ATTENDANCE_TOKEN_CACHE_BACKEND", "ATTENDANCE_TOKEN_CACHE_ALIAS", "CACHES"):
+        _backend = None
+
+
+setting_changed.connect(_reset_backend)
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _timeout(expires_at):
+    return max((expires_at - timezone.now()).total_seconds(), 0) + NEGATIVE_TTL
+
+
+def _entry(session):
+    return tuple(CachedSession(session.pk, session.teacher_id, session.expires_at))
+
+
+def remember(session):
+    """Cache ``session`` until shortly after it expires."""
+    get_backend().set(session.token, _entry(session), _timeout(session.expires_at))
+
+
+async def aremember(session):
+    await get_backend().aset(session.token, _entry(session), _timeout(session.expires_at))
+
+
+def forget(token):
+    get_backend().delete(token)
+
+
+def get_session(token):
+    """Return the CachedSession for ``token``, or None if no session has it."""
+    value = get_backend().get(token)
+    if value is not None:
+        _count("hits")
+        return CachedSession(*value) if value != UNKNOWN else None
+
+    _count("misses")
+    try:
+        session = ClassSession.objects.only("id", "token", "teacher_id", "expires_at").get(token=token)
+    except ClassSession.DoesNotExist:
+        get_backend().set(token, UNKNOWN, NEGATIVE_TTL)
+        return None
+    remember(session)
+    return CachedSession(session.pk, session.teacher_id, session.expires_at)
+
+
+async def aget_session(token):
+    """Async ``get_session`` using the backend's async API and ``aget`` on a miss."""
+    backend = get_backend()
+    value = await backend.aget(token)
+    if value is not None:
+        _count("hits")
+        return CachedSession(*value) if value != UNKNOWN else None
+
+    _count("misses")
+    try:
+        session = await ClassSession.objects.only("id", "token", "teacher_id", "expires_at").aget(token=token)
+    except ClassSession.DoesNotExist:
+        await backend.aset(token, UNKNOWN, NEGATIVE_TTL)
+        return None
+    await aremember(session)
+    return CachedSession(session.pk, session.teacher_id, session.expires_at)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from . import views
 from django.contrib.auth import views as auth_views
@@ -10,10 +11,35 @@ urlpatterns = [
     path('login/', views.user_login, name='login'),
     path('', views.landing, name='landing'),
     path('create-qr/', views.create_qr, name='create_qr'),
+    path('qr/<str:token>.<str:fmt>', views.qr_image, name='qr_image'),
     path('mark/<str:token>/', views.mark_attendance, name='mark_attendance'),
     path('scan/', views.scan_qr_page, name='scan_qr_page'),
+    path('scan/sw.js', views.scan_service_worker, name='scan_service_worker'),
     path('ajax/mark/', views.mark_attendance_ajax, name='mark_attendance_ajax'),
+    path('ajax/mark/batch/', views.mark_attendance_batch, name='mark_attendance_batch'),
     path('logout/', views.logout_user, name='logout'),
+    path('metrics/', views.metrics, name='metrics'),
     path("teacher/reports/", views.teacher_reports, name="teacher-reports"),
+    path("teacher/reports/export/", views.export_attendance, name="export-attendance"),
     path('reports/session/<int:session_id>/', views.session_report, name="session-report"),
+    path('reports/session/<int:session_id>/roll-call/', views.roll_call, name='roll-call'),
+    path('reports/session/<int:session_id>/live/', views.session_live, name="session-live"),
+    path('reports/session/<int:session_id>/rotating-token/', views.rotating_token, name='rotating-token'),
 ]
+
+# Async twins of the hot endpoints, routed instead of the sync views when the
+# app is served by ASGI workers (see gunicorn.conf.py).
+ASYNC_VIEWS = {
+    'app-dashboard': views.dashboard_async,
+    'create_qr': views.create_qr_async,
+    'mark_attendance_ajax': views.mark_attendance_ajax_async,
+    'session-live': views.session_live_async,
+}
+
+
+def with_async_views(patterns):
+    return [path(str(p.pattern), ASYNC_VIEWS.get(p.name, p.callback), name=p.name) for p in patterns]
+
+
+if settings.ATTENDANCE_ASYNC_VIEWS:
+    urlpatterns = with_async_views(urlpatterns)
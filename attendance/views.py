@@ -1,19 +1,25 @@
-import qrcode
-from io import BytesIO
-import base64
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import timedelta
-from .models import ClassSession, Attendance
-from django.shortcuts import render, redirect
+from .models import ClassSession, Attendance, UserCounter
+from . import counters, export, live, marking, page_cache, perf, qr, rollcall, roster, rotating, stats, token_cache
+from django.conf import settings
+from django.urls import reverse
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout, authenticate, login
 from django.contrib import messages
 from django.contrib.auth.models import User
 from .forms import StudentSignUpForm, TeacherSignUpForm
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse, StreamingHttpResponse, Http404
+from django.utils.cache import patch_cache_control
 from .decorators import role_required
 from django.contrib.auth import get_user_model
+import hmac
 import json
+from asgiref.sync import sync_to_async
 
 
 def home(request):
@@ -21,45 +27,142 @@ def home(request):
     return render(request, "attendance/landing.html")
 
 
+DASHBOARD_PAGE_SIZE = 20
+REPORT_PAGE_SIZE = 50
+LOW_ATTENDANCE_LIMIT = 50
+
+# Selectable windows (in days) for the dashboard chart; None means all time.
+CHART_RANGES = {"7": 7, "30": 30, "90": 90, "all": None}
+DEFAULT_CHART_RANGE = "30"
+
+
+def _teacher_sessions(user):
+    # present_count is maintained on write, so one query covers the page
+    return ClassSession.objects.filter(teacher=user).order_by("-created_at")
+
+
+def _chart_range(request):
+    chart_range = request.GET.get("range", DEFAULT_CHART_RANGE)
+    return chart_range if chart_range in CHART_RANGES else DEFAULT_CHART_RANGE
+
+
+def _chart_rows(sessions, chart_range):
+    chart_sessions = sessions.order_by("created_at")
+    days = CHART_RANGES[chart_range]
+    if days is not None:
+        chart_sessions = chart_sessions.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    return chart_sessions.values_list("created_at", "present_count")
+
+
+def _teacher_dashboard_context(page_obj, chart_range, chart_rows):
+    session_labels = [timezone.localtime(created_at).strftime("%b %d, %H:%M") for created_at, _ in chart_rows]
+    session_counts = [count for _, count in chart_rows]
+
+    return {
+        "is_teacher": True,
+        "sessions": page_obj.object_list,
+        "page_obj": page_obj,
+        "records": None,
+        "chart_range": chart_range,
+        "chart_ranges": list(CHART_RANGES),
+        "session_labels": json.dumps(session_labels),
+        "session_counts": json.dumps(session_counts),
+    }
+
+
+def _student_records(user):
+    return Attendance.objects.filter(
+        student=user
+    ).select_related("session").order_by("-marked_at")[:10]
+
+
+# The dashboards cache plain data rather than querysets (see page_cache);
+# the page of sessions is put back into a Paginator without a query.
+def _teacher_dashboard_data(request):
+    sessions = _teacher_sessions(request.user)
+    page_obj = Paginator(sessions, DASHBOARD_PAGE_SIZE).get_page(request.GET.get("page"))
+    chart_range = _chart_range(request)
+    return {
+        "count": page_obj.paginator.count,
+        "number": page_obj.number,
+        "sessions": list(page_obj.object_list),
+        "chart_range": chart_range,
+        "chart_rows": list(_chart_rows(sessions, chart_range)),
+    }
+
+
+async def _ateacher_dashboard_data(request):
+    sessions = _teacher_sessions(request.user)
+    paginator = Paginator(sessions, DASHBOARD_PAGE_SIZE)
+    # Prime the cached count so get_page() doesn't run a sync COUNT.
+    paginator.count = await sessions.acount()
+    page_obj = paginator.get_page(request.GET.get("page"))
+    chart_range = _chart_range(request)
+    return {
+        "count": paginator.count,
+        "number": page_obj.number,
+        "sessions": [s async for s in page_obj.object_list],
+        "chart_range": chart_range,
+        "chart_rows": [row async for row in _chart_rows(sessions, chart_range)],
+    }
+
+
+def _cached_teacher_dashboard_context(data):
+    paginator = Paginator(ClassSession.objects.none(), DASHBOARD_PAGE_SIZE)
+    paginator.count = data["count"]
+    page_obj = paginator.page(data["number"])
+    page_obj.object_list = data["sessions"]
+    return _teacher_dashboard_context(page_obj, data["chart_range"], data["chart_rows"])
+
+
+def _student_dashboard_data(user):
+    counter = UserCounter.objects.filter(user=user).first()
+    return {
+        "is_teacher": False,
+        "records": list(_student_records(user)),
+        "total_attendance": counter.attendance_count if counter else 0,
+        "attendance_rate": stats.student_rate(user),
+        "subject_rates": stats.student_rates_by_subject(user),
+    }
+
+
 @login_required
 def dashboard(request):
-
-    sessions = None
-    records = None
-    session_labels_json = "[]"
-    session_counts_json = "[]"
+    key = page_cache.page_key("dashboard", request, page_cache.version(page_cache.scopes_for(request.user)))
+    not_modified = page_cache.not_modified(request, key)
+    if not_modified:
+        return not_modified
 
     if request.user.role == "teacher":
 
-        sessions = ClassSession.objects.filter(teacher=request.user).order_by("-created_at")
+        data = page_cache.get_or_build(key, lambda: _teacher_dashboard_data(request))
+        context = _cached_teacher_dashboard_context(data)
 
-        session_labels = [f"Session {i+1}" for i in range(len(sessions))]
-        session_counts = [Attendance.objects.filter(session=s).count() for s in sessions]
+    else: 
+        context = page_cache.get_or_build(key, lambda: _student_dashboard_data(request.user))
 
-        # Convert Python lists → JSON strings
-        session_labels_json = json.dumps(session_labels)
-        session_counts_json = json.dumps(session_counts)
+    return page_cache.finish(render(request, "attendance/dashboard.html", context), key)
 
-        for s in sessions:
-            s.count = Attendance.objects.filter(session=s).count()
 
-        return render(request, "attendance/dashboard.html", {
-            "is_teacher": True,
-            "sessions": sessions,
-            "records": records,
-            "session_labels": session_labels_json,
-            "session_counts": session_counts_json,
-        })
+@login_required
+async def dashboard_async(request):
+    user = await request.auser()
+    request.user = user
 
-    else: 
-        records = Attendance.objects.filter(
-            student=request.user
-        ).select_related("session").order_by("-marked_at")[:10]
+    key = page_cache.page_key("dashboard", request, await page_cache.aversion(page_cache.scopes_for(user)))
+    not_modified = page_cache.not_modified(request, key)
+    if not_modified:
+        return not_modified
 
-        return render(request, "attendance/dashboard.html", {
-            "is_teacher": False,
-            "records": records,
-        })
+    if user.role == "teacher":
+
+        data = await page_cache.aget_or_build(key, lambda: _ateacher_dashboard_data(request))
+        context = _cached_teacher_dashboard_context(data)
+
+    else:
+        context = await page_cache.aget_or_build(key, sync_to_async(lambda: _student_dashboard_data(user)))
+
+    return page_cache.finish(render(request, "attendance/dashboard.html", context), key)
 
 
 
@@ -86,38 +189,87 @@ def mark_attendance_ajax(request):
     if request.user.role != 'student':
         return JsonResponse({'ok': False, 'msg': 'Only students can mark attendance'}, status=403)
 
-    token = request.POST.get('token') or request.POST.get('data')
-    if not token:
+    raw = request.POST.get('token') or request.POST.get('data')
+    if not raw:
         return JsonResponse({'ok': False, 'msg': 'No token provided'}, status=400)
 
-    token = token.strip()
+    token = marking.normalize_token(raw)
+    if token is None:
+        return JsonResponse({'ok': False, 'msg': 'Invalid QR data'}, status=400)
 
-    # Extract token from URL if present
-    if "/" in token:
-        token = token.rstrip("/").split("/")[-1]
+    result = marking.mark(request.user, token)
+    return _mark_response(result)
+
+
+@login_required
+@role_required(['student'])
+async def mark_attendance_ajax_async(request):
 
-    # UUID minimum check (36 chars)
-    if len(token) < 20:
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'msg': 'POST required'}, status=405)
+
+    raw = request.POST.get('token') or request.POST.get('data')
+    if not raw:
+        return JsonResponse({'ok': False, 'msg': 'No token provided'}, status=400)
+
+    token = marking.normalize_token(raw)
+    if token is None:
         return JsonResponse({'ok': False, 'msg': 'Invalid QR data'}, status=400)
 
+    result = await marking.amark(request.user, token)
+    return _mark_response(result)
+
+
+def _mark_response(result):
+    status = 200 if result.status in (marking.MARKED, marking.ALREADY_MARKED) else 400
+    return JsonResponse({'ok': result.ok, 'msg': result.message}, status=status)
+
+
+def _scanned_at(value):
     try:
-        session = ClassSession.objects.get(token=token)
-    except ClassSession.DoesNotExist:
-        return JsonResponse({'ok': False, 'msg': 'Invalid or expired QR token'}, status=400)
+        scanned_at = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+    if scanned_at is not None and timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    return scanned_at
 
-    if not session.is_valid():
-        return JsonResponse({'ok': False, 'msg': 'This session has expired'}, status=400)
 
-    if Attendance.objects.filter(student=request.user, session=session).exists():
-        return JsonResponse({'ok': False, 'msg': 'You already marked attendance for this session'}, status=200)
+@login_required
+@role_required(['student'])
+def mark_attendance_batch(request):
+    """Marks queued by the scan page while offline: ``{"marks": [{"id", "token", "scanned_at"}, ...]}``.
+
+    Every mark gets a verdict in ``results``, matched by ``id``; only a
+    malformed request as a whole is an error.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'msg': 'POST required'}, status=405)
+
+    try:
+        marks = json.loads(request.body).get('marks')
+    except (ValueError, AttributeError):
+        marks = None
+    if not isinstance(marks, list) or not all(isinstance(m, dict) for m in marks):
+        return JsonResponse({'ok': False, 'msg': 'Expected {"marks": [...]}'}, status=400)
+    if len(marks) > settings.ATTENDANCE_MARK_BATCH_MAX:
+        return JsonResponse({'ok': False, 'msg': f'At most {settings.ATTENDANCE_MARK_BATCH_MAX} marks per request'},
+                            status=400)
+
+    scans = [(marking.normalize_token(m.get('token') if isinstance(m.get('token'), str) else None),
+              _scanned_at(m.get('scanned_at'))) for m in marks]
+    results = marking.mark_batch(request.user, scans)
+    return JsonResponse({'ok': True, 'results': [
+        {'id': m.get('id'), 'ok': result.ok, 'status': result.status, 'msg': result.message}
+        for m, result in zip(marks, results)
+    ]})
 
-    Attendance.objects.create(
-        student=request.user,
-        session=session,
-        status="Present"
-    )
 
-    return JsonResponse({'ok': True, 'msg': 'Attendance marked successfully!'})
+def scan_service_worker(request):
+    # Served from /scan/ rather than /static/ so that it controls the scan page.
+    response = render(request, 'attendance/scan_sw.js', content_type='text/javascript')
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
 
@@ -144,8 +296,10 @@ def signup_student(request):
     if request.method == "POST":
         form = StudentSignUpForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)
+            with transaction.atomic():
+                with perf.span("hash"):
+                    user = form.save()
+                login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
             messages.success(request, "Student account created successfully.")
             return redirect('login')
     else:
@@ -159,8 +313,10 @@ def signup_teacher(request):
     if request.method == "POST":
         form = TeacherSignUpForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)
+            with transaction.atomic():
+                with perf.span("hash"):
+                    user = form.save()
+                login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
             messages.success(request, "Teacher account created successfully.")
             return redirect("login")
     else:
@@ -176,28 +332,87 @@ def create_qr(request):
         messages.error(request, "Only teachers can generate attendance QR.")
         return redirect("app-dashboard")
 
-    expiry_time = timezone.now() + timedelta(minutes=5)
+    rotating_mode = _rotating_mode(request)
+    expiry_time = timezone.now() + _session_lifetime(rotating_mode)
 
     # Create session
-    new_session = ClassSession.objects.create(
-        teacher=request.user,
-        expires_at=expiry_time
-    )
+    new_session = _create_session(request.user, expiry_time)
 
-    # QR CODE SHOULD ENCODE ONLY THE TOKEN
-    qr_data = new_session.token
+    return render(request, "attendance/qr_display.html", _qr_display_context(new_session, rotating_mode))
 
-    # Generate QR
-    qr_img = qrcode.make(qr_data)
-    buffer = BytesIO()
-    qr_img.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
 
-    return render(request, "attendance/qr_display.html", {
-        "session": new_session,
-        "expiry": expiry_time,
-        "qr_code": qr_base64,
-    })
+@login_required
+@role_required(['teacher'])
+async def create_qr_async(request):
+    rotating_mode = _rotating_mode(request)
+    expiry_time = timezone.now() + _session_lifetime(rotating_mode)
+
+    new_session = await sync_to_async(_create_session)(request.user, expiry_time)
+
+    return render(request, "attendance/qr_display.html", _qr_display_context(new_session, rotating_mode))
+
+
+def _rotating_mode(request):
+    return request.GET.get("mode", settings.ATTENDANCE_QR_MODE) == "rotating"
+
+
+def _session_lifetime(rotating_mode):
+    # A rotating session serves the whole lecture; a static code lasts 5 minutes.
+    if rotating_mode:
+        return timedelta(minutes=settings.ATTENDANCE_ROTATING_SESSION_MINUTES)
+    return timedelta(minutes=5)
+
+
+def _qr_display_context(session, rotating_mode):
+    return {
+        "session": session,
+        "expiry": session.expires_at,
+        "rotating": rotating_mode,
+        "qr_token": rotating.make_token(session) if rotating_mode else session.token,
+        "qr_format": qr.DEFAULT_FORMAT,
+        "refresh_in": rotating.seconds_left_in_window() if rotating_mode else None,
+        # session-live streams only from the async views; sync workers are polled.
+        "live_stream": settings.ATTENDANCE_ASYNC_VIEWS,
+    }
+
+
+def _create_session(teacher, expiry_time):
+    with transaction.atomic():
+        new_session = ClassSession.objects.create(
+            teacher=teacher,
+            expires_at=expiry_time,
+            department=teacher.department,
+        )
+        counters.record_session(new_session)
+        transaction.on_commit(lambda: token_cache.remember(new_session))
+    return new_session
+
+
+@login_required
+@role_required(['teacher'])
+def qr_image(request, token, fmt):
+    if fmt not in qr.FORMATS:
+        raise Http404("Unknown QR format.")
+
+    if rotating.is_rotating(token):
+        status, session = rotating.verify(token)
+        if status == rotating.BAD:
+            session = None
+    else:
+        session = token_cache.get_session(token)
+    if session is None or session.teacher_id != request.user.pk:
+        raise Http404("No such session.")
+
+    # A token's image never changes, so it can be cached until the session expires.
+    etag = f'"{token}.{fmt}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(qr.render(token, fmt), content_type=qr.FORMATS[fmt])
+    response["ETag"] = etag
+    max_age = max(int((session.expires_at - timezone.now()).total_seconds()), 0)
+    patch_cache_control(response, private=True, max_age=max_age, immutable=True)
+    return response
 
 
 @login_required
@@ -206,46 +421,99 @@ def teacher_reports(request):
     if request.user.role != "teacher":
         return redirect("dashboard")
 
-    sessions = ClassSession.objects.filter(teacher=request.user).order_by("-created_at")
+    key = page_cache.page_key("teacher_reports", request, page_cache.version(page_cache.scopes_for(request.user)))
+    not_modified = page_cache.not_modified(request, key)
+    if not_modified:
+        return not_modified
+
+    context = page_cache.get_or_build(key, lambda: _teacher_reports_data(request.user))
+    return page_cache.finish(render(request, "attendance/teacher_reports.html", context), key)
+
 
-    data = []
-    for s in sessions:
-        count = Attendance.objects.filter(session=s).count()
-        data.append({
-            "title": s.title or f"Session {s.id}",
+def _teacher_reports_data(teacher):
+    sessions = ClassSession.objects.filter(teacher=teacher).order_by("-created_at")
+
+    data = [
+        {
+            "title": f"Session {pk}",
             "count": count,
-            "created": s.created_at,
-        })
+            "created": created_at,
+        }
+        for pk, count, created_at in sessions.values_list("pk", "present_count", "created_at")
+    ]
 
-    total_attendance = sum(d["count"] for d in data)
+    counter = UserCounter.objects.filter(user=teacher).first()
+    total_sessions = counter.sessions_count if counter else 0
+    total_attendance = counter.attendance_count if counter else 0
 
-    return render(request, "attendance/teacher_reports.html", {
+    return {
         "session_data": data,
-        "total_sessions": sessions.count(),
+        "total_sessions": total_sessions,
         "total_attendance": total_attendance,
-    })
+        "average_attendance": round(total_attendance / total_sessions, 1) if total_sessions else 0,
+        "low_threshold": settings.ATTENDANCE_LOW_THRESHOLD,
+        "low_attendance": list(stats.below_threshold(settings.ATTENDANCE_LOW_THRESHOLD, teacher=teacher)
+                               .only("username", "roll_number", "department")[:LOW_ATTENDANCE_LIMIT]),
+    }
+
+
+def _date_param(request, name):
+    try:
+        return parse_date(request.GET.get(name) or "")
+    except ValueError:
+        return None
+
+
+def _sync_stream(chunks):
+    """Serve a blocking generator under ASGI one chunk at a time.
+
+    Django's ASGI handler would otherwise drain a sync iterator into a list
+    before sending it. Chunks are pulled on the thread-sensitive executor so a
+    server-side cursor stays on the connection that opened it.
+    """
+    if not settings.ATTENDANCE_ASYNC_VIEWS:
+        return chunks
+
+    async def stream():
+        pull = sync_to_async(next, thread_sensitive=True)
+        while (chunk := await pull(chunks, None)) is not None:
+            yield chunk
+    return stream()
+
+
+@login_required
+@role_required(['teacher'])
+def export_attendance(request):
+    fmt = request.GET.get("format", "csv")
+    if fmt not in export.FORMATS:
+        raise Http404("Unknown export format.")
+    content_type, extension = export.FORMATS[fmt]
+
+    rows = export.attendance_rows(
+        teacher=request.user,
+        department=request.GET.get("department"),
+        start=_date_param(request, "start"),
+        end=_date_param(request, "end"),
+    )
+    response = StreamingHttpResponse(_sync_stream(export.chunks(fmt, rows)), content_type=content_type)
+    filename = f"attendance-{request.user.username}-{timezone.localdate():%Y%m%d}.{extension}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 
 @login_required
 @role_required(['student'])
 def mark_attendance(request, token):
-    try:
-        session = ClassSession.objects.get(token=token)
-    except ClassSession.DoesNotExist:
-        messages.error(request, "Invalid or expired QR code.")
-        return redirect("app-dashboard")
+    result = marking.mark(request.user, token)
 
-    if not session.is_valid():
-        messages.error(request, "This session has expired.")
-        return redirect("app-dashboard")
-
-    already_marked = Attendance.objects.filter(student=request.user, session=session).exists()
-    if already_marked:
+    if result.status == marking.INVALID:
+        messages.error(request, "Invalid or expired QR code.")
+    elif result.status in (marking.EXPIRED, marking.ROTATED):
+        messages.error(request, result.message)
+    elif result.status == marking.ALREADY_MARKED:
         messages.warning(request, "You’ve already marked attendance for this session.")
-        return redirect("app-dashboard")
-
-    Attendance.objects.create(student=request.user, session=session)
-    messages.success(request, "Attendance marked successfully!")
+    else:
+        messages.success(request, "Attendance marked successfully!")
     return redirect("app-dashboard")
 
 
@@ -256,7 +524,8 @@ def user_login(request):
         password = request.POST["password"]
         role = request.POST["role"]
 
-        user = authenticate(request, username=username, password=password)
+        with perf.span("hash"):
+            user = authenticate(request, username=username, password=password)
 
         if user is not None and user.role == role:
             login(request, user)
@@ -272,28 +541,189 @@ def user_login(request):
 @login_required
 @role_required(['teacher'])
 def session_report(request, session_id):
+    session = get_object_or_404(ClassSession, id=session_id, teacher=request.user)
 
-    User = get_user_model()
-
-    session = ClassSession.objects.get(id=session_id)
-    
-    students = User.objects.filter(role='student')
-    attendance = Attendance.objects.filter(session=session)
+    show = request.GET.get("show")
+    if show not in roster.FILTERS:
+        show = roster.ALL
 
-    present_ids = attendance.values_list('student_id', flat=True)
-    present_students = students.filter(id__in=present_ids)
-    absent_students = students.exclude(id__in=present_ids)
+    counts = roster.summary(session)
+    paginator = Paginator(roster.entries(session, show), REPORT_PAGE_SIZE)
+    paginator.count = counts["total" if show == roster.ALL else show]
+    page_obj = paginator.get_page(request.GET.get("page"))
 
     return render(request, "attendance/session_report.html", {
         "session": session,
-        "present_students": present_students,
-        "absent_students": absent_students,
-        "attendance_count": present_students.count(),
-        "total_students": students.count(),
+        "students": page_obj.object_list,
+        "page_obj": page_obj,
+        "show": show,
+        "filters": roster.FILTERS,
+        "attendance_count": counts["present"],
+        "absent_count": counts["absent"],
+        "total_students": counts["total"],
+    })
+
+
+def _roll_call_changes(request, is_json):
+    if is_json:
+        data = json.loads(request.body or b'null')
+        statuses = data.get('statuses') if isinstance(data, dict) else None
+        if not isinstance(statuses, dict):
+            raise ValueError('Expected {"statuses": {student_id: status}}')
+        items = statuses.items()
+    elif request.POST.get('statuses'):
+        # The roll-call page sends the changed selects as one JSON field.
+        statuses = json.loads(request.POST['statuses'])
+        if not isinstance(statuses, dict):
+            raise ValueError('Expected {student_id: status}')
+        items = statuses.items()
+    else:
+        # Without JavaScript: blank selects leave the student as they are.
+        items = [(key[len('status-'):], value) for key, value in request.POST.items()
+                 if key.startswith('status-') and value]
+    return {int(student_id): status for student_id, status in items}
+
+
+@login_required
+@role_required(['teacher'])
+def roll_call(request, session_id):
+    """Set Present/Absent/Late/Excused for the roster; a form page, or JSON ``{"statuses": {id: status}}``."""
+    session = get_object_or_404(ClassSession, id=session_id, teacher=request.user)
+    is_json = request.content_type == 'application/json'
+
+    if request.method == 'POST':
+        try:
+            changed = rollcall.apply(session, request.user, _roll_call_changes(request, is_json))
+        except ValueError as e:
+            if is_json:
+                return JsonResponse({'ok': False, 'msg': str(e)}, status=400)
+            messages.error(request, str(e))
+            return redirect('roll-call', session_id=session.pk)
+        if is_json:
+            return JsonResponse({'ok': True, 'changed': changed})
+        messages.success(request, f"Updated {changed} students.")
+        return redirect('session-report', session_id=session.pk)
+
+    return render(request, 'attendance/roll_call.html', {
+        'session': session,
+        'students': roster.entries(session, walk_ins=True),
+        'statuses': rollcall.STATUSES,
+    })
+
+
+@login_required
+@role_required(['teacher'])
+def rotating_token(request, session_id):
+    session = get_object_or_404(ClassSession.objects.only("id", "teacher_id", "expires_at"),
+                                id=session_id, teacher=request.user)
+    token = rotating.make_token(session)
+    return JsonResponse({
+        "token": token,
+        "image": reverse("qr_image", args=[token, qr.DEFAULT_FORMAT]),
+        "refresh_in": rotating.seconds_left_in_window(),
+        "expired": not session.is_valid(),
+    })
+
+
+# Seconds between keep-alive comments on an idle live stream.
+LIVE_HEARTBEAT_SECONDS = 15
+# Live streams close this long after their session expires.
+LIVE_GRACE = timedelta(minutes=1)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _live_frame(event, snapshot_at, count):
+    # Marks stamped before the snapshot are already in its count.
+    if parse_datetime(event["marked_at"]) > snapshot_at:
+        count += 1
+    return _sse("mark", dict(event, count=count)), count
+
+
+def _live_response(stream):
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# Sync workers answer the QR page's live panel with short polls; holding a
+# stream open would pin a whole worker for the length of the session.
+LIVE_POLL_SECONDS = 5
+LIVE_POLL_MARKS = 100
+
+
+@login_required
+@role_required(['teacher'])
+def session_live(request, session_id):
+    """Present count and marks after ``?since=`` (an ISO time), read from the database."""
+    session = get_object_or_404(ClassSession.objects.only("id", "expires_at", "present_count"),
+                                id=session_id, teacher=request.user)
+    marks = (Attendance.objects.filter(session_id=session.pk, status__in=Attendance.ATTENDED)
+             .order_by("marked_at").values_list("student__username", "marked_at"))
+    try:
+        since = parse_datetime(request.GET.get("since") or "")
+    except ValueError:
+        return JsonResponse({"ok": False, "msg": "Invalid since"}, status=400)
+    if since is not None:
+        marks = marks.filter(marked_at__gt=since)
+    return JsonResponse({
+        "count": session.present_count,
+        "marks": [{"student": username, "marked_at": marked_at.isoformat()}
+                  for username, marked_at in marks[:LIVE_POLL_MARKS]],
+        "closed": timezone.now() >= session.expires_at + LIVE_GRACE,
+        "poll_in": LIVE_POLL_SECONDS,
     })
 
 
+@login_required
+@role_required(['teacher'])
+async def session_live_async(request, session_id):
+    session = await ClassSession.objects.only("id", "expires_at").filter(id=session_id, teacher=request.user).afirst()
+    if session is None:
+        raise Http404("No such session.")
+
+    sub = live.subscribe(session.pk, asynchronous=True)
+    snapshot_at = timezone.now()
+    count = await ClassSession.objects.values_list("present_count", flat=True).aget(pk=session.pk)
+
+    async def stream(count=count):
+        try:
+            yield _sse("count", {"count": count})
+            while timezone.now() < session.expires_at + LIVE_GRACE:
+                event = await sub.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                if event is None:
+                    # Catch up on marks another worker's in-process broker never delivered here.
+                    stored = await ClassSession.objects.values_list("present_count", flat=True).aget(pk=session.pk)
+                    if stored != count:
+                        count = stored
+                        yield _sse("count", {"count": count})
+                    else:
+                        yield ": ping\n\n"
+                    continue
+                frame, count = _live_frame(event, snapshot_at, count)
+                yield frame
+            yield _sse("closed", {"count": count})
+        finally:
+            live.hub.unsubscribe(sub)
+
+    return _live_response(stream())
+
 
 def logout_user(request):
     logout(request)
-    return redirect('login')
\ No newline at end of file
+    return redirect('login')
+
+
+def metrics(request):
+    """Prometheus text for staff users, or for scrapers sending ATTENDANCE_METRICS_TOKEN."""
+    token = settings.ATTENDANCE_METRICS_TOKEN
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    allowed = (token and hmac.compare_digest(supplied, token)) or (
+        request.user.is_authenticated and request.user.is_staff
+    )
+    if not allowed:
+        return HttpResponseForbidden("Metrics are restricted.")
+    return HttpResponse(perf.registry.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
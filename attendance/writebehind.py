@@ -0,0 +1,307 @@
+"""
+Optional write-behind queue for attendance marks.
+
+With ``ATTENDANCE_WRITE_BEHIND`` enabled, ``marking.mark`` validates the token
+and dedupes the scan in memory. It then appends the mark to a local journal
+and returns without waiting for the database. A background thread persists
+queued marks in batches, either every ``ATTENDANCE_WRITE_BEHIND_INTERVAL_MS``
+milliseconds or as soon as ``ATTENDANCE_WRITE_BEHIND_BATCH`` marks are waiting.
+
+Each process writes its own journal segments in ``ATTENDANCE_WRITE_BEHIND_DIR``
+and holds a lock on them. A segment is deleted only after its batch has been
+committed. Segments left behind by a crashed process are unlocked, and
+``replay_orphans`` replays them when a queue starts. The
+``replay_attendance_journal`` command can also replay them offline. Replaying
+is idempotent because inserts skip existing (student, session) pairs.
+
+A batch the database refuses is split in halves until the rows that fail
+on their own are found. Those rows, such as a mark for a session deleted
+meanwhile, go to ``dead-letter.jsonl`` with a log line instead of blocking
+the rest. Other failures (the database being down) are retried with
+exponential backoff. After ``MAX_ATTEMPTS`` the marks are left in their
+journal segments for ``replay_attendance_journal``.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, live, marking
+from .models import CustomUser
+from .token_cache import CachedSession
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+QueuedMark = namedtuple("QueuedMark", ["student", "session", "teacher", "status", "marked_at"])
+
+# How long past a session's expiry its in-memory dedupe set is kept.
+SEEN_GRACE_SECONDS = 60
+# Failed flushes of one batch before it is left to offline replay, and the
+# longest wait between them.
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 30
+DEAD_LETTER = "dead-letter.jsonl"
+
+
+def enabled():
+    return getattr(settings, "ATTENDANCE_WRITE_BEHIND", False)
+
+
+def persist(marks):
+    """Write ``marks`` in one transaction and update counters for the rows that were new."""
+    if not marks:
+        return 0
+    teachers = {m.session: m.teacher for m in marks}
+    with transaction.atomic():
+        written = marking.insert_marks([(m.student, m.session, m.status, m.marked_at) for m in marks])
+        by_session = {}
+        for student_id, session_id in written:
+            by_session.setdefault(session_id, []).append(student_id)
+        usernames = dict(CustomUser.objects.filter(pk__in={s for s, _ in written}).values_list("pk", "username"))
+        marked_at = {(m.student, m.session): m.marked_at for m in marks}
+        for session_id, student_ids in by_session.items():
+            # Replayed and late marks count on the day they were made.
+            by_day = {}
+            for s in student_ids:
+                by_day.setdefault(timezone.localdate(marked_at[(s, session_id)]), []).append(s)
+            for day, day_ids in by_day.items():
+                counters.record_marks(CachedSession(session_id, teachers[session_id], None), day_ids, day)
+            live.publish_marks(session_id, [(usernames[s], marked_at[(s, session_id)]) for s in student_ids])
+    return len(written)
+
+
+def _encode(mark):
+    return json.dumps(mark._replace(marked_at=mark.marked_at.isoformat())._asdict()) + "\n"
+
+
+def persist_or_quarantine(marks, directory):
+    """``persist``, moving the marks that fail on their own to the dead-letter file.
+
+    Errors other than a refused row are raised for the caller to retry.
+    """
+    try:
+        return persist(marks)
+    except (IntegrityError, DataError):
+        if len(marks) > 1:
+            half = len(marks) // 2
+            return (persist_or_quarantine(marks[:half], directory)
+                    + persist_or_quarantine(marks[half:], directory))
+        logger.exception("Write-behind mark refused by the database, moved to %s: %s", DEAD_LETTER, marks[0])
+        with open(Path(directory) / DEAD_LETTER, "a", encoding="utf-8") as f:
+            f.write(_encode(marks[0]))
+        return 0
+
+
+class _Segment:
+    """An append-only journal file owned (and locked) by this process."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.file = open(path, "a", encoding="utf-8")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def append(self, mark):
+        self.file.write(_encode(mark))
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self, delete):
+        self.file.close()  # also releases the lock
+        if delete:
+            self.path.unlink(missing_ok=True)
+
+
+def read_segment(path):
+    marks = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; the mark never returned OK.
+                continue
+            record["marked_at"] = parse_datetime(record["marked_at"])
+            marks.append(QueuedMark(**record))
+    return marks
+
+
+def replay_orphans(directory):
+    """Persist and delete journal segments no live process holds a lock on."""
+    replayed = 0
+    for path in sorted(Path(directory).glob("marks-*.jsonl")):
+        with open(path, "a+", encoding="utf-8") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # owned by a running worker
+            marks = read_segment(path)
+            replayed += persist_or_quarantine(marks, directory)
+            path.unlink()
+            logger.info("Replayed %d queued marks from %s", len(marks), path)
+    return replayed
+
+
+class WriteBehindQueue:
+
+    def __init__(self, directory, batch_size=200, interval=0.05, fsync=True):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._buffer = []
+        self._seen = {}
+        self._segment_no = 0
+        self._segment = None
+        # Segments of the batch being retried, and how often it has failed.
+        self._held = []
+        self._failures = 0
+        self._thread = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _open_segment(self):
+        self._segment_no += 1
+        path = self.directory / f"marks-{os.getpid()}-{int(time.time())}-{self._segment_no}.jsonl"
+        return _Segment(path, fsync=self.fsync)
+
+    def start(self):
+        try:
+            replay_orphans(self.directory)
+        except Exception:
+            # Serve scans anyway; the segments stay for replay_attendance_journal.
+            logger.exception("Replaying write-behind journals in %s failed", self.directory)
+        self._thread = threading.Thread(target=self._run, name="attendance-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def enqueue(self, student_id, session, status, marked_at):
+        """Queue a mark; return False if this student was already queued for the session."""
+        with self._lock:
+            expires_at, students = self._seen.setdefault(session.pk, (session.expires_at, set()))
+            if student_id in students:
+                return False
+            if self._segment is None:
+                self._segment = self._open_segment()
+            mark = QueuedMark(student_id, session.pk, session.teacher_id, status, marked_at)
+            self._segment.append(mark)
+            students.add(student_id)
+            self._buffer.append(mark)
+            if len(self._buffer) >= self.batch_size:
+                self._wake.set()
+        return True
+
+    def flush(self):
+        """Persist everything queued so far; return the number of new rows."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            if self._segment is not None:
+                self._held.append(self._segment)
+                self._segment = None
+            segments, self._held = self._held, []
+            self._forget_expired()
+        try:
+            written = persist_or_quarantine(batch, self.directory) if batch else 0
+        except Exception:
+            # Keep the segments open (and locked) and retry the same batch later.
+            self._failures += 1
+            with self._lock:
+                if self._failures < MAX_ATTEMPTS:
+                    self._held[:0] = segments
+                    self._buffer[:0] = batch
+                    segments = []
+            if segments:
+                logger.error("Write-behind flush failed %d times; %d marks left in the journal for "
+                             "replay_attendance_journal", self._failures, len(batch))
+                for segment in segments:
+                    segment.close(delete=False)
+                self._failures = 0
+            raise
+        self._failures = 0
+        for segment in segments:
+            segment.close(delete=True)
+        return written
+
+    def _forget_expired(self):
+        now = time.time()
+        for session_id, (expires_at, _) in list(self._seen.items()):
+            if expires_at is not None and expires_at.timestamp() + SEEN_GRACE_SECONDS < now:
+                del self._seen[session_id]
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self.pending():
+                continue
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush of %d marks failed", self.pending())
+                self._stop.wait(min(self.interval * 2 ** self._failures, MAX_BACKOFF_SECONDS))
+
+    def shutdown(self):
+        """Stop the flusher and persist whatever is still queued."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            queue = WriteBehindQueue(
+                settings.ATTENDANCE_WRITE_BEHIND_DIR,
+                batch_size=settings.ATTENDANCE_WRITE_BEHIND_BATCH,
+                interval=settings.ATTENDANCE_WRITE_BEHIND_INTERVAL_MS / 1000,
+                fsync=getattr(settings, "ATTENDANCE_WRITE_BEHIND_FSYNC", True),
+            )
+            queue.start()
+            _queue = queue
+    return _queue
+
+
+def start_if_enabled():
+    """Startup hook for the WSGI/ASGI entry points: replay journals and start flushing."""
+    if enabled():
+        try:
+            get_queue()
+        except Exception:
+            # A broken journal directory must not stop the worker from booting.
+            logger.exception("Could not start the write-behind queue")
+
+
+def shutdown():
+    if _queue is not None:
+        _queue.shutdown()
@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+# Build command for the web service (Render: "Build Command: ./build.sh").
+# static/build/ is not committed, so the stylesheet and vendored scripts are
+# compiled here, then collected with their hashed and compressed copies.
+set -o errexit
+
+pip install -r requirements.txt
+npm install --no-audit --no-fund
+python manage.py build_assets --collect
+# Fails the deploy on attendance.E00x errors: unbuilt assets, or per-process
+# caches under several workers.
+python manage.py check --deploy --fail-level ERROR
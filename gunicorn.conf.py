@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for SmartAttend.
+
+SERVER_PROFILE selects how the app is served:
+
+* ``wsgi`` (default) - sync workers running ``SmartAttendance.wsgi``.
+* ``asgi`` - uvicorn workers running ``SmartAttendance.asgi`` with the async
+  scan, QR and dashboard views, so a scan burst is served by a few event
+  loops instead of one blocked worker per request.
+
+Worker count comes from gunicorn's own ``WEB_CONCURRENCY`` and the bind
+address from ``PORT``. Each worker process opens its own database
+connections (up to ``DB_POOL_MAX_SIZE`` with ``DB_POOL=psycopg``; see
+settings.py), so size the two together.
+"""
+import os
+
+profile = os.getenv("SERVER_PROFILE", "wsgi")
+
+if profile == "asgi":
+    wsgi_app = "SmartAttendance.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    os.environ.setdefault("ATTENDANCE_ASYNC_VIEWS", "True")
+else:
+    wsgi_app = "SmartAttendance.wsgi:application"
+    threads = int(os.getenv("GUNICORN_THREADS", "1"))
+
+
+def worker_exit(server, worker):
+    # Persist anything still sitting in the write-behind queue.
+    from attendance import writebehind
+    writebehind.shutdown()